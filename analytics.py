@@ -0,0 +1,137 @@
+import threading
+from datetime import date
+import numpy as np
+import pandas as pd
+from db import DB_NAME, get_connection
+from metrics import timed
+from query_cache import table_versions
+
+# Edges of the days-left buckets: expired, 0-7, 8-30, 31-90, 91-180,
+# 181-365 and more than a year.
+BUCKET_EDGES = (0, 8, 31, 91, 181, 366)
+BUCKET_LABELS = ["expired", "0-7 days", "8-30 days", "31-90 days", "91-180 days", "181-365 days", "> 1 year"]
+UNCATEGORISED = "Uncategorised"
+
+# julianday() of 1970-01-01, so julianday - EPOCH_JULIANDAY is a datetime64[D]
+# day number.
+EPOCH_JULIANDAY = 2440587.5
+
+# db_name -> (medicines version, frame). One typed frame per database,
+# rebuilt only when the table changes; treat it as read-only.
+_frames = {}
+_lock = threading.Lock()
+
+
+@timed("load_inventory", rows=len)
+def load_inventory(db_name=DB_NAME):
+    # Typed columns: int32 day numbers and quantities, bool donatable, and
+    # categorical name/category, so the analytics below are plain NumPy
+    # array arithmetic. SQLite does the date parsing.
+    conn = get_connection(db_name)
+    try:
+        versions = table_versions(conn, ("medicines",))
+        with _lock:
+            cached = _frames.get(db_name)
+            if cached is not None and cached[0] == versions:
+                return cached[1]
+        frame = pd.read_sql_query(
+            f"""
+            SELECT id, name, quantity, CAST(julianday(expiry_date) - {EPOCH_JULIANDAY} AS INTEGER) AS expiry_day,
+                   donatable, COALESCE(NULLIF(category, ''), '{UNCATEGORISED}') AS category
+            FROM medicines
+            """,
+            conn,
+            dtype={"id": "int64", "name": "category", "quantity": "int32", "expiry_day": "int32",
+                   "donatable": "bool", "category": "category"}
+        )
+    finally:
+        conn.close()
+
+    frame["expiry_date"] = frame["expiry_day"].to_numpy().astype("datetime64[D]").astype("datetime64[s]")
+    with _lock:
+        _frames[db_name] = (versions, frame)
+    return frame
+
+
+def _today_day(today=None):
+    return np.datetime64(today or date.today(), "D").astype("int64")
+
+
+def days_left(frame, today=None):
+    return frame["expiry_day"].to_numpy() - np.int32(_today_day(today))
+
+
+def bucket_codes(frame, today=None):
+    # Index into BUCKET_LABELS for every lot.
+    return np.searchsorted(BUCKET_EDGES, days_left(frame, today), side="right")
+
+
+def expiry_buckets(frame, today=None):
+    # Lots and units per days-left bucket.
+    codes = bucket_codes(frame, today)
+    size = len(BUCKET_LABELS)
+    return pd.DataFrame({
+        "bucket": BUCKET_LABELS,
+        "lots": np.bincount(codes, minlength=size),
+        "quantity": np.bincount(codes, weights=frame["quantity"].to_numpy(), minlength=size).astype("int64"),
+    })
+
+
+def expiry_histogram(frame, bin_days=7, horizon=365, today=None):
+    # Units expiring per bin_days-wide bin over the next horizon days.
+    left = days_left(frame, today)
+    keep = (left >= 0) & (left < horizon)
+    bins = -(-horizon // bin_days)
+    counts = np.bincount(left[keep] // bin_days, weights=frame["quantity"].to_numpy()[keep], minlength=bins)
+    start = np.datetime64(today or date.today(), "D")
+    return pd.DataFrame({
+        "bin_start": start + np.arange(bins) * bin_days,
+        "quantity": counts.astype("int64"),
+    })
+
+
+def waste_projection(frame, horizon=90, today=None):
+    # Per category: units that expire within the horizon and are not
+    # marked for donation are projected waste. Grouping is a bincount over
+    # the categorical codes rather than a groupby.
+    left = days_left(frame, today)
+    quantity = frame["quantity"].to_numpy().astype("int64")
+    donatable = frame["donatable"].to_numpy()
+    codes = frame["category"].cat.codes.to_numpy()
+    size = len(frame["category"].cat.categories)
+
+    def per_category(mask):
+        return np.bincount(codes[mask], weights=quantity[mask], minlength=size).astype("int64")
+
+    expiring = (left >= 0) & (left <= horizon)
+    projection = pd.DataFrame({
+        "category": frame["category"].cat.categories,
+        "total_units": per_category(np.ones(len(frame), dtype=bool)),
+        "expired_units": per_category(left < 0),
+        "expiring_units": per_category(expiring),
+        "donatable_units": per_category(expiring & donatable),
+        "projected_waste": per_category(expiring & ~donatable),
+    })
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = projection["projected_waste"].to_numpy() / projection["total_units"].to_numpy()
+    projection["waste_share"] = np.nan_to_num(share).round(4)
+    return projection.sort_values("projected_waste", ascending=False, ignore_index=True)
+
+
+def rolling_forecast(frame, window=30, horizon=180, today=None, donatable=None):
+    # For each of the next horizon days: units expiring that day, units
+    # expiring in the window days starting that day, and the running total.
+    # One bincount by day, then cumulative sums; no per-day loop.
+    left = days_left(frame, today)
+    keep = (left >= 0) & (left < horizon + window)
+    if donatable is not None:
+        keep &= frame["donatable"].to_numpy() == donatable
+    daily = np.bincount(left[keep], weights=frame["quantity"].to_numpy()[keep], minlength=horizon + window)
+    running = np.concatenate(([0], np.cumsum(daily)))
+    days = np.arange(horizon)
+    return pd.DataFrame({
+        "date": np.datetime64(today or date.today(), "D") + days,
+        "expiring": daily[:horizon].astype("int64"),
+        f"next_{window}_days": (running[days + window] - running[days]).astype("int64"),
+        "cumulative": running[1:horizon + 1].astype("int64"),
+    })
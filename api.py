@@ -0,0 +1,470 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import signal
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+from bulk_ops import RETURNED_COLUMNS, mark_donatable_many
+from db import DB_NAME, POOL_SIZE, close_pools, get_connection, init_db
+from dispense import dispense
+from events import FEED_LIMIT, changes_since
+import metrics
+from listing import LISTING_COLUMNS, PAGE_SIZE, SORT_KEYS, list_medicines
+from medicine_ops import donatable_medicines, near_expiry_medicines
+from qr_code import generate_qr_codes
+from query_cache import table_versions
+from report import DEFAULT_HORIZONS, inventory_report
+from search import SEARCH_COLUMNS, search_medicines
+
+HOST = "127.0.0.1"
+PORT = 8080
+MAX_LIMIT = 500
+MAX_BODY = 1 << 20
+# Widest near-expiry window or report horizon, in days (about a century).
+MAX_DAYS = 36500
+MAX_CACHED_RESPONSES = 256
+# How long mark-donatable and QR requests wait for others to share their
+# database call.
+BATCH_SECONDS = 0.002
+NEAR_EXPIRY_COLUMNS = ["id", "name", "quantity", "expiry_date", "donatable"]
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Api:
+    # Plain asyncio HTTP/1.1 server. The event loop only parses requests;
+    # every SQLite call runs on a thread pool no larger than the connection
+    # pool, so a burst of clients queues instead of opening connections.
+    #
+    # Read responses are encoded once and reused until the medicines table
+    # changes, and identical reads that arrive while one is running wait for
+    # it. Mark-donatable and QR requests arriving within a couple of
+    # milliseconds are folded into one database call each.
+
+    def __init__(self, db_name=DB_NAME, workers=POOL_SIZE, qr_workers=None):
+        self.db_name = db_name
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="medshare-api")
+        self.qr_workers = qr_workers
+        # Created here, on the main thread, and with forkserver rather than
+        # fork: a worker forked from this threaded server would inherit its
+        # listening socket and outlive it if the server were killed.
+        self._qr_executor = ProcessPoolExecutor(max_workers=qr_workers, mp_context=_qr_context())
+        self._inflight = {}
+        self._responses = OrderedDict()
+        self._responses_lock = threading.Lock()
+        self._pending = {}
+        self._routes = {
+            ("GET", "/medicines"): self.list,
+            ("GET", "/medicines/search"): self.search,
+            ("GET", "/medicines/near-expiry"): self.near_expiry,
+            ("GET", "/medicines/donatable"): self.donatable,
+            ("POST", "/medicines/donatable"): self.mark_donatable,
+            ("GET", "/report"): self.report,
+            ("POST", "/dispense"): self.dispense,
+            ("GET", "/changes"): self.changes,
+            ("GET", "/metrics"): self.metrics_page,
+        }
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, lambda: fn(*args, **kwargs))
+
+    async def cached_json(self, key, build):
+        # Single-flight: concurrent callers with the same key await one call.
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.run_blocking(self._versioned, key, build))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return HTTPStatus.OK, "application/json", await asyncio.shield(future)
+
+    def _versioned(self, key, build):
+        # Reuses the encoded response for this key until the medicines table
+        # changes (or the day rolls over), the same check query_cache does
+        # for the dashboards. Runs on a worker thread.
+        conn = get_connection(self.db_name)
+        try:
+            versions = (table_versions(conn, ("medicines",)), date.today())
+        finally:
+            conn.close()
+        with self._responses_lock:
+            entry = self._responses.get(key)
+            if entry is not None and entry[0] == versions:
+                self._responses.move_to_end(key)
+                return entry[1]
+        payload = _json_bytes(build())
+        with self._responses_lock:
+            self._responses[key] = (versions, payload)
+            self._responses.move_to_end(key)
+            while len(self._responses) > MAX_CACHED_RESPONSES:
+                self._responses.popitem(last=False)
+        return payload
+
+    async def batched(self, name, ids, run):
+        # Collects the IDs of every request for `name` that arrives within
+        # BATCH_SECONDS, calls run(all_ids) once on the thread pool and hands
+        # each request the whole result to pick its own rows from.
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(name, [])
+        pending.append((ids, future))
+        if len(pending) == 1:
+            loop.call_later(BATCH_SECONDS, self._flush, name, run)
+        return await future
+
+    def _flush(self, name, run):
+        batch = self._pending.pop(name, [])
+        ids = sorted({med_id for request_ids, _ in batch for med_id in request_ids})
+
+        def deliver(task):
+            for _, future in batch:
+                if future.done():
+                    continue
+                if task.exception() is not None:
+                    future.set_exception(task.exception())
+                else:
+                    future.set_result(task.result())
+
+        task = asyncio.ensure_future(self.run_blocking(run, ids))
+        task.add_done_callback(deliver)
+
+    # Handlers take (query, body) and return (status, content type, bytes)
+    # or a JSON-serialisable value.
+
+    async def list(self, query, body):
+        # `after` is the `next` value of the previous page, as JSON.
+        sort = query.get("sort", "id")
+        if sort not in SORT_KEYS:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"'sort' must be one of {', '.join(SORT_KEYS)}")
+        after = _json_param(query, "after")
+        if isinstance(after, int) and not isinstance(after, bool):
+            after = [after]
+        if after is not None and not (
+            isinstance(after, list) and len(after) == len(SORT_KEYS[sort])
+            and all(isinstance(key, (int, str)) and not isinstance(key, bool) for key in after)
+        ):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "'after' must be the 'next' value of the previous page")
+        limit = min(_int(query, "limit", PAGE_SIZE), MAX_LIMIT)
+        descending = query.get("order") == "desc"
+        filters = _filters(query)
+
+        def build():
+            rows, next_cursor = list_medicines(after, limit, sort, descending, self.db_name, **filters)
+            return {"items": _records(LISTING_COLUMNS, rows), "next": next_cursor}
+        return await self.cached_json(("list", tuple(sorted(query.items()))), build)
+
+    async def search(self, query, body):
+        text = query.get("q", "").strip()
+        if not text:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Missing query parameter 'q'")
+        limit = min(_int(query, "limit", 50), MAX_LIMIT)
+
+        def build():
+            rows, fuzzy = search_medicines(text, limit, db_name=self.db_name)
+            return {"items": _records(SEARCH_COLUMNS, rows), "fuzzy": fuzzy}
+        return await self.cached_json(("search", text, limit), build)
+
+    async def near_expiry(self, query, body):
+        days = _days(_int(query, "days", 30), "days")
+        return await self.cached_json(
+            ("near-expiry", days),
+            lambda: {"items": _records(NEAR_EXPIRY_COLUMNS, near_expiry_medicines(days, self.db_name))}
+        )
+
+    async def donatable(self, query, body):
+        return await self.cached_json(
+            ("donatable",), lambda: {"items": _records(RETURNED_COLUMNS, donatable_medicines(self.db_name))}
+        )
+
+    async def report(self, query, body):
+        horizons = tuple(_days(days, "horizons") for days in _int_list(query.get("horizons"))) or DEFAULT_HORIZONS
+        by_category = query.get("by_category", "0").lower() in ("1", "true", "yes")
+
+        def build():
+            report = inventory_report(horizons, by_category, db_name=self.db_name)
+            for entry in report:
+                entry["near_expiry"] = {str(days): count for days, count in entry["near_expiry"].items()}
+            return {"report": report}
+        return await self.cached_json(("report", horizons, by_category), build)
+
+    async def mark_donatable(self, query, body):
+        try:
+            ids = [int(med_id) for med_id in json.loads(body or b"{}").get("ids", [])]
+        except (ValueError, TypeError, AttributeError):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'Body must be JSON like {"ids": [1, 2, 3]}')
+        if not ids:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "No medicine IDs given")
+
+        # One UPDATE ... RETURNING for the whole batch. A lot named by two
+        # requests in the same batch is reported to both.
+        rows = await self.batched("mark", ids, lambda all_ids: mark_donatable_many(all_ids, self.db_name))
+        wanted = set(ids)
+        return {"marked": _records(RETURNED_COLUMNS, [row for row in rows if row[0] in wanted])}
+
+    async def dispense(self, query, body):
+        try:
+            order = json.loads(body or b"{}")
+            name, quantity = str(order["name"]), int(order["quantity"])
+        except (ValueError, TypeError, KeyError):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'Body must be JSON like {"name": "Paracetamol 500mg", "quantity": 20}')
+        picks = await self.run_blocking(dispense, name, quantity, self.db_name)
+        return {"dispensed": [{"lot": lot_id, "taken": take, "expiry_date": expiry_date}
+                              for lot_id, take, expiry_date in picks]}
+
+    async def changes(self, query, body):
+        # The event feed; consumers pass back the "next" seq they were given.
+        since = _int(query, "since", 0)
+        limit = min(max(_int(query, "limit", FEED_LIMIT), 1), FEED_LIMIT)
+        events = await self.run_blocking(changes_since, since, limit, self.db_name)
+        return {"events": events, "next": events[-1]["seq"] if events else since}
+
+    async def metrics_page(self, query, body):
+        return HTTPStatus.OK, "text/plain; version=0.0.4", metrics.render().encode("utf-8")
+
+    def route_label(self, method, target):
+        # Bounded label values: known routes, the QR pattern or "other".
+        path = urlsplit(target).path.rstrip("/") or "/"
+        if (method, path) in self._routes:
+            return path
+        parts = path.strip("/").split("/")
+        if len(parts) == 3 and parts[0] == "medicines" and parts[2] == "qr":
+            return "/medicines/{id}/qr"
+        return "other"
+
+    async def qr(self, medicine_id):
+        # Cache misses of a batch render in parallel on a process pool.
+        paths = await self.batched(
+            "qr", [medicine_id],
+            lambda ids: generate_qr_codes(ids, self.db_name, executor=self.qr_executor())
+        )
+        path = paths.get(medicine_id)
+        if path is None:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"No medicine with id {medicine_id}")
+        return HTTPStatus.OK, "image/png", await self.run_blocking(_read_file, path)
+
+    def qr_executor(self):
+        return self._qr_executor
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        path = url.path.rstrip("/") or "/"
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        parts = path.strip("/").split("/")
+        if len(parts) == 3 and parts[0] == "medicines" and parts[2] == "qr" and parts[1].isdigit():
+            if method != "GET":
+                raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            return await self.qr(int(parts[1]))
+
+        handler = self._routes.get((method, path))
+        if handler is None:
+            if any(route_path == path for _, route_path in self._routes):
+                raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed on {path}")
+            raise ApiError(HTTPStatus.NOT_FOUND, f"No route for {path}")
+        return await handler(query, body)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except ApiError as e:
+                    # The body cannot be framed, so answer and hang up.
+                    _write_response(writer, e.status, "application/json", _json_bytes({"error": str(e)}), False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                start = time.perf_counter()
+                try:
+                    result = await self.dispatch(method, target, body)
+                    if not isinstance(result, tuple):
+                        result = HTTPStatus.OK, "application/json", _json_bytes(result)
+                except ApiError as e:
+                    result = e.status, "application/json", _json_bytes({"error": str(e)})
+                except ValueError as e:
+                    result = HTTPStatus.BAD_REQUEST, "application/json", _json_bytes({"error": str(e)})
+                except Exception as e:
+                    result = HTTPStatus.INTERNAL_SERVER_ERROR, "application/json", _json_bytes({"error": repr(e)})
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, content_type, payload = result
+                metrics.observe("medshare_http_request_seconds", time.perf_counter() - start,
+                                route=self.route_label(method, target), method=method, status=status.value)
+                _write_response(writer, status, content_type, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT, ready=None):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_BODY)
+        if ready is not None:
+            ready(server)
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self._qr_executor.shutdown(wait=True)
+        close_pools()
+
+
+def _qr_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+async def _serve_until_terminated(api, host, port):
+    # SIGTERM (what service managers and the load test send) stops serve()
+    # like Ctrl-C does, so main() still gets to close the pools.
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    await api.serve(host, port)
+
+
+async def _read_request(reader):
+    # (method, target, headers, body), or None once the client hangs up.
+    try:
+        line = await reader.readline()
+    except ValueError:
+        raise ConnectionError("request line too long")
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise ConnectionError("malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0) or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "Content-Length must be a non-negative integer")
+    if length > MAX_BODY:
+        raise ConnectionError("request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+def _write_response(writer, status, content_type, payload, keep_alive):
+    writer.write(
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload
+    )
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _json_bytes(value):
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _records(columns, rows):
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _int(query, key, default=None):
+    value = query.get(key)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"'{key}' must be an integer")
+
+
+def _days(value, key):
+    # timedelta overflows long before int does, so bound day counts here.
+    if not 0 <= value <= MAX_DAYS:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"'{key}' must be between 0 and {MAX_DAYS} days")
+    return value
+
+
+def _int_list(value):
+    if not value:
+        return []
+    try:
+        return [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "'horizons' must be comma-separated integers")
+
+
+def _json_param(query, key):
+    value = query.get(key)
+    if value is None:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"'{key}' must be JSON")
+
+
+def _filters(query):
+    filters = {}
+    for key in ("name", "category", "expiring_after", "expiring_before"):
+        if query.get(key):
+            filters[key] = query[key]
+    if "donatable" in query:
+        filters["donatable"] = query["donatable"].lower() in ("1", "true", "yes")
+    return filters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MedShare HTTP API")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--workers", type=int, default=POOL_SIZE, help="threads running SQLite calls")
+    parser.add_argument("--qr-workers", type=int, help="processes rendering QR codes")
+    parser.add_argument("--slow-query-ms", type=float, help="profile SQL and keep plans of statements this slow")
+    args = parser.parse_args()
+
+    init_db(args.db)
+    if args.slow_query_ms is not None:
+        metrics.enable_profiler(args.slow_query_ms)
+    api = Api(args.db, args.workers, args.qr_workers)
+    print(f"✅ MedShare API listening on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(_serve_until_terminated(api, args.host, args.port))
+    except KeyboardInterrupt:
+        print("API stopped 👋")
+    finally:
+        api.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,26 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
-from datetime import datetime
-import qrcode
-from io import BytesIO
+from datetime import datetime, timedelta
+from analytics import days_left, expiry_buckets, expiry_histogram, load_inventory, rolling_forecast, waste_projection
+from bulk_ops import delete_many, mark_donatable_many
+from db import get_connection, init_db
+from dispense import dispense, donate_from_lot
+from exporter import ChunkReader, iter_csv_chunks
+from importer import import_uploaded
+from listing import LISTING_COLUMNS, list_medicines
+from metrics import write_textfile
+from qr_code import cached_qr
+from query_cache import cached_query, invalidate
+from search import SEARCH_COLUMNS, search_medicines
 
 # -------------------------------
 # Database Connection
 # -------------------------------
 def get_db_connection():
-    conn = sqlite3.connect("medicine_data.db")
-    conn.execute('''CREATE TABLE IF NOT EXISTS medicines (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        quantity INTEGER,
-        expiry_date TEXT,
-        category TEXT,
-        description TEXT,
-        donatable INTEGER DEFAULT 0
-    )''')
-    conn.commit()
-    return conn
+    return get_connection()
+
+
+init_db()
 
 # -------------------------------
 # Streamlit Page Configuration
@@ -36,10 +36,23 @@ menu = [
     "Mark Medicine as Donatable (QR Code)",
     "View Donatable Medicines",
     "Delete Medicine",
-    "Export Data to CSV"
+    "Dispense Medicine",
+    "Waste Forecast",
+    "Export Data to CSV",
+    "Import Medicines (CSV / JSON)"
 ]
 choice = st.sidebar.selectbox("📂 Select an Option", menu)
 
+search_query = st.sidebar.text_input("🔎 Search medicines")
+if search_query.strip():
+    results, fuzzy = search_medicines(search_query)
+    if results:
+        if fuzzy:
+            st.sidebar.caption("No exact matches. Did you mean:")
+        st.sidebar.dataframe(pd.DataFrame(results, columns=SEARCH_COLUMNS), hide_index=True)
+    else:
+        st.sidebar.info("No medicines found matching that name.")
+
 # -------------------------------
 # 1️⃣ Add New Medicine
 # -------------------------------
@@ -53,14 +66,18 @@ if choice == "Add New Medicine":
     expiry = st.date_input("Expiry Date")
 
     if st.button("Add Medicine"):
-        conn = get_db_connection()
-        conn.execute("""
-            INSERT INTO medicines (name, quantity, expiry_date, category, description)
-            VALUES (?, ?, ?, ?, ?)
-        """, (name, qty, expiry.strftime('%Y-%m-%d'), category, description))
-        conn.commit()
-        conn.close()
-        st.success(f"✅ '{name}' added successfully!")
+        if not name.strip():
+            st.error("Please enter a medicine name.")
+        else:
+            conn = get_db_connection()
+            conn.execute("""
+                INSERT INTO medicines (name, quantity, expiry_date, category, description)
+                VALUES (?, ?, ?, ?, ?)
+            """, (name.strip(), qty, expiry.strftime('%Y-%m-%d'), category, description))
+            conn.commit()
+            conn.close()
+            invalidate("medicines")
+            st.success(f"✅ '{name}' added successfully!")
 
 
 # -------------------------------
@@ -68,15 +85,49 @@ if choice == "Add New Medicine":
 # -------------------------------
 elif choice == "View All Medicines":
     st.subheader("📋 All Medicines in Database")
-    conn = get_db_connection()
-    df = pd.read_sql_query("SELECT * FROM medicines", conn)
-    conn.close()
 
-    if not df.empty:
-        st.dataframe(df)
+    col1, col2, col3 = st.columns(3)
+    name_filter = col1.text_input("Name contains")
+    category_filter = col2.selectbox("Category", ["All", "Tablet", "Syrup", "Capsule", "Injection", "Other"])
+    donatable_filter = col3.selectbox("Donatable", ["All", "Yes", "No"])
+    col4, col5, col6 = st.columns(3)
+    sort = col4.selectbox("Sort by", ["id", "expiry_date"])
+    descending = col5.checkbox("Descending")
+    page_size = col6.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+    use_expiry_range = st.checkbox("Filter by expiry date range")
+    expiry_range = st.date_input("Expiry between", value=[]) if use_expiry_range else []
+
+    filters = {
+        "name": name_filter.strip() or None,
+        "category": None if category_filter == "All" else category_filter,
+        "donatable": None if donatable_filter == "All" else donatable_filter == "Yes",
+        "expiring_after": expiry_range[0] if len(expiry_range) > 0 else None,
+        "expiring_before": expiry_range[1] + timedelta(days=1) if len(expiry_range) > 1 else None,
+    }
+
+    # Keyset cursors of the pages visited so far; reset when the query changes.
+    query_key = (tuple(filters.items()), sort, descending, page_size)
+    if st.session_state.get("listing_query") != query_key:
+        st.session_state.listing_query = query_key
+        st.session_state.listing_cursors = [None]
+    cursors = st.session_state.listing_cursors
+
+    rows, next_cursor = list_medicines(cursors[-1], page_size, sort, descending, **filters)
+
+    if rows:
+        st.dataframe(pd.DataFrame(rows, columns=LISTING_COLUMNS))
+        st.caption(f"Page {len(cursors)}")
     else:
         st.info("No medicines found.")
 
+    prev_col, next_col = st.columns(2)
+    if prev_col.button("⬅️ Previous page", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if next_col.button("Next page ➡️", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+
 
 # -------------------------------
 # 3️⃣ Check Near-Expiry Medicines
@@ -84,18 +135,17 @@ elif choice == "View All Medicines":
 elif choice == "Check Near-Expiry Medicines":
     st.subheader("⚠️ Medicines Near Expiry (Within 30 Days)")
 
-    conn = get_db_connection()
-    df = pd.read_sql_query("SELECT * FROM medicines", conn)
-    conn.close()
+    # Typed frame shared between reruns until the table changes
+    inventory = load_inventory()
 
-    if not df.empty:
-        df["expiry_date"] = pd.to_datetime(df["expiry_date"])
-        today = datetime.today()
-        df["days_left"] = (df["expiry_date"] - today).dt.days
-        near_expiry = df[df["days_left"] <= 30]
+    if not inventory.empty:
+        left = days_left(inventory)
+        soon = left <= 30
+        near_expiry = inventory.loc[soon, ["id", "name", "quantity", "expiry_date", "donatable", "category"]]
+        near_expiry = near_expiry.assign(days_left=left[soon]).sort_values("days_left")
 
         if not near_expiry.empty:
-            st.dataframe(near_expiry)
+            st.dataframe(near_expiry, hide_index=True)
         else:
             st.info("🎉 No near-expiry medicines found.")
     else:
@@ -108,44 +158,32 @@ elif choice == "Check Near-Expiry Medicines":
 elif choice == "Mark Medicine as Donatable (QR Code)":
     st.subheader("🤝 Mark Medicine as Donatable & Generate QR Code")
 
-    conn = get_db_connection()
-    df = pd.read_sql_query("SELECT * FROM medicines WHERE donatable = 0", conn)
-
-    if not df.empty:
-        selected_med = st.selectbox("Select Medicine to Donate", df["name"].tolist())
-
-        if st.button("Mark as Donatable & Generate QR Code"):
-            med_row = df[df["name"] == selected_med].iloc[0]
-            conn.execute("UPDATE medicines SET donatable = 1 WHERE name = ?", (selected_med,))
-            conn.commit()
-
-            # Generate QR Code with all details
-            qr_data = (
-                f"💊 Medicine: {med_row['name']}\n"
-                f"📦 Quantity: {med_row['quantity']}\n"
-                f"🗓 Expiry: {med_row['expiry_date']}\n"
-                f"🏷 Category: {med_row['category']}\n"
-                f"📝 Description: {med_row['description'] or 'N/A'}"
-            )
-            # Generate smaller QR Code (200x200)
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=5,  # smaller box size = smaller image
-                border=2
-            )
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            qr_img = qr.make_image(fill_color="black", back_color="white")
-
-            # Convert to BytesIO for Streamlit display
-            buf = BytesIO()
-            qr_img.save(buf, format="PNG")
-            st.image(buf.getvalue(), caption=f"QR Code for {selected_med}", width=200)
-
-            st.success(f"✅ '{selected_med}' marked as donatable and QR generated!")
-
-        conn.close()
+    name_filter = st.text_input("Filter by name")
+    rows, _ = list_medicines(limit=500, sort="expiry_date", donatable=False, name=name_filter or None)
+
+    if rows:
+        labels = {row[0]: f"#{row[0]} {row[1]} ({row[2]} units, expires {row[3]})" for row in rows}
+        selected_ids = st.multiselect("Select Medicines to Donate", list(labels), format_func=labels.get)
+
+        if st.button("Mark as Donatable & Generate QR Codes") and selected_ids:
+            marked = mark_donatable_many(selected_ids)
+            invalidate("medicines")
+
+            details = {row[0]: row for row in rows}
+            for med_id, name, quantity, expiry_date, category in marked:
+                # Generate QR Code with all details
+                qr_data = (
+                    f"💊 Medicine: {name}\n"
+                    f"📦 Quantity: {quantity}\n"
+                    f"🗓 Expiry: {expiry_date}\n"
+                    f"🏷 Category: {category}\n"
+                    f"📝 Description: {details[med_id][6] or 'N/A'}"
+                )
+                # Smaller QR Code (200x200), reused from the cache when the same label was made before
+                qr_path = cached_qr(qr_data, box_size=5, border=2)  # smaller box size = smaller image
+                st.image(qr_path, caption=f"QR Code for {name} (#{med_id})", width=200)
+
+            st.success(f"✅ {len(marked)} medicine(s) marked as donatable and QR generated!")
     else:
         st.info("No medicines available to mark as donatable.")
 
@@ -156,9 +194,7 @@ elif choice == "Mark Medicine as Donatable (QR Code)":
 elif choice == "View Donatable Medicines":
     st.subheader("🎁 Donatable Medicines")
 
-    conn = get_db_connection()
-    df = pd.read_sql_query("SELECT * FROM medicines WHERE donatable = 1", conn)
-    conn.close()
+    df = cached_query("SELECT * FROM medicines WHERE donatable = 1")
 
     if not df.empty:
         st.dataframe(df)
@@ -172,19 +208,112 @@ elif choice == "View Donatable Medicines":
 elif choice == "Delete Medicine":
     st.subheader("🗑 Delete Medicine")
 
-    conn = get_db_connection()
-    df = pd.read_sql_query("SELECT * FROM medicines", conn)
+    mode = st.radio("Delete", ["Selected lots", "All expired stock"], horizontal=True)
 
-    if not df.empty:
-        selected_med = st.selectbox("Select Medicine to Delete", df["name"].tolist())
+    if mode == "Selected lots":
+        name_filter = st.text_input("Filter by name")
+        rows, _ = list_medicines(limit=500, sort="expiry_date", name=name_filter or None)
 
-        if st.button("Delete Selected Medicine"):
-            conn.execute("DELETE FROM medicines WHERE name = ?", (selected_med,))
-            conn.commit()
-            conn.close()
-            st.success(f"❌ '{selected_med}' deleted successfully!")
+        if rows:
+            labels = {row[0]: f"#{row[0]} {row[1]} ({row[2]} units, expires {row[3]})" for row in rows}
+            selected_ids = st.multiselect("Select Medicines to Delete", list(labels), format_func=labels.get)
+
+            if st.button("Delete Selected Medicines") and selected_ids:
+                deleted = delete_many(selected_ids)
+                invalidate("medicines")
+                st.success(f"❌ {len(deleted)} medicine(s) deleted successfully!")
+        else:
+            st.info("No medicines to delete.")
     else:
-        st.info("No medicines to delete.")
+        category = st.selectbox("Category", ["All", "Tablet", "Syrup", "Capsule", "Injection", "Other"])
+
+        if st.button("Delete All Expired Stock"):
+            deleted = delete_many(
+                expiring_before=datetime.today().strftime("%Y-%m-%d"),
+                category=None if category == "All" else category
+            )
+            invalidate("medicines")
+            st.success(f"❌ {len(deleted)} expired lot(s) deleted successfully!")
+
+
+# -------------------------------
+# 💉 Dispense Medicine
+# -------------------------------
+elif choice == "Dispense Medicine":
+    st.subheader("💉 Dispense Medicine")
+
+    mode = st.radio("Action", ["Dispense", "Donate part of a lot"], horizontal=True)
+
+    if mode == "Dispense":
+        names = cached_query("SELECT name FROM medicine_names WHERE lots > 0 ORDER BY name")["name"].tolist()
+        if names:
+            name = st.selectbox("Medicine", names)
+            qty = st.number_input("Quantity to dispense", min_value=1, step=1)
+
+            if st.button("Dispense"):
+                try:
+                    picks = dispense(name, int(qty))
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    invalidate("medicines")
+                    st.success(f"✅ Dispensed {int(qty)} unit(s) of {name}, soonest expiry first.")
+                    st.dataframe(pd.DataFrame(picks, columns=["lot", "taken", "expiry_date"]), hide_index=True)
+        else:
+            st.info("No medicines in stock.")
+    else:
+        name_filter = st.text_input("Filter by name")
+        rows, _ = list_medicines(limit=500, sort="expiry_date", donatable=False, name=name_filter or None)
+
+        if rows:
+            labels = {row[0]: f"#{row[0]} {row[1]} ({row[2]} units, expires {row[3]})" for row in rows}
+            lot_id = st.selectbox("Lot", list(labels), format_func=labels.get)
+            qty = st.number_input("Units to donate", min_value=1, step=1)
+
+            if st.button("Set Aside for Donation"):
+                try:
+                    donated = donate_from_lot(lot_id, int(qty))
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    invalidate("medicines")
+                    st.success(f"✅ {donated[2]} unit(s) of {donated[1]} set aside for donation as lot #{donated[0]}.")
+        else:
+            st.info("No lots available to donate.")
+
+
+# -------------------------------
+# 📉 Waste Forecast
+# -------------------------------
+elif choice == "Waste Forecast":
+    st.subheader("📉 Waste Forecast")
+
+    inventory = load_inventory()
+
+    if not inventory.empty:
+        horizon = st.slider("Projection horizon (days)", 7, 365, 90)
+        window = st.slider("Rolling window (days)", 7, 90, 30)
+
+        projection = waste_projection(inventory, horizon)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Units expiring", f"{projection['expiring_units'].sum():,}")
+        col2.metric("Units marked for donation", f"{projection['donatable_units'].sum():,}")
+        col3.metric("Projected waste (units)", f"{projection['projected_waste'].sum():,}")
+
+        st.markdown("#### Stock by days left")
+        st.bar_chart(expiry_buckets(inventory), x="bucket", y="quantity")
+
+        st.markdown("#### Units expiring per week")
+        st.bar_chart(expiry_histogram(inventory, horizon=max(horizon, 7)), x="bin_start", y="quantity")
+
+        st.markdown(f"#### Projected waste by category (next {horizon} days)")
+        st.dataframe(projection, hide_index=True)
+
+        st.markdown(f"#### Units expiring in the next {window} days, day by day")
+        forecast = rolling_forecast(inventory, window, horizon)
+        st.line_chart(forecast, x="date", y=[f"next_{window}_days", "expiring"])
+    else:
+        st.warning("No medicines in database.")
 
 
 # -------------------------------
@@ -193,17 +322,49 @@ elif choice == "Delete Medicine":
 elif choice == "Export Data to CSV":
     st.subheader("⬇️ Export Medicine Data")
 
+    donatable_only = st.checkbox("Donatable medicines only")
+    category = st.selectbox("Category", ["All", "Tablet", "Syrup", "Capsule", "Injection", "Other"])
+    limit_expiry = st.checkbox("Only medicines expiring before a date")
+    expiring_before = st.date_input("Expiring before") if limit_expiry else None
+    compress = st.checkbox("Compress (gzip)")
+
     conn = get_db_connection()
-    df = pd.read_sql_query("SELECT * FROM medicines", conn)
+    has_data = conn.execute("SELECT 1 FROM medicines LIMIT 1").fetchone() is not None
     conn.close()
 
-    if not df.empty:
-        csv = df.to_csv(index=False).encode('utf-8')
+    if has_data:
+        chunks = iter_csv_chunks(
+            compress=compress,
+            donatable=True if donatable_only else None,
+            category=None if category == "All" else category,
+            expiring_before=expiring_before,
+        )
         st.download_button(
             label="📥 Download Medicines Data as CSV",
-            data=csv,
-            file_name="medicine_data.csv",
-            mime="text/csv"
+            data=ChunkReader(chunks),
+            file_name="medicine_data.csv.gz" if compress else "medicine_data.csv",
+            mime="application/gzip" if compress else "text/csv"
         )
     else:
         st.info("No data available to export.")
+
+
+# -------------------------------
+# 8️⃣ Import Medicines (CSV / JSON)
+# -------------------------------
+elif choice == "Import Medicines (CSV / JSON)":
+    st.subheader("⬆️ Import Medicine Stock")
+
+    uploaded = st.file_uploader("Upload a CSV or JSON-lines file", type=["csv", "jsonl", "json"])
+
+    if uploaded is not None and st.button("Import"):
+        inserted, errors = import_uploaded(uploaded, uploaded.name)
+        invalidate("medicines")
+        st.success(f"✅ Imported {inserted} medicines.")
+        if errors:
+            st.warning(f"⚠️ Skipped {len(errors)} invalid rows.")
+            st.dataframe(pd.DataFrame(errors, columns=["Line", "Problem"]))
+
+
+# Refreshes the metrics file after every rerun when MEDSHARE_METRICS_FILE is set.
+write_textfile()
@@ -0,0 +1,57 @@
+# The dashboard's waste-forecast computations over a synthetic inventory:
+# one typed load, then each vectorized analytic on the cached frame.
+#
+#   python -m benchmarks.bench_analytics --rows 1m
+import argparse
+import os
+import tempfile
+import time
+
+import analytics
+import db
+from benchmarks.synthetic import build_inventory, parse_size
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_size, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "analytics.db")
+        start = time.perf_counter()
+        build_inventory(path, args.rows)
+        print(f"Built {args.rows} lots in {time.perf_counter() - start:.1f}s\n")
+
+        start = time.perf_counter()
+        frame = analytics.load_inventory(path)
+        print(f"Typed load: {time.perf_counter() - start:.2f}s, {frame.memory_usage(deep=True).sum() / 2 ** 20:.1f} MiB")
+        print(f"Cached load: {best_of(lambda: analytics.load_inventory(path), args.repeat):.3f} ms\n")
+
+        steps = [
+            ("days-left buckets", lambda: analytics.expiry_buckets(frame)),
+            ("weekly histogram", lambda: analytics.expiry_histogram(frame)),
+            ("waste projection", lambda: analytics.waste_projection(frame)),
+            ("rolling forecast", lambda: analytics.rolling_forecast(frame)),
+        ]
+        total = 0
+        for label, fn in steps:
+            ms = best_of(fn, args.repeat)
+            total += ms
+            print(f"{label:<22}{ms:>10.2f} ms")
+        print(f"{'whole page':<22}{total:>10.2f} ms")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# The nightly analytics hand-off: CSV export and pandas.read_csv against a
+# columnar snapshot and its memory-mapped loader. Also checks that the
+# waste projection comes out the same from both.
+#
+#   python -m benchmarks.bench_columnar --rows 1m
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+import analytics
+import columnar
+import db
+from benchmarks.synthetic import build_inventory, parse_size
+from exporter import export_csv
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_size, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "columnar.db")
+        csv_path = os.path.join(tmp, "medicines.csv")
+        snapshot_path = os.path.join(tmp, "snapshot")
+        build_inventory(path, args.rows)
+        print(f"{args.rows} lots\n")
+
+        _, csv_write = timed(lambda: export_csv(csv_path, db_name=path))
+        _, snapshot_write = timed(lambda: columnar.write_snapshot(snapshot_path, path))
+
+        # read_csv into the frame analytics needs, as the nightly job does.
+        def load_csv():
+            frame = pd.read_csv(csv_path, usecols=["ID", "Name", "Quantity", "Expiry Date", "Donatable", "Category"],
+                                dtype={"Name": "category", "Quantity": "int32"}, parse_dates=["Expiry Date"])
+            frame.columns = ["id", "name", "quantity", "expiry_date", "donatable", "category"]
+            frame["expiry_day"] = (frame["expiry_date"] - pd.Timestamp("1970-01-01")).dt.days.astype("int32")
+            frame["donatable"] = frame["donatable"] == "Yes"
+            frame["category"] = frame["category"].fillna(analytics.UNCATEGORISED).astype("category")
+            return frame
+
+        csv_frame, csv_read = timed(load_csv)
+        snapshot_frame, snapshot_read = timed(lambda: columnar.read_inventory(snapshot_path))
+
+        csv_mb = os.path.getsize(csv_path) / 1e6
+        snapshot_mb = columnar.snapshot_size(snapshot_path) / 1e6
+        print(f"{'':<10}{'write':>10}{'load':>10}{'size':>11}")
+        print(f"{'CSV':<10}{csv_write:>9.2f}s{csv_read:>9.2f}s{csv_mb:>8.1f} MB")
+        print(f"{'columnar':<10}{snapshot_write:>9.2f}s{snapshot_read:>9.2f}s{snapshot_mb:>8.1f} MB")
+        print(f"\nLoad speed-up: {csv_read / snapshot_read:.0f}x")
+
+        today = pd.Timestamp("2026-01-01").date()
+        expected = analytics.waste_projection(csv_frame, today=today).sort_values("category", ignore_index=True)
+        actual = analytics.waste_projection(snapshot_frame, today=today).sort_values("category", ignore_index=True)
+        expected["category"] = expected["category"].astype(str)
+        actual["category"] = actual["category"].astype(str)
+        same = expected.equals(actual)
+        print(f"{'✅' if same else '❌'} waste projection {'matches' if same else 'differs from'} the CSV path")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
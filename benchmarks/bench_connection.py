@@ -0,0 +1,87 @@
+# Per-operation latency of a fresh sqlite3.connect() per call (the old
+# pattern) versus the pooled, pre-configured connections from db.py.
+#
+#   python -m benchmarks.bench_connection --ops 2000
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+import db
+
+
+def setup(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE medicines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            expiry_date TEXT NOT NULL,
+            donatable INTEGER DEFAULT 0
+        )
+    """)
+    today = date.today()
+    conn.executemany(
+        "INSERT INTO medicines (name, quantity, expiry_date) VALUES (?, ?, ?)",
+        ((f"Medicine{i}", i % 100, (today + timedelta(days=i % 365)).isoformat()) for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+def read_fresh(path, med_id):
+    conn = sqlite3.connect(path)
+    conn.execute("SELECT name, quantity FROM medicines WHERE id = ?", (med_id,)).fetchone()
+    conn.close()
+
+
+def read_pooled(path, med_id):
+    conn = db.get_connection(path)
+    conn.execute("SELECT name, quantity FROM medicines WHERE id = ?", (med_id,)).fetchone()
+    conn.close()
+
+
+def write_fresh(path, med_id):
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE medicines SET quantity = quantity + 1 WHERE id = ?", (med_id,))
+    conn.commit()
+    conn.close()
+
+
+def write_pooled(path, med_id):
+    with db.get_connection(path) as conn:
+        conn.execute("UPDATE medicines SET quantity = quantity + 1 WHERE id = ?", (med_id,))
+
+
+def time_op(op, path, ops, rows):
+    start = time.perf_counter()
+    for i in range(ops):
+        op(path, i % rows + 1)
+    return (time.perf_counter() - start) / ops * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fresh_path = os.path.join(tmp, "fresh.db")
+        pooled_path = os.path.join(tmp, "pooled.db")
+        setup(fresh_path, args.rows)
+        setup(pooled_path, args.rows)
+
+        print(f"{'operation':<10}{'fresh connect (us/op)':>24}{'pooled (us/op)':>18}{'speedup':>10}")
+        for label, fresh, pooled in (("read", read_fresh, read_pooled), ("write", write_fresh, write_pooled)):
+            before = time_op(fresh, fresh_path, args.ops, args.rows)
+            after = time_op(pooled, pooled_path, args.ops, args.rows)
+            print(f"{label:<10}{before:>24.1f}{after:>18.1f}{before / after:>9.1f}x")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
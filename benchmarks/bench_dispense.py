@@ -0,0 +1,63 @@
+# Counter-style dispensing against a synthetic inventory: random drugs and
+# amounts through dispense.dispense, from one thread and from several at
+# once, reported as dispenses per minute with latency percentiles.
+#
+#   python -m benchmarks.bench_dispense --rows 1m --threads 1 4
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import db
+from benchmarks.run import percentile
+from benchmarks.synthetic import build_inventory, medicine_names, parse_size
+from dispense import dispense
+
+
+def counter(db_name, names, count, seed, latencies, failures):
+    rng = random.Random(seed)
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            dispense(rng.choice(names), rng.randint(1, 30), db_name)
+        except ValueError:
+            failures.append(1)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_size, default=100000)
+    parser.add_argument("--dispenses", type=int, default=2000, help="per thread")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "dispense.db")
+        start = time.perf_counter()
+        build_inventory(path, args.rows)
+        print(f"Built {args.rows} lots in {time.perf_counter() - start:.1f}s\n")
+
+        names = medicine_names()
+        print(f"{'threads':>8}{'dispenses':>11}{'short':>7}{'per minute':>12}{'p50 ms':>9}{'p99 ms':>9}")
+        for threads in args.threads:
+            latencies, failures = [], []
+            workers = [
+                threading.Thread(target=counter, args=(path, names, args.dispenses, seed, latencies, failures))
+                for seed in range(threads)
+            ]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            print(f"{threads:>8}{len(latencies):>11}{len(failures):>7}{len(latencies) / elapsed * 60:>12,.0f}"
+                  f"{percentile(latencies, 50):>9.2f}{percentile(latencies, 99):>9.2f}")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
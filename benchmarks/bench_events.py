@@ -0,0 +1,77 @@
+# Rebuilding the inventory from the event log: a full replay of every
+# event since the database was created (the bulk load plus a history of
+# dispenses) against loading the latest snapshot and replaying only the
+# tail, plus how fast a consumer can tail the feed.
+#
+#   python -m benchmarks.bench_events --rows 100k --history 100000 --tail 5000
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import db
+import events
+from benchmarks.synthetic import build_inventory, medicine_names, parse_size
+from dispense import dispense
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run_dispenses(path, names, rng, count):
+    # Returns how many events the dispenses logged.
+    conn = db.get_connection(path)
+    before = events.latest_seq(conn)
+    for _ in range(count):
+        try:
+            dispense(rng.choice(names), rng.randint(1, 30), path)
+        except ValueError:
+            pass
+    logged = events.latest_seq(conn) - before
+    conn.close()
+    return logged
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_size, default=100000)
+    parser.add_argument("--history", type=int, default=50000, help="dispenses before the snapshot")
+    parser.add_argument("--tail", type=int, default=5000, help="dispenses after the snapshot")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "events.db")
+        _, ms = timed(build_inventory, path, args.rows)
+        print(f"Built {args.rows} lots (and {args.rows} insert events) in {ms / 1000:.1f}s\n")
+
+        rng = random.Random(7)
+        names = medicine_names()
+        history = run_dispenses(path, names, rng, args.history)
+        full, full_ms = timed(events.state_at, None, path)
+        _, snapshot_ms = timed(events.take_snapshot, path)
+        tail = run_dispenses(path, names, rng, args.tail)
+        replayed, tail_ms = timed(events.state_at, None, path)
+
+        start = time.perf_counter()
+        seen, seq = 0, 0
+        while True:
+            batch = events.changes_since(seq, events.FEED_LIMIT, path)
+            if not batch:
+                break
+            seen += len(batch)
+            seq = batch[-1]["seq"]
+        feed_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{'full replay':<28}{full_ms:>10.0f} ms  ({args.rows + history} events -> {len(full)} lots)")
+        print(f"{'take snapshot':<28}{snapshot_ms:>10.0f} ms")
+        print(f"{'snapshot + tail':<28}{tail_ms:>10.0f} ms  ({tail} tail events -> {len(replayed)} lots)")
+        print(f"{'tail whole feed':<28}{feed_ms:>10.0f} ms  ({seen / feed_ms * 1000:,.0f} events/s)")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# "What expires in the next N days" answered by SQLite (main.check_near_expiry)
+# versus the in-memory expiry_index, plus the index's load time and memory.
+#
+#   python -m benchmarks.bench_expiry_index --rows 1m
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+from benchmarks.synthetic import build_inventory, parse_size
+
+HORIZONS = (7, 30, 90)
+NEXT_N = (10, 100)
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_size, default=1000000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with tempfile.TemporaryDirectory() as tmp:
+        # main.py works on the relative db.DB_NAME, so build the inventory
+        # there and import it after moving into the temporary directory.
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            import db
+            import main as app
+            from expiry_index import ExpiryIndex
+
+            start = time.perf_counter()
+            build_inventory(db.DB_NAME, args.rows)
+            print(f"Built {args.rows} lots in {time.perf_counter() - start:.1f}s\n")
+
+            start = time.perf_counter()
+            index = ExpiryIndex()
+            load_seconds = time.perf_counter() - start
+
+            # tracemalloc slows allocation down, so memory gets its own load.
+            del index
+            tracemalloc.start()
+            index = ExpiryIndex()
+            index_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            tracemalloc.start()
+            rows = db.get_connection().execute(
+                "SELECT id, name, quantity, expiry_date, donatable FROM medicines"
+            ).fetchall()
+            rows_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del rows
+
+            print(f"Index load: {load_seconds:.2f}s, {index_bytes / 2 ** 20:.1f} MiB "
+                  f"(the same rows as Python tuples: {rows_bytes / 2 ** 20:.1f} MiB)\n")
+
+            print(f"{'query':<22}{'SQL (ms)':>10}{'index (ms)':>12}{'no check (ms)':>15}{'rows':>9}")
+            for days in HORIZONS:
+                sql_ms, sql_rows = best_of(lambda: app.check_near_expiry(days), args.repeat)
+                index_ms, index_rows = best_of(lambda: index.expiring_within(days), args.repeat)
+                raw_ms, _ = best_of(lambda: index.expiring_within(days, check=False), args.repeat)
+                assert len(sql_rows) == len(index_rows)
+                print(f"{f'within {days} days':<22}{sql_ms:>10.3f}{index_ms:>12.3f}{raw_ms:>15.3f}{len(index_rows):>9}")
+
+            today = date.today().isoformat()
+            for n in NEXT_N:
+                conn = db.get_connection()
+                sql_ms, _ = best_of(lambda: conn.execute(
+                    "SELECT id, name, quantity, expiry_date, donatable FROM medicines "
+                    "WHERE expiry_date >= ? ORDER BY expiry_date, id LIMIT ?", (today, n)).fetchall(), args.repeat)
+                conn.close()
+                index_ms, _ = best_of(lambda: index.next_to_expire(n), args.repeat)
+                raw_ms, _ = best_of(lambda: index.next_to_expire(n, check=False), args.repeat)
+                print(f"{f'next {n} to expire':<22}{sql_ms:>10.3f}{index_ms:>12.3f}{raw_ms:>15.3f}{n:>9}")
+            db.close_pools()
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
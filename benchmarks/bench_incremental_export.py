@@ -0,0 +1,69 @@
+# Hourly warehouse sync: a full CSV export against a differential export of
+# the rows changed since the last checkpoint, at a few churn levels.
+#
+#   python -m benchmarks.bench_incremental_export --rows 1m --churn 100 1000 10000
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import db
+from benchmarks.synthetic import build_inventory, parse_size
+from exporter import export_changes, export_csv
+
+
+def churn(path, count, rng):
+    # Mostly updates, some new lots and some deletions.
+    conn = db.get_connection(path)
+    try:
+        high = conn.execute("SELECT MAX(id) FROM medicines").fetchone()[0]
+        for _ in range(count):
+            roll = rng.random()
+            if roll < 0.7:
+                conn.execute("UPDATE medicines SET quantity = quantity + 1 WHERE id = ?", (rng.randint(1, high),))
+            elif roll < 0.9:
+                conn.execute(
+                    "INSERT INTO medicines (name, quantity, expiry_date, donatable) VALUES (?, ?, '2027-06-30', 0)",
+                    (f"Restock {rng.randint(1, 999)}", rng.randint(1, 100))
+                )
+            else:
+                conn.execute("DELETE FROM medicines WHERE id = ?", (rng.randint(1, high),))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_size, default=1000000)
+    parser.add_argument("--churn", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sync.db")
+        checkpoint = os.path.join(tmp, "checkpoint.json")
+        build_inventory(path, args.rows)
+        export_changes(os.path.join(tmp, "initial.csv"), checkpoint, path)
+        print(f"{args.rows} lots\n")
+        print(f"{'changes':>8}{'full export':>14}{'differential':>15}{'rows shipped':>15}{'size':>12}")
+
+        for count in args.churn:
+            churn(path, count, rng)
+            full_path = os.path.join(tmp, "full.csv")
+            delta_path = os.path.join(tmp, "delta.csv")
+            start = time.perf_counter()
+            export_csv(full_path, db_name=path)
+            full_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            result = export_changes(delta_path, checkpoint, path)
+            delta_seconds = time.perf_counter() - start
+            shipped = result["insert"] + result["update"] + result["delete"]
+            print(f"{count:>8}{full_seconds * 1000:>11.0f} ms{delta_seconds * 1000:>12.1f} ms{shipped:>15}"
+                  f"{os.path.getsize(delta_path) / 1e3:>9.0f} kB   (full {os.path.getsize(full_path) / 1e6:.1f} MB)")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# Label-sheet throughput in labels per second: a cold run that has to
+# encode every QR code, then warm runs that reuse the QR cache, as PNG
+# pages and as one PDF.
+#
+#   python -m benchmarks.bench_labels --labels 1000
+import argparse
+import os
+import tempfile
+import time
+
+import db
+import labels
+from benchmarks.synthetic import build_inventory
+
+
+def run(ids, fmt, path, tmp, workers):
+    start = time.perf_counter()
+    files, count = labels.render_sheets(ids, "bench", fmt, path, os.path.join(tmp, "labels"),
+                                        cache_dir=os.path.join(tmp, "qr_cache"), workers=workers)
+    seconds = time.perf_counter() - start
+    size = sum(os.path.getsize(f) for f in files)
+    return count, len(files), seconds, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", type=int, default=1000)
+    parser.add_argument("--workers", type=int, help="processes for the cold run (default: one per CPU)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "labels.db")
+        build_inventory(path, args.labels * 20)
+        ids = labels.donatable_ids(path)[:args.labels]
+        print(f"{len(ids)} donatable lots, {os.cpu_count()} CPU(s)\n")
+        print(f"{'run':<16}{'labels/s':>10}{'pages':>8}{'seconds':>10}{'output':>12}")
+        for label, fmt in (("cold, PNG", "png"), ("warm, PNG", "png"), ("warm, PDF", "pdf")):
+            count, pages, seconds, size = run(ids, fmt, path, tmp, args.workers)
+            print(f"{label:<16}{count / seconds:>10.0f}{pages:>8}{seconds:>10.2f}{size / 1e6:>9.1f} MB")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
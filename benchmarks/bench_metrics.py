@@ -0,0 +1,63 @@
+# What instrumentation costs: the hot read paths with the always-on timers
+# only, and again with the opt-in query profiler timing every statement.
+#
+#   python -m benchmarks.bench_metrics --rows 100k
+import argparse
+import os
+import tempfile
+import time
+
+import db
+import metrics
+from benchmarks.run import percentile
+from benchmarks.synthetic import build_inventory, parse_size
+from listing import list_medicines
+from medicine_ops import near_expiry_medicines
+from search import search_medicines
+
+
+def workload(path):
+    near_expiry_medicines(7, path)
+    list_medicines(limit=50, db_name=path)
+    search_medicines("amoxi", db_name=path)
+    conn = db.get_connection(path)
+    for med_id in range(1, 201):
+        conn.execute("SELECT name, quantity FROM medicines WHERE id = ?", (med_id,)).fetchone()
+    conn.close()
+
+
+def measure(path, repeat):
+    workload(path)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        workload(path)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_size, default=100000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metrics.db")
+        build_inventory(path, args.rows)
+
+        plain = measure(path, args.repeat)
+        metrics.enable_profiler(slow_ms=50)
+        profiled = measure(path, args.repeat)
+        metrics.disable_profiler()
+
+        print(f"{'mode':<22}{'p50 ms':>10}{'p99 ms':>10}")
+        print(f"{'timers only':<22}{percentile(plain, 50):>10.2f}{percentile(plain, 99):>10.2f}")
+        print(f"{'timers + profiler':<22}{percentile(profiled, 50):>10.2f}{percentile(profiled, 99):>10.2f}")
+        print(f"\n{len(metrics.render().splitlines())} metric lines, "
+              f"{len(metrics.slow_queries())} slow statement(s) captured")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Name search over a synthetic catalogue: the old LIKE '%query%' scan
+# versus search.search_medicines (FTS5 trigram index plus fuzzy fallback).
+#
+#   python -m benchmarks.bench_search --rows 1000000
+import argparse
+import os
+import tempfile
+import time
+
+import db
+from benchmarks.synthetic import build_inventory, medicine_names, parse_size
+from search import search_medicines
+
+QUERIES = [("substring", "profen"), ("prefix", "Amox"), ("short prefix", "Do"), ("typo", "ibuprofin"),
+           ("typo", "paracetmol"), ("miss", "zzzzzz")]
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_size, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "search.db")
+        start = time.perf_counter()
+        build_inventory(path, args.rows)
+        print(f"Built {args.rows} lots ({len(medicine_names())} distinct names) in {time.perf_counter() - start:.1f}s\n")
+
+        conn = db.get_connection(path)
+        print(f"{'query':<24}{'LIKE scan (ms)':>16}{'hits':>8}{'search (ms)':>14}{'hits':>8}  first match")
+        for label, query in QUERIES:
+            like_ms, like_rows = best_of(lambda: conn.execute(
+                "SELECT id, name, quantity, expiry_date, donatable FROM medicines WHERE name LIKE ?",
+                (f"%{query}%",)).fetchall(), args.repeat)
+            search_ms, (rows, fuzzy) = best_of(lambda: search_medicines(query, db_name=path), args.repeat)
+            first = (rows[0][1] + (" (fuzzy)" if fuzzy else "")) if rows else "-"
+            print(f"{label + ' ' + repr(query):<24}{like_ms:>16.2f}{len(like_rows):>8}{search_ms:>14.2f}{len(rows):>8}  {first}")
+        conn.close()
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
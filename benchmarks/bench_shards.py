@@ -0,0 +1,60 @@
+# Head-office queries over many branch databases: one synthetic branch is
+# built and copied, then every ShardSet query is timed with a serial and a
+# threaded fan-out.
+#
+#   python -m benchmarks.bench_shards --shards 200 --rows 10k --workers 1 8
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import db
+from benchmarks.run import percentile
+from benchmarks.synthetic import build_inventory, parse_size
+from shards import ShardSet
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", type=int, default=200)
+    parser.add_argument("--rows", type=parse_size, default=10000, help="lots per branch")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        template = os.path.join(tmp, "template.db")
+        build_inventory(template, args.rows)
+        db.close_pools()
+        branches = {}
+        for number in range(args.shards):
+            path = os.path.join(tmp, f"branch{number:04d}.db")
+            shutil.copyfile(template, path)
+            branches[f"branch{number:04d}"] = path
+        print(f"Built {args.shards} branches x {args.rows} lots in {time.perf_counter() - start:.1f}s\n")
+
+        queries = [
+            ("near-expiry 30d", lambda shards: shards.near_expiry(30)),
+            ("donatable ibuprofen", lambda shards: shards.donatable(name="ibuprofen")),
+            ("search", lambda shards: shards.search("amoxi")),
+            ("report by category", lambda shards: shards.report(by_category=True)),
+        ]
+        print(f"{'query':<22}{'workers':>8}{'p50 ms':>10}{'max ms':>10}")
+        for workers in args.workers:
+            shards = ShardSet(branches, workers)
+            for label, query in queries:
+                query(shards)
+                samples = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    query(shards)
+                    samples.append((time.perf_counter() - start) * 1000)
+                print(f"{label:<22}{workers:>8}{percentile(samples, 50):>10.1f}{max(samples):>10.1f}")
+            shards.close()
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
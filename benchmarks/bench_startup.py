@@ -0,0 +1,88 @@
+# Start-up cost of the command-line entry points, from fresh interpreters:
+# wall time of a real `cli.py` command, and `-X importtime` totals per
+# module with the slowest imports underneath. Fails (exit 1) when the CLI
+# pulls in pandas, qrcode or PIL at import or goes over --budget-ms, so it
+# can guard start-up in CI.
+#
+#   python -m benchmarks.bench_startup --runs 20 --budget-ms 150
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.run import percentile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["cli", "main", "medicine_ops", "api"]
+HEAVY = ("pandas", "qrcode", "PIL")
+
+
+def import_times(module):
+    # {imported module: cumulative microseconds} for one `import module`.
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def wall_ms(argv, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + argv, cwd=REPO, stdout=subprocess.DEVNULL, check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def command_ms(args, db_name, runs):
+    return wall_ms([os.path.join(REPO, "cli.py"), "--db", db_name] + args, runs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=150, help="p50 limit for `cli.py near-expiry`")
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"bare interpreter: p50 {percentile(wall_ms(['-c', 'pass'], args.runs), 50):.0f} ms\n")
+
+    print(f"{'module':<14}{'import ms':>10}  slowest imports")
+    for module in MODULES:
+        times = import_times(module)
+        slowest = sorted((name for name in times if name != module), key=times.get, reverse=True)
+        print(f"{module:<14}{times[module] / 1000:>10.1f}  "
+              + ", ".join(f"{name} {times[name] / 1000:.0f}" for name in slowest[:args.top]))
+        heavy = [name for name in HEAVY if name in times]
+        if module == "cli" and heavy:
+            print(f"❌ cli imports {', '.join(heavy)} at start-up")
+            failed = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "startup.db")
+        command_ms(["add", "Paracetamol 500mg", "10", "2030-01-01"], db_name, 1)
+        print()
+        for command in (["near-expiry"], ["list", "--limit", "20"], ["report"]):
+            samples = command_ms(command, db_name, args.runs)
+            p50 = percentile(samples, 50)
+            print(f"cli.py {' '.join(command):<22}p50 {p50:>6.0f} ms   p99 {percentile(samples, 99):>6.0f} ms")
+            if command == ["near-expiry"] and p50 > args.budget_ms:
+                print(f"❌ over the {args.budget_ms:g} ms budget")
+                failed = True
+
+    print("\n❌ Start-up guard failed" if failed else "\n✅ Start-up within budget")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# Load test for api.py: keep-alive clients hammer a mix of read endpoints
+# (plus a trickle of mark-donatable writes) and report requests per second
+# and latency percentiles per endpoint.
+#
+#   python -m benchmarks.load_test --rows 100k --clients 64 --seconds 10
+#   python -m benchmarks.load_test --url http://127.0.0.1:8080 --clients 32
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.run import percentile
+from benchmarks.synthetic import SIZES, STEMS, build_inventory, parse_size
+
+
+def request_mix(rows, writes):
+    # (label, method, path, body, weight); paths and bodies may be built per
+    # request from the client's random generator.
+    mix = [
+        ("list", "GET", "/medicines?limit=50", None, 30),
+        ("list donatable", "GET", "/medicines?donatable=1&sort=expiry_date&limit=50", None, 15),
+        ("search", "GET", lambda rng: f"/medicines/search?q={rng.choice(STEMS)[:5]}", None, 25),
+        ("near-expiry", "GET", "/medicines/near-expiry?days=7", None, 15),
+        ("report", "GET", "/report?by_category=1", None, 10),
+        ("qr", "GET", lambda rng: f"/medicines/{rng.randint(1, rows)}/qr", None, 5),
+    ]
+    if writes:
+        mix.append(("mark-donatable", "POST", "/medicines/donatable",
+                    lambda rng: json.dumps({"ids": [rng.randint(1, rows) for _ in range(3)]}), writes))
+    return mix
+
+
+async def client(host, port, mix, deadline, seed, results):
+    rng = random.Random(seed)
+    weights = [entry[4] for entry in mix]
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            label, method, path, body, _ = rng.choices(mix, weights)[0]
+            path = path(rng) if callable(path) else path
+            payload = (body(rng) if callable(body) else body or "").encode("utf-8")
+            start = time.perf_counter()
+            writer.write(
+                f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(payload)}\r\n\r\n".encode("latin-1")
+                + payload
+            )
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            results.setdefault(label, []).append(((time.perf_counter() - start) * 1000, status))
+    finally:
+        writer.close()
+
+
+async def run_clients(host, port, mix, clients, seconds):
+    results = {}
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, mix, deadline, seed, results) for seed in range(clients)))
+    return results, time.perf_counter() - start
+
+
+def report(results, elapsed):
+    print(f"{'endpoint':<18}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    everything = []
+    for label, samples in sorted(results.items()):
+        latencies = [ms for ms, _ in samples]
+        errors = sum(1 for _, status in samples if status >= 400)
+        everything.extend(latencies)
+        print(f"{label:<18}{len(samples):>10}{errors:>8}{percentile(latencies, 50):>10.2f}"
+              f"{percentile(latencies, 95):>10.2f}{percentile(latencies, 99):>10.2f}")
+    print(f"{'all':<18}{len(everything):>10}{'':>8}{percentile(everything, 50):>10.2f}"
+          f"{percentile(everything, 95):>10.2f}{percentile(everything, 99):>10.2f}")
+    print(f"\n✅ {len(everything) / elapsed:,.0f} requests/s over {elapsed:.1f}s")
+
+
+def start_local_server(db_name, workers):
+    # Runs api.py in its own process, so the clients here do not share a GIL
+    # with it, and in its own session so stop_local_server() can take down
+    # anything it started. Returns (port, process).
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(repo, "api.py"), "--db", db_name, "--port", str(port), "--workers", str(workers)],
+        stdout=subprocess.DEVNULL, start_new_session=True
+    )
+    deadline = time.perf_counter() + 30
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return port, process
+        except OSError:
+            if process.poll() is not None or time.perf_counter() > deadline:
+                stop_local_server(process)
+                raise RuntimeError("API server did not start")
+            time.sleep(0.05)
+
+
+def stop_local_server(process, timeout=10):
+    # SIGTERM lets the server shut its pools down; whatever is left in its
+    # process group after that is killed.
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the MedShare HTTP API")
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    parser.add_argument("--rows", type=parse_size, default=SIZES["100k"], help="inventory size for the local server")
+    parser.add_argument("--id-range", type=int, help="highest medicine id to request (defaults to --rows)")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--workers", type=int, help="API worker threads for the local server")
+    parser.add_argument("--writes", type=int, default=1, help="weight of mark-donatable requests (0 disables)")
+    args = parser.parse_args()
+
+    mix = request_mix(args.id_range or args.rows, args.writes)
+    if args.url:
+        url = urlsplit(args.url)
+        results, elapsed = asyncio.run(run_clients(url.hostname, url.port or 80, mix, args.clients, args.seconds))
+        report(results, elapsed)
+        return
+
+    from db import POOL_SIZE
+    with tempfile.TemporaryDirectory() as tmp:
+        # The server caches QR images relative to its working directory.
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            path = os.path.join(tmp, "load.db")
+            start = time.perf_counter()
+            build_inventory(path, args.rows)
+            print(f"Built {args.rows} lots in {time.perf_counter() - start:.1f}s; "
+                  f"{args.clients} clients for {args.seconds:g}s\n")
+            port, server = start_local_server(path, args.workers or POOL_SIZE)
+            try:
+                results, elapsed = asyncio.run(run_clients("127.0.0.1", port, mix, args.clients, args.seconds))
+            finally:
+                stop_local_server(server)
+            report(results, elapsed)
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# Times every public operation in medicine_ops.py and main.py, plus the
+# queries behind the dashboards, against a seeded synthetic inventory.
+# Reports p50/p99 latency and peak Python memory per operation and writes
+# the results as JSON so runs can be compared for regressions.
+#
+#   python -m benchmarks.run --rows 10k --output bench_results.json
+#   python -m benchmarks.run --rows 1m --only check_near_expiry generate_report
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from benchmarks.synthetic import SIZES, build_inventory, parse_size
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+@contextlib.contextmanager
+def scripted_input(answers):
+    # The interactive medicine_ops functions read from input(); feed them
+    # canned answers instead.
+    answers = list(answers)
+    original = builtins.input
+    builtins.input = lambda prompt="": answers.pop(0) if answers else "q"
+    try:
+        yield
+    finally:
+        builtins.input = original
+
+
+def operations(rows):
+    # (name, module, function, positional args, kwargs, scripted input, heavy)
+    # Heavy operations touch the whole table and run fewer times.
+    soon = (date.today() + timedelta(days=400)).isoformat()
+    mid_id = max(1, rows // 2)
+    return [
+        ("medicine_ops.add_medicine", "medicine_ops", "add_medicine", (), {}, ["Benchmarkol 500mg", "10", soon], False),
+        ("medicine_ops.view_all_medicines", "medicine_ops", "view_all_medicines", (), {}, ["q"], False),
+        ("medicine_ops.check_near_expiry", "medicine_ops", "check_near_expiry", (), {}, [], True),
+        ("medicine_ops.mark_donatable", "medicine_ops", "mark_donatable", (), {}, ["q", str(mid_id)], False),
+        ("medicine_ops.view_donatable_medicines", "medicine_ops", "view_donatable_medicines", (), {}, [], True),
+        ("medicine_ops.search_medicine", "medicine_ops", "search_medicine", (), {}, ["ibuprofin"], False),
+        ("medicine_ops.generate_report", "medicine_ops", "generate_report", (), {}, [], True),
+        ("medicine_ops.export_to_csv", "medicine_ops", "export_to_csv", ("bench_export.csv",), {}, [], True),
+        ("main.add_medicine", "main", "add_medicine", ("Benchmarkol 250mg", 5, soon), {}, [], False),
+        ("main.fetch_all_medicines", "main", "fetch_all_medicines", (), {}, [], True),
+        ("main.fetch_medicine_page", "main", "fetch_medicine_page", (), {}, [], False),
+        ("main.check_near_expiry", "main", "check_near_expiry", (), {}, [], True),
+        ("main.mark_as_donatable", "main", "mark_as_donatable", (mid_id,), {}, [], False),
+        ("main.fetch_donatable_medicines", "main", "fetch_donatable_medicines", (), {}, [], True),
+        ("main.export_to_csv", "main", "export_to_csv", ("bench_export_main.csv",), {}, [], True),
+        ("dashboard.cached_query", "query_cache", "cached_query", ("SELECT * FROM medicines",), {}, [], True),
+        ("dashboard.list_medicines", "listing", "list_medicines", (), {"sort": "expiry_date"}, [], False),
+        ("dashboard.inventory_report", "report", "inventory_report", (), {"by_category": True}, [], True),
+        ("dashboard.search_medicines", "search", "search_medicines", ("Amox",), {}, [], False),
+    ]
+
+
+def run_operation(fn, args, kwargs, answers, repeat):
+    samples = []
+    sink = io.StringIO()
+    for _ in range(repeat):
+        with scripted_input(answers), contextlib.redirect_stdout(sink):
+            start = time.perf_counter()
+            fn(*args, **kwargs)
+            samples.append((time.perf_counter() - start) * 1000)
+        sink.seek(0)
+        sink.truncate()
+
+    tracemalloc.start()
+    with scripted_input(answers), contextlib.redirect_stdout(sink):
+        fn(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "runs": len(samples),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "mean_ms": round(sum(samples) / len(samples), 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MedShare operations")
+    parser.add_argument("--rows", type=parse_size, default=SIZES["10k"], help="row count or 10k / 100k / 1m / 10m")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--heavy-repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", help="run operations whose name contains any of these")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, repo)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Every module uses the relative db.DB_NAME, so work inside the
+        # temporary directory and import the modules after moving there.
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            import db
+            start = time.perf_counter()
+            build_inventory(db.DB_NAME, args.rows, args.seed)
+            build_seconds = time.perf_counter() - start
+            print(f"Built {args.rows} rows in {build_seconds:.1f}s (seed {args.seed})\n")
+
+            results = []
+            print(f"{'operation':<42}{'p50 ms':>10}{'p99 ms':>10}{'peak KiB':>12}")
+            for name, module, function, op_args, op_kwargs, answers, heavy in operations(args.rows):
+                if args.only and not any(part in name for part in args.only):
+                    continue
+                try:
+                    fn = getattr(__import__(module), function)
+                except ImportError as e:
+                    results.append({"operation": name, "skipped": str(e)})
+                    print(f"{name:<42}{'skipped: ' + str(e):>32}")
+                    continue
+                stats = run_operation(fn, op_args, op_kwargs, answers, args.heavy_repeat if heavy else args.repeat)
+                results.append({"operation": name, **stats})
+                print(f"{name:<42}{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['peak_kib']:>12.1f}")
+            db.close_pools()
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "rows": args.rows,
+        "seed": args.seed,
+        "build_seconds": round(build_seconds, 2),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
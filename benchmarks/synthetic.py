@@ -0,0 +1,102 @@
+# Seeded synthetic inventory for benchmarks. The same seed and size always
+# produce the same rows.
+#
+#   python -m benchmarks.synthetic inventory.db --rows 1000000
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+import db
+
+STEMS = [
+    "Paracetamol", "Ibuprofen", "Amoxicillin", "Azithromycin", "Cetirizine", "Metformin", "Atorvastatin",
+    "Omeprazole", "Pantoprazole", "Amlodipine", "Losartan", "Montelukast", "Salbutamol", "Lactulose",
+    "Calcirol", "Dolo", "Crocin", "Morphine", "Diclofenac", "Ciprofloxacin", "Levocetirizine", "Vitamin D3",
+    "Vitamin B12", "Folic Acid", "Ranitidine", "Ondansetron", "Domperidone", "Insulin Glargine",
+]
+STRENGTHS = ["50mg", "100mg", "250mg", "500mg", "650mg", "1g", "5ml", "10ml"]
+VARIANTS = ["", "Forte", "Plus", "SR", "DS", "Kid", "XR"]
+
+# Same choices as the dashboard's category picker, weighted roughly like a
+# pharmacy shelf.
+CATEGORIES = ["Tablet", "Syrup", "Capsule", "Injection", "Other"]
+CATEGORY_WEIGHTS = [50, 15, 20, 10, 5]
+
+SIZES = {"10k": 10000, "100k": 100000, "1m": 1000000, "10m": 10000000}
+BATCH_SIZE = 50000
+
+
+def medicine_names():
+    return [" ".join(filter(None, (stem, strength, variant)))
+            for stem in STEMS for strength in STRENGTHS for variant in VARIANTS]
+
+
+def expiry_offset(rng):
+    # Days from today: a few lots already expired, a band close to expiry,
+    # and the bulk spread over the usual 6-36 month shelf life.
+    roll = rng.random()
+    if roll < 0.05:
+        return -rng.randint(1, 180)
+    if roll < 0.15:
+        return rng.randint(0, 30)
+    if roll < 0.25:
+        return rng.randint(31, 90)
+    return rng.randint(180, 1080)
+
+
+def generate_rows(rows, seed=42, today=None):
+    # Yields (name, quantity, expiry_date, donatable, category, description).
+    rng = random.Random(seed)
+    names = medicine_names()
+    today = today or date.today()
+    for _ in range(rows):
+        offset = expiry_offset(rng)
+        quantity = max(1, int(rng.lognormvariate(3, 1)))
+        donatable = 1 if 0 <= offset <= 90 and rng.random() < 0.3 else 0
+        yield (
+            rng.choice(names),
+            quantity,
+            (today + timedelta(days=offset)).isoformat(),
+            donatable,
+            rng.choices(CATEGORIES, CATEGORY_WEIGHTS)[0],
+            None,
+        )
+
+
+def build_inventory(db_name, rows, seed=42):
+    db.init_db(db_name)
+    conn = db.get_connection(db_name)
+    batch = []
+    for row in generate_rows(rows, seed):
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            conn.executemany(
+                "INSERT INTO medicines (name, quantity, expiry_date, donatable, category, description) "
+                "VALUES (?, ?, ?, ?, ?, ?)", batch
+            )
+            batch = []
+    if batch:
+        conn.executemany(
+            "INSERT INTO medicines (name, quantity, expiry_date, donatable, category, description) "
+            "VALUES (?, ?, ?, ?, ?, ?)", batch
+        )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def parse_size(value):
+    return SIZES.get(value.lower()) or int(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic MedShare inventory")
+    parser.add_argument("db_name")
+    parser.add_argument("--rows", type=parse_size, default=SIZES["10k"], help="row count or 10k / 100k / 1m / 10m")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    build_inventory(args.db_name, args.rows, args.seed)
+    print(f"✅ {args.rows} medicines written to {args.db_name} in {time.perf_counter() - start:.1f}s")
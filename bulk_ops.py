@@ -0,0 +1,78 @@
+import json
+from db import DB_NAME, build_filters, get_connection
+from expiry_index import track
+
+RETURNED_COLUMNS = ["id", "name", "quantity", "expiry_date", "category"]
+# Widest ID range parse_ids() will expand; larger sweeps should use filters.
+MAX_RANGE = 10000
+
+
+def _target(ids, filters):
+    # WHERE clause for an ID list and/or the usual listing filters. The ID
+    # list is bound as one JSON array, so any number of IDs is a single
+    # statement. Refuses to match the whole table by accident.
+    where, params = build_filters(**filters)
+    if ids is not None:
+        clause = "id IN (SELECT value FROM json_each(?))"
+        where = f"{where} AND {clause}" if where else f" WHERE {clause}"
+        params.append(json.dumps([int(med_id) for med_id in ids]))
+    if not where:
+        raise ValueError("Give a list of IDs or at least one filter")
+    return where, params
+
+
+def mark_donatable_many(ids=None, db_name=DB_NAME, **filters):
+    # Returns the rows that changed; lots that were already donatable are
+    # left alone.
+    where, params = _target(ids, filters)
+    conn = get_connection(db_name)
+    try:
+        rows = conn.execute(
+            f"UPDATE medicines SET donatable = 1{where} AND donatable = 0 RETURNING {', '.join(RETURNED_COLUMNS)}",
+            params
+        ).fetchall()
+        track(conn, db_name, marked=rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return rows
+
+
+def delete_many(ids=None, db_name=DB_NAME, **filters):
+    where, params = _target(ids, filters)
+    conn = get_connection(db_name)
+    try:
+        rows = conn.execute(
+            f"DELETE FROM medicines{where} RETURNING {', '.join(RETURNED_COLUMNS)}", params
+        ).fetchall()
+        track(conn, db_name, deleted=rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return rows
+
+
+def parse_ids(text):
+    # "3, 7 12-15" -> [3, 7, 12, 13, 14, 15]. Raises ValueError on anything
+    # else, including reversed ranges and ranges over MAX_RANGE IDs.
+    ids = []
+    for part in text.replace(",", " ").split():
+        try:
+            if "-" in part:
+                first, last = (int(bound) for bound in part.split("-", 1))
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise ValueError(f"Not an ID or ID range: {part!r}")
+        if first > last:
+            raise ValueError(f"Range {part} runs backwards; write it as {last}-{first}")
+        if last - first >= MAX_RANGE:
+            raise ValueError(f"Range {part} covers more than {MAX_RANGE} IDs")
+        ids.extend(range(first, last + 1))
+    return ids
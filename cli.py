@@ -0,0 +1,180 @@
+import argparse
+import json
+import sys
+from bulk_ops import RETURNED_COLUMNS
+from db import DB_NAME, clean_medicine, get_connection, init_db
+from expiry_index import track
+from exporter import CHECKPOINT_FILE, export_changes, export_csv
+from listing import LISTING_COLUMNS, PAGE_SIZE, SORT_KEYS, list_medicines
+from medicine_ops import donatable_medicines, near_expiry_medicines
+from metrics import write_textfile
+from report import DEFAULT_HORIZONS, inventory_report, print_report
+
+# Non-interactive entry point for cron jobs and scanner hooks. Only light
+# modules are imported here; pandas, qrcode and PIL load inside the few
+# functions that need them, so a command costs tens of milliseconds of
+# start-up rather than half a second. Exits with status 1 on bad input.
+#
+#   python cli.py add "Amoxicillin 250mg" 40 2026-03-31 --category Antibiotic
+#   python cli.py list --donatable --json
+#   python cli.py near-expiry --days 14
+#   python cli.py report --by-category
+#   python cli.py export backup.csv.gz
+#   python cli.py export nightly_snapshot --format columnar
+#   python cli.py export changes.csv --changes
+
+
+def print_rows(columns, rows, as_json):
+    if as_json:
+        for row in rows:
+            print(json.dumps(dict(zip(columns, row))))
+        return
+    for row in rows:
+        print(" | ".join("" if value is None else str(value) for value in row))
+
+
+def add(args):
+    row = clean_medicine(args.name, args.quantity, args.expiry_date, category=args.category,
+                         description=args.description)
+    conn = get_connection(args.db)
+    try:
+        med_id = conn.execute(
+            "INSERT INTO medicines (name, quantity, expiry_date, donatable, category, description) "
+            "VALUES (?, ?, ?, ?, ?, ?)", row
+        ).lastrowid
+        track(conn, args.db, added=[(med_id, row[0], row[1], row[2], row[3])])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    print(f"✅ {row[0]} added with id {med_id}")
+
+
+def list_command(args):
+    filters = {
+        "name": args.name, "category": args.category, "expiring_before": args.expiring_before,
+        "donatable": True if args.donatable else None,
+    }
+    rows, next_cursor = list_medicines(None, args.limit, args.sort, args.desc, args.db, **filters)
+    print_rows(LISTING_COLUMNS, rows, args.json)
+    while args.all and next_cursor is not None:
+        rows, next_cursor = list_medicines(next_cursor, args.limit, args.sort, args.desc, args.db, **filters)
+        print_rows(LISTING_COLUMNS, rows, args.json)
+
+
+def near_expiry(args):
+    rows = near_expiry_medicines(args.days, args.db)
+    if not rows and not args.json:
+        print(f"ℹ️ No medicines expire within {args.days} days.")
+    print_rows(["id", "name", "quantity", "expiry_date", "donatable"], rows, args.json)
+
+
+def donatable(args):
+    print_rows(RETURNED_COLUMNS, donatable_medicines(args.db), args.json)
+
+
+def report(args):
+    result = inventory_report(args.horizons, args.by_category, db_name=args.db)
+    if args.json:
+        for entry in result:
+            entry["near_expiry"] = {str(days): count for days, count in entry["near_expiry"].items()}
+        print(json.dumps(result))
+    else:
+        print_report(result)
+
+
+def export(args):
+    filters = {
+        "donatable": True if args.donatable_only else None,
+        "expiring_before": args.expiring_before, "category": args.category,
+    }
+    if args.changes:
+        if args.format != "csv" or any(filters.values()):
+            raise ValueError("--changes exports every changed row as CSV; drop --format and the filters")
+        result = export_changes(args.filename, args.checkpoint, args.db, compress=args.gzip, full=args.full)
+        print(f"✅ {result['insert']} inserted, {result['update']} updated, {result['delete']} deleted "
+              f"exported to {args.filename}{' (full export)' if result['full'] else ''}")
+        return
+    if args.format == "csv":
+        count = export_csv(args.filename, db_name=args.db, compress=args.gzip, **filters)
+    else:
+        # NumPy (and pyarrow for Parquet) only load for these formats.
+        from columnar import write_parquet, write_snapshot
+        write = write_snapshot if args.format == "columnar" else write_parquet
+        count = write(args.filename, args.db, **filters)
+    print(f"✅ {count} medicines exported to {args.filename}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="medshare", description="MedShare command line")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--metrics-file", help="write Prometheus metrics here on exit (or set MEDSHARE_METRICS_FILE)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = commands.add_parser("add", help="add a lot")
+    add_parser.add_argument("name")
+    add_parser.add_argument("quantity")
+    add_parser.add_argument("expiry_date", help="YYYY-MM-DD")
+    add_parser.add_argument("--category")
+    add_parser.add_argument("--description")
+    add_parser.set_defaults(run=add)
+
+    list_parser = commands.add_parser("list", help="list lots, one per line")
+    list_parser.add_argument("--limit", type=int, default=PAGE_SIZE)
+    list_parser.add_argument("--all", action="store_true", help="keep paging to the end")
+    list_parser.add_argument("--sort", choices=sorted(SORT_KEYS), default="id")
+    list_parser.add_argument("--desc", action="store_true")
+    list_parser.add_argument("--name")
+    list_parser.add_argument("--category")
+    list_parser.add_argument("--donatable", action="store_true")
+    list_parser.add_argument("--expiring-before", help="YYYY-MM-DD")
+    list_parser.add_argument("--json", action="store_true", help="one JSON object per line")
+    list_parser.set_defaults(run=list_command)
+
+    near_parser = commands.add_parser("near-expiry", help="lots expiring within a window")
+    near_parser.add_argument("--days", type=int, default=30)
+    near_parser.add_argument("--json", action="store_true")
+    near_parser.set_defaults(run=near_expiry)
+
+    donatable_parser = commands.add_parser("donatable", help="lots marked for donation")
+    donatable_parser.add_argument("--json", action="store_true")
+    donatable_parser.set_defaults(run=donatable)
+
+    report_parser = commands.add_parser("report", help="inventory report")
+    report_parser.add_argument("--horizons", type=int, nargs="+", default=list(DEFAULT_HORIZONS))
+    report_parser.add_argument("--by-category", action="store_true")
+    report_parser.add_argument("--json", action="store_true")
+    report_parser.set_defaults(run=report)
+
+    export_parser = commands.add_parser("export", help="stream lots to CSV or a columnar snapshot")
+    export_parser.add_argument("filename", nargs="?", default="medicines_backup.csv")
+    export_parser.add_argument("--format", choices=["csv", "columnar", "parquet"], default="csv",
+                               help="columnar writes a memory-mappable directory; parquet needs pyarrow")
+    export_parser.add_argument("--gzip", action="store_true", default=None)
+    export_parser.add_argument("--donatable-only", action="store_true")
+    export_parser.add_argument("--expiring-before", help="YYYY-MM-DD")
+    export_parser.add_argument("--category")
+    export_parser.add_argument("--changes", action="store_true", help="only rows changed since the checkpoint")
+    export_parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    export_parser.add_argument("--full", action="store_true", help="with --changes: start over with every row")
+    export_parser.set_defaults(run=export)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    init_db(args.db)
+    try:
+        args.run(args)
+    except (ValueError, ImportError) as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        write_textfile(args.metrics_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
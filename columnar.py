@@ -0,0 +1,260 @@
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime
+from itertools import repeat
+import numpy as np
+from analytics import EPOCH_JULIANDAY, UNCATEGORISED
+from db import DB_NAME, SCHEMA_VERSION, build_filters, get_connection
+
+# Columnar snapshot of the medicines table for analytics: one raw
+# little-endian file per column, written a row group at a time, plus a
+# manifest. Names, categories and descriptions are dictionary-encoded
+# (code -1 is NULL) and expiry dates are int32 day numbers since
+# 1970-01-01, the same as analytics.load_inventory(). Rows are in expiry
+# order, so a date range is a binary search over expiry_day.
+FORMAT = "medshare-columnar"
+FORMAT_VERSION = 1
+ROW_GROUP = 65536
+MANIFEST = "manifest.json"
+
+# (column, dtype, dictionary-encoded)
+COLUMNS = [
+    ("id", "<i8", False),
+    ("name", "<i4", True),
+    ("quantity", "<i4", False),
+    ("expiry_day", "<i4", False),
+    ("donatable", "|b1", False),
+    ("category", "<i4", True),
+    ("description", "<i4", True),
+]
+
+
+def _encode(values, dictionary):
+    # Codes in first-seen order; the dict grows across row groups. New
+    # values are added once per distinct value, then every row is a lookup.
+    for value in dict.fromkeys(values):
+        if value is not None and value not in dictionary:
+            dictionary[value] = len(dictionary)
+    return np.fromiter(map(dictionary.get, values, repeat(-1)), dtype="<i4", count=len(values))
+
+
+def _select(where):
+    # Read in expiry order straight off idx_medicines_expiry.
+    return f"""
+        SELECT id, name, quantity, CAST(julianday(expiry_date) - {EPOCH_JULIANDAY} AS INTEGER),
+               donatable, NULLIF(category, ''), NULLIF(description, '')
+        FROM medicines{where} ORDER BY expiry_date, id
+    """
+
+
+def _replace_dir(tmp_path, path):
+    # Only a finished snapshot is ever at `path`. Readers that mapped the
+    # old one keep their pages until they let go of the arrays.
+    old_path = None
+    if os.path.exists(path):
+        old_path = f"{path}.old-{os.getpid()}"
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    if old_path:
+        shutil.rmtree(old_path)
+
+
+def write_snapshot(path, db_name=DB_NAME, row_group=ROW_GROUP, **filters):
+    # Streams the (optionally filtered) table into `path`, holding one row
+    # group of rows in memory plus the dictionaries. Returns the row count.
+    where, params = build_filters(**filters)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    dictionaries = {column: {} for column, _, encoded in COLUMNS if encoded}
+    files = {column: open(os.path.join(tmp_path, f"{column}.bin"), "wb") for column, _, _ in COLUMNS}
+    groups, total = [], 0
+    conn = get_connection(db_name)
+    try:
+        cursor = conn.execute(_select(where), params)
+        while True:
+            rows = cursor.fetchmany(row_group)
+            if not rows:
+                break
+            values = list(zip(*rows))
+            for (column, dtype, encoded), column_values in zip(COLUMNS, values):
+                if encoded:
+                    array = _encode(column_values, dictionaries[column])
+                else:
+                    array = np.array(column_values, dtype=dtype)
+                files[column].write(array.tobytes())
+            groups.append({"rows": len(rows), "expiry_day_min": values[3][0], "expiry_day_max": values[3][-1]})
+            total += len(rows)
+    finally:
+        conn.close()
+        for f in files.values():
+            f.close()
+
+    for column, dictionary in dictionaries.items():
+        with open(os.path.join(tmp_path, f"{column}.dict.json"), "w", encoding="utf-8") as f:
+            json.dump(list(dictionary), f, ensure_ascii=False)
+    manifest = {
+        "format": FORMAT, "version": FORMAT_VERSION, "schema_version": SCHEMA_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"), "rows": total,
+        "sorted_by": "expiry_day", "filters": {key: value for key, value in filters.items() if value is not None},
+        "columns": [{"name": column, "dtype": dtype, "dictionary": encoded} for column, dtype, encoded in COLUMNS],
+        "row_groups": groups,
+    }
+    with open(os.path.join(tmp_path, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    _replace_dir(tmp_path, path)
+    return total
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"{path} is not a columnar snapshot (no {MANIFEST})")
+    if manifest.get("format") != FORMAT or manifest.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {FORMAT_VERSION} {FORMAT} snapshot")
+    return manifest
+
+
+def open_snapshot(path):
+    # {column: read-only np.memmap} plus {column: dictionary list}. Nothing
+    # is read until the arrays are touched, and the pages are shared with
+    # the OS cache and every other process mapping the same snapshot.
+    manifest = read_manifest(path)
+    columns, dictionaries = {}, {}
+    for column in manifest["columns"]:
+        name = column["name"]
+        file_path = os.path.join(path, f"{name}.bin")
+        if manifest["rows"]:
+            columns[name] = np.memmap(file_path, dtype=column["dtype"], mode="r", shape=(manifest["rows"],))
+        else:
+            columns[name] = np.empty(0, dtype=column["dtype"])
+        if column["dictionary"]:
+            with open(os.path.join(path, f"{name}.dict.json"), encoding="utf-8") as f:
+                dictionaries[name] = json.load(f)
+    return columns, dictionaries
+
+
+def read_inventory(path):
+    # The snapshot as the frame analytics.load_inventory() builds, so the
+    # analytics functions run on it unchanged. id, quantity, expiry_day and
+    # donatable are views of the mapped files, not copies.
+    import pandas as pd
+
+    columns, dictionaries = open_snapshot(path)
+    categories = dictionaries["category"]
+    category_codes = columns["category"]
+    if (category_codes < 0).any():
+        # NULL categories become their own "Uncategorised" category.
+        category_codes = np.where(category_codes < 0, len(categories), category_codes)
+        categories = categories + [UNCATEGORISED]
+    frame = pd.DataFrame({
+        "id": columns["id"],
+        "name": pd.Categorical.from_codes(columns["name"], categories=dictionaries["name"]),
+        "quantity": columns["quantity"],
+        "expiry_day": columns["expiry_day"],
+        "donatable": columns["donatable"],
+        "category": pd.Categorical.from_codes(category_codes, categories=categories),
+    }, copy=False)
+    frame["expiry_date"] = columns["expiry_day"].astype("datetime64[D]").astype("datetime64[s]")
+    return frame
+
+
+def expiring_between(path, first_day, last_day):
+    # Row positions [start, stop) of lots expiring between two dates,
+    # inclusive, found by binary search on the sorted day column.
+    columns, _ = open_snapshot(path)
+    days = columns["expiry_day"]
+    epoch = np.datetime64("1970-01-01", "D")
+    start = np.searchsorted(days, (np.datetime64(first_day, "D") - epoch).astype(int), side="left")
+    stop = np.searchsorted(days, (np.datetime64(last_day, "D") - epoch).astype(int), side="right")
+    return int(start), int(stop)
+
+
+def write_parquet(filename, db_name=DB_NAME, row_group=ROW_GROUP, **filters):
+    # The same columns as Parquet, one Parquet row group per chunk, with
+    # dictionary-encoded strings and a date32 expiry. Needs pyarrow, which
+    # is optional. Returns the row count.
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow: pip install pyarrow")
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("name", pa.dictionary(pa.int32(), pa.string())),
+        ("quantity", pa.int32()),
+        ("expiry_date", pa.date32()),
+        ("donatable", pa.bool_()),
+        ("category", pa.dictionary(pa.int32(), pa.string())),
+        ("description", pa.dictionary(pa.int32(), pa.string())),
+    ])
+    where, params = build_filters(**filters)
+    total = 0
+    tmp_path = f"{filename}.tmp-{os.getpid()}"
+    conn = get_connection(db_name)
+    try:
+        cursor = conn.execute(_select(where), params)
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            while True:
+                rows = cursor.fetchmany(row_group)
+                if not rows:
+                    break
+                ids, names, quantities, days, donatable, categories, descriptions = zip(*rows)
+                writer.write_table(pa.table([
+                    pa.array(ids, pa.int64()),
+                    pa.array(names, pa.string()).dictionary_encode(),
+                    pa.array(quantities, pa.int32()),
+                    pa.array(np.array(days, dtype="<i4")).cast(pa.date32()),
+                    pa.array([bool(flag) for flag in donatable], pa.bool_()),
+                    pa.array(categories, pa.string()).dictionary_encode(),
+                    pa.array(descriptions, pa.string()).dictionary_encode(),
+                ], schema=schema))
+                total += len(rows)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        conn.close()
+    os.replace(tmp_path, filename)
+    return total
+
+
+def snapshot_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar snapshots of the medicines table for analytics")
+    parser.add_argument("--db", default=DB_NAME)
+    commands = parser.add_subparsers(dest="command", required=True)
+    write_parser = commands.add_parser("write", help="write a memory-mappable snapshot directory")
+    write_parser.add_argument("path")
+    parquet_parser = commands.add_parser("parquet", help="write a Parquet file (needs pyarrow)")
+    parquet_parser.add_argument("path")
+    for export_parser in (write_parser, parquet_parser):
+        export_parser.add_argument("--row-group", type=int, default=ROW_GROUP)
+        export_parser.add_argument("--donatable-only", action="store_true")
+        export_parser.add_argument("--category")
+    info_parser = commands.add_parser("info", help="describe a snapshot directory")
+    info_parser.add_argument("path")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "info":
+            manifest = read_manifest(args.path)
+            print(f"{manifest['rows']} rows in {len(manifest['row_groups'])} row group(s), "
+                  f"{snapshot_size(args.path) / 1e6:.1f} MB, written {manifest['created_at']}")
+        else:
+            write = write_snapshot if args.command == "write" else write_parquet
+            count = write(args.path, args.db, args.row_group,
+                          donatable=True if args.donatable_only else None, category=args.category)
+            print(f"✅ {count} medicines written to {args.path}")
+    except (ValueError, ImportError) as e:
+        print(f"❌ {e}")
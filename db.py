@@ -1,21 +1,741 @@
+import os
+import queue
 import sqlite3
+import threading
+from datetime import datetime
 
-DB_NAME = "medicines.db"
+DB_NAME = "medshare.db"
+POOL_SIZE = 8
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS medicines (
+# Applied once when a pooled connection is opened.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+)
+DATE_FORMAT = "%Y-%m-%d"
+
+# Formats seen in older databases before expiry dates were normalised to ISO.
+LEGACY_DATE_FORMATS = (DATE_FORMAT, "%Y/%m/%d", "%d-%m-%Y", "%d/%m/%Y")
+ISO_DATE_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]"
+
+
+def valid_date_sql(column):
+    # A real calendar date in YYYY-MM-DD. The GLOB alone lets 2024-02-30
+    # and 2024-13-01 through; the '+0 days' modifier makes date() roll the
+    # first over to March and return NULL for the second, and IS (unlike =)
+    # fails on that NULL instead of letting the CHECK pass.
+    return f"{column} GLOB '{ISO_DATE_GLOB}' AND date({column}, '+0 days') IS {column}"
+
+# Stores written by earlier versions of the app, merged by update_db.py.
+LEGACY_DATABASES = ("medicines.db", "medicine_tracker.db", "medicine_data.db", "medicine.db")
+TRUE_VALUES = {"1", "yes", "y", "true"}
+FALSE_VALUES = {"0", "no", "n", "false", ""}
+
+MEDICINE_FIELDS = ("name", "quantity", "expiry_date", "donatable", "category", "description")
+
+
+class PooledConnection(sqlite3.Connection):
+    # close() hands the connection back to its pool instead of closing it, so
+    # existing "conn = get_connection() ... conn.close()" code keeps working.
+    # Used as a context manager it commits (or rolls back) and then releases.
+    pool = None
+    checked_out = False
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or _cursor_factory or sqlite3.Cursor)
+
+    # With a cursor factory installed (metrics.enable_profiler), statements
+    # run on cursors of that class; otherwise straight through.
+    def execute(self, sql, parameters=()):
+        if _cursor_factory is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if _cursor_factory is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    def __init__(self, db_name, size=POOL_SIZE):
+        self.db_name = db_name
+        self.size = size
+        self.opened = 0
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_name, factory=PooledConnection, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conn.pool = self
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        if not conn.checked_out:
+            return
+        conn.checked_out = False
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            sqlite3.Connection.close(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            sqlite3.Connection.close(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_initialised = set()
+_cursor_factory = None
+
+
+def set_cursor_factory(factory):
+    global _cursor_factory
+    _cursor_factory = factory
+
+
+def pool_stats():
+    # (db_name, connections opened, connections idle) per pool.
+    with _pools_lock:
+        return [(pool.db_name, pool.opened, pool._idle.qsize()) for pool in _pools.values()]
+
+
+def get_pool(db_name=DB_NAME):
+    with _pools_lock:
+        pool = _pools.get(db_name)
+        if pool is None:
+            pool = _pools[db_name] = ConnectionPool(db_name)
+        return pool
+
+
+def get_connection(db_name=DB_NAME):
+    return get_pool(db_name).acquire()
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
+
+
+def parse_expiry(value):
+    for fmt in LEGACY_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except (ValueError, AttributeError):
+            continue
+    raise ValueError(f"Unrecognised expiry date: {value!r}")
+
+
+def to_iso(value):
+    return parse_expiry(value).strftime(DATE_FORMAT)
+
+
+def parse_flag(value):
+    flag = str(value if value is not None else "").strip().lower()
+    if flag in TRUE_VALUES:
+        return 1
+    if flag in FALSE_VALUES:
+        return 0
+    raise ValueError(f"invalid donatable flag {value!r}")
+
+
+def clean_medicine(name, quantity, expiry_date, donatable=0, category=None, description=None):
+    # Normalises one row to the types the schema's CHECK constraints expect.
+    name = str(name or "").strip()
+    if not name:
+        raise ValueError("missing name")
+    try:
+        quantity = int(str(quantity).strip())
+    except ValueError:
+        raise ValueError(f"invalid quantity {quantity!r}")
+    if quantity < 0:
+        raise ValueError(f"negative quantity {quantity}")
+    expiry_date = to_iso(str(expiry_date or ""))
+    category = str(category or "").strip() or None
+    description = str(description or "").strip() or None
+    return name, quantity, expiry_date, parse_flag(donatable), category, description
+
+
+def table_columns(conn, table="medicines"):
+    schema, _, name = table.rpartition(".")
+    prefix = f"{schema}." if schema else ""
+    return [row[1] for row in conn.execute(f"PRAGMA {prefix}table_info({name})")]
+
+
+def build_filters(name=None, category=None, donatable=None, expiring_after=None, expiring_before=None):
+    clauses, params = [], []
+    if name:
+        clauses.append("name LIKE ?")
+        params.append(f"%{name}%")
+    if category:
+        clauses.append("category = ?")
+        params.append(category)
+    if donatable is not None:
+        clauses.append("donatable = ?")
+        params.append(1 if donatable else 0)
+    if expiring_after:
+        clauses.append("expiry_date >= ?")
+        params.append(to_iso(str(expiring_after)))
+    if expiring_before:
+        clauses.append("expiry_date < ?")
+        params.append(to_iso(str(expiring_before)))
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, params
+
+
+# -------------------------------
+# Schema and migrations
+# -------------------------------
+MEDICINES_TABLE = f"""
+    CREATE TABLE medicines (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL CHECK (length(trim(name)) > 0),
+        quantity INTEGER NOT NULL CHECK (typeof(quantity) = 'integer' AND quantity >= 0),
+        expiry_date TEXT NOT NULL CHECK ({valid_date_sql('expiry_date')}),
+        donatable INTEGER NOT NULL DEFAULT 0 CHECK (donatable IN (0, 1)),
+        category TEXT,
+        description TEXT
+    )
+"""
+
+
+def _table_exists(conn, table):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return row is not None
+
+
+def _copy_legacy_rows(conn, source, target="medicines"):
+    # Copies rows from a pre-versioning medicines table, normalising dates and
+    # flags. Rows that cannot satisfy the constraints go to medicines_rejected.
+    available = set(table_columns(conn, source))
+    columns = [field if field in available else "NULL" for field in MEDICINE_FIELDS]
+    cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {source}")
+    copied, rejected = 0, 0
+    while True:
+        rows = cursor.fetchmany(5000)
+        if not rows:
+            break
+        good, bad = [], []
+        for row in rows:
+            try:
+                good.append(clean_medicine(*row))
+            except ValueError as e:
+                bad.append((source, *row, str(e)))
+        conn.executemany(
+            f"INSERT INTO {target} ({', '.join(MEDICINE_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?)", good
+        )
+        conn.executemany(
+            "INSERT INTO medicines_rejected (source, name, quantity, expiry_date, donatable, category, "
+            "description, reason) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", bad
+        )
+        copied += len(good)
+        rejected += len(bad)
+    return copied, rejected
+
+
+def _migration_1(conn):
+    # Typed, constrained medicines table. Databases created before schema
+    # versioning are rebuilt in place, keeping their triggers.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS medicines_rejected (
+            source TEXT,
+            name TEXT,
+            quantity,
+            expiry_date,
+            donatable,
+            category TEXT,
+            description TEXT,
+            reason TEXT
+        )
+    """)
+    if not _table_exists(conn, "medicines"):
+        conn.execute(MEDICINES_TABLE)
+        return
+
+    triggers = [sql for (sql,) in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'medicines'"
+    )]
+    conn.execute("ALTER TABLE medicines RENAME TO medicines_unversioned")
+    conn.execute(MEDICINES_TABLE)
+    available = set(table_columns(conn, "medicines_unversioned"))
+    columns = ["id"] + [field for field in MEDICINE_FIELDS if field in available]
+    # Copy rows that already satisfy the constraints with their ids intact.
+    conn.execute(f"""
+        INSERT INTO medicines ({', '.join(columns)})
+        SELECT {', '.join(columns)} FROM medicines_unversioned
+        WHERE length(trim(name)) > 0 AND typeof(quantity) = 'integer' AND quantity >= 0
+          AND {valid_date_sql('expiry_date')} AND donatable IN (0, 1)
+    """)
+    conn.execute("""
+        DELETE FROM medicines_unversioned WHERE id IN (SELECT id FROM medicines)
+    """)
+    _copy_legacy_rows(conn, "medicines_unversioned")
+    conn.execute("DROP TABLE medicines_unversioned")
+    for sql in triggers:
+        conn.execute(sql)
+
+
+def _migration_2(conn):
+    # ISO dates sort the same way as the dates themselves, so a plain B-tree
+    # index on the text column serves range queries on expiry.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medicines_expiry ON medicines (expiry_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medicines_donatable ON medicines (donatable, expiry_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medicines_category ON medicines (category, expiry_date)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS merged_sources (
+            path TEXT PRIMARY KEY,
+            merged_at TEXT NOT NULL,
+            copied INTEGER NOT NULL,
+            rejected INTEGER NOT NULL
+        )
+    """)
+
+
+def _migration_3(conn):
+    # Per-table change counters, bumped by triggers on every write, so
+    # caches can tell whether a table changed without re-reading it.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    conn.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('medicines', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS medicines_version_{event.lower()} AFTER {event} ON medicines
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = 'medicines';
+            END
+        """)
+
+
+SEARCH_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS medicine_names_fts_insert AFTER INSERT ON medicine_names
+    BEGIN
+        INSERT INTO medicine_names_fts (rowid, name) VALUES (NEW.id, NEW.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS medicine_names_fts_delete AFTER DELETE ON medicine_names
+    BEGIN
+        INSERT INTO medicine_names_fts (medicine_names_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS medicines_names_insert AFTER INSERT ON medicines
+    BEGIN
+        INSERT INTO medicine_names (name, lots) VALUES (NEW.name, 1)
+        ON CONFLICT (name) DO UPDATE SET lots = lots + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS medicines_names_delete AFTER DELETE ON medicines
+    BEGIN
+        UPDATE medicine_names SET lots = lots - 1 WHERE name = OLD.name;
+        DELETE FROM medicine_names WHERE name = OLD.name AND lots <= 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS medicines_names_update AFTER UPDATE OF name ON medicines
+    BEGIN
+        UPDATE medicine_names SET lots = lots - 1 WHERE name = OLD.name;
+        DELETE FROM medicine_names WHERE name = OLD.name AND lots <= 0;
+        INSERT INTO medicine_names (name, lots) VALUES (NEW.name, 1)
+        ON CONFLICT (name) DO UPDATE SET lots = lots + 1;
+    END
+    """,
+)
+
+
+def _migration_4(conn):
+    # Search vocabulary: one row per distinct medicine name with its lot
+    # count, plus a trigram FTS5 index over it for substring and fuzzy
+    # matching. Triggers keep both in step with medicines.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medicines_name ON medicines (name)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS medicine_names (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            lots INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS medicine_names_fts USING fts5(
+            name, content='medicine_names', content_rowid='id', tokenize='trigram'
+        )
+    """)
+    for trigger in SEARCH_TRIGGERS:
+        conn.execute(trigger)
+    conn.execute("""
+        INSERT INTO medicine_names (name, lots)
+        SELECT name, COUNT(*) FROM medicines GROUP BY name
+    """)
+
+
+def _migration_5(conn):
+    # Medicines that became donatable, in the order they did, for the
+    # expiry scheduler to pick up QR and label work incrementally.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS donation_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            medicine_id INTEGER NOT NULL,
+            queued_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS medicines_queue_insert AFTER INSERT ON medicines
+        WHEN NEW.donatable = 1
+        BEGIN
+            INSERT INTO donation_queue (medicine_id) VALUES (NEW.id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS medicines_queue_update AFTER UPDATE OF donatable ON medicines
+        WHEN NEW.donatable = 1 AND OLD.donatable = 0
+        BEGIN
+            INSERT INTO donation_queue (medicine_id) VALUES (NEW.id);
+        END
+    """)
+
+
+def _migration_6(conn):
+    # Dispensing picks a drug's lots soonest expiry first; with this index
+    # that is a seek on (name, expiry_date). It also serves every lookup the
+    # name-only index did.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medicines_name_expiry ON medicines (name, expiry_date)")
+    conn.execute("DROP INDEX IF EXISTS idx_medicines_name")
+
+
+# A medicines row as JSON, for the event log and snapshots.
+def medicine_json(alias):
+    fields = ", ".join(f"'{field}', {alias}.{field}" for field in ("id",) + MEDICINE_FIELDS)
+    return f"json_object({fields})"
+
+
+EVENT_TIME = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+def _migration_7(conn):
+    # Append-only change log of medicines, written by triggers inside the
+    # same transaction as the change. Inserts and updates carry the new row,
+    # deletes the old one. Snapshots hold the whole table as of an event
+    # sequence number; the first one is taken here so history is complete
+    # from this point on.
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS medicine_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL DEFAULT ({EVENT_TIME}),
+            op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+            medicine_id INTEGER NOT NULL,
+            data TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medicine_events_ts ON medicine_events (ts)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS medicine_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            seq INTEGER NOT NULL,
+            ts TEXT NOT NULL,
+            rows INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS medicine_snapshot_rows (
+            snapshot_id INTEGER NOT NULL,
+            medicine_id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (snapshot_id, medicine_id)
+        ) WITHOUT ROWID
+    """)
+    for event, alias in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD")):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS medicines_event_{event} AFTER {event.upper()} ON medicines
+            BEGIN
+                INSERT INTO medicine_events (op, medicine_id, data)
+                VALUES ('{event}', {alias}.id, {medicine_json(alias)});
+            END
+        """)
+    snapshot_id = conn.execute(
+        f"INSERT INTO medicine_snapshots (seq, ts, rows) SELECT 0, {EVENT_TIME}, COUNT(*) FROM medicines RETURNING id"
+    ).fetchone()[0]
+    conn.execute(f"""
+        INSERT INTO medicine_snapshot_rows (snapshot_id, medicine_id, data)
+        SELECT ?, id, {medicine_json('medicines')} FROM medicines
+    """, (snapshot_id,))
+
+
+def _migration_8(conn):
+    # Donation matching: what recipients asked for and which donatable lots
+    # were promised to them. Open requests are read per medicine in
+    # deadline order, and donatable lots per name in expiry order, each
+    # through its own partial index.
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS recipient_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL CHECK (length(trim(recipient)) > 0),
+            medicine TEXT NOT NULL CHECK (length(trim(medicine)) > 0),
+            quantity INTEGER NOT NULL CHECK (typeof(quantity) = 'integer' AND quantity > 0),
+            deadline TEXT NOT NULL CHECK ({valid_date_sql('deadline')}),
+            allocated INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'filled', 'cancelled')),
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_recipient_requests_open
+        ON recipient_requests (medicine, deadline, id) WHERE status = 'open'
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS allocations (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            quantity INTEGER NOT NULL,
-            expiry_date TEXT NOT NULL,
-            donatable INTEGER DEFAULT 0
+            request_id INTEGER NOT NULL REFERENCES recipient_requests (id),
+            medicine_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            allocated_at TEXT NOT NULL DEFAULT (datetime('now'))
         )
     """)
-    conn.commit()
-    conn.close()
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_allocations_medicine ON allocations (medicine_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_allocations_request ON allocations (request_id)")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_medicines_donatable_name
+        ON medicines (name, expiry_date) WHERE donatable = 1
+    """)
+
+
+def _migration_9(conn):
+    # Row versions for differential exports: one row per medicine id ever
+    # seen, holding the seq of its latest event, the seq it was last
+    # inserted at and whether it is now deleted (a tombstone). Kept by a
+    # trigger on the event log, so compacting events leaves it intact and
+    # "what changed since version N" is a range scan on the version index.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS medicine_changes (
+            medicine_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            inserted_version INTEGER NOT NULL DEFAULT 0,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            changed_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medicine_changes_version ON medicine_changes (version)")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS medicine_events_track_change AFTER INSERT ON medicine_events
+        BEGIN
+            INSERT INTO medicine_changes (medicine_id, version, inserted_version, deleted, changed_at)
+            VALUES (NEW.medicine_id, NEW.seq, CASE WHEN NEW.op = 'insert' THEN NEW.seq ELSE 0 END,
+                    NEW.op = 'delete', NEW.ts)
+            ON CONFLICT (medicine_id) DO UPDATE SET
+                version = excluded.version,
+                inserted_version = CASE WHEN NEW.op = 'insert' THEN NEW.seq ELSE inserted_version END,
+                deleted = excluded.deleted,
+                changed_at = excluded.changed_at;
+        END
+    """)
+    # Backfilled from the events still in the log.
+    conn.execute("""
+        INSERT OR REPLACE INTO medicine_changes (medicine_id, version, inserted_version, deleted, changed_at)
+        WITH latest AS (
+            SELECT medicine_id, MAX(seq) AS seq, MAX(CASE WHEN op = 'insert' THEN seq ELSE 0 END) AS inserted
+            FROM medicine_events GROUP BY medicine_id
+        )
+        SELECT latest.medicine_id, latest.seq, latest.inserted, medicine_events.op = 'delete', medicine_events.ts
+        FROM latest JOIN medicine_events ON medicine_events.seq = latest.seq
+    """)
+
+
+def _migration_10(conn):
+    # Calendar-checked dates for stores created before the CHECKs used
+    # valid_date_sql(). A CHECK cannot be changed in place, so triggers
+    # enforce it instead. Lots already holding an impossible date move to
+    # medicines_rejected, and requests with one are cancelled.
+    conn.execute(f"""
+        INSERT INTO medicines_rejected (source, name, quantity, expiry_date, donatable, category, description, reason)
+        SELECT 'medicines', name, quantity, expiry_date, donatable, category, description,
+               'invalid expiry date ' || quote(expiry_date)
+        FROM medicines WHERE NOT ({valid_date_sql('expiry_date')})
+    """)
+    conn.execute(f"DELETE FROM medicines WHERE NOT ({valid_date_sql('expiry_date')})")
+    conn.execute(f"UPDATE recipient_requests SET status = 'cancelled' WHERE NOT ({valid_date_sql('deadline')})")
+    for table, column in (("medicines", "expiry_date"), ("recipient_requests", "deadline")):
+        for event in ("insert", "update"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_valid_{column}_{event} BEFORE {event.upper()} ON {table}
+                WHEN NOT ({valid_date_sql(f'NEW.{column}')})
+                BEGIN
+                    SELECT RAISE(ABORT, 'CHECK constraint failed: {column} is not a valid date');
+                END
+            """)
+
+
+def _migration_11(conn):
+    # Requests past their deadline get their own 'expired' status, so the
+    # open set is what the matcher can still serve. Widening a CHECK means
+    # rebuilding the table: the copy is renamed into place only after the
+    # old table is gone, so allocations' REFERENCES clause stays correct.
+    conn.execute(f"""
+        CREATE TABLE recipient_requests_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL CHECK (length(trim(recipient)) > 0),
+            medicine TEXT NOT NULL CHECK (length(trim(medicine)) > 0),
+            quantity INTEGER NOT NULL CHECK (typeof(quantity) = 'integer' AND quantity > 0),
+            deadline TEXT NOT NULL CHECK ({valid_date_sql('deadline')}),
+            allocated INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'filled', 'cancelled', 'expired')),
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    # Requests with an impossible deadline were cancelled by migration 10
+    # and cannot pass the new CHECK: they go, releasing their lots as
+    # cancelling does.
+    invalid = f"SELECT id FROM recipient_requests WHERE NOT ({valid_date_sql('deadline')})"
+    conn.execute(f"DELETE FROM allocations WHERE request_id IN ({invalid})")
+    conn.execute(f"""
+        INSERT INTO recipient_requests_new (id, recipient, medicine, quantity, deadline, allocated, status, created_at)
+        SELECT id, recipient, medicine, quantity, deadline, allocated, status, created_at FROM recipient_requests
+        WHERE id NOT IN ({invalid})
+    """)
+    conn.execute("DROP TABLE recipient_requests")
+    conn.execute("ALTER TABLE recipient_requests_new RENAME TO recipient_requests")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_recipient_requests_open
+        ON recipient_requests (medicine, deadline, id) WHERE status = 'open'
+    """)
+
+
+# Applied in order; PRAGMA user_version records how many have run.
+MIGRATIONS = [
+    _migration_1,
+    _migration_2,
+    _migration_3,
+    _migration_4,
+    _migration_5,
+    _migration_6,
+    _migration_7,
+    _migration_8,
+    _migration_9,
+    _migration_10,
+    _migration_11,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    version = schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        return version
+    if conn.in_transaction:
+        conn.commit()
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            MIGRATIONS[number - 1](conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return SCHEMA_VERSION
+
+
+# Progress markers for incremental jobs, kept in scheduler_state.
+def get_watermark(conn, name):
+    row = conn.execute("SELECT value FROM scheduler_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def set_watermark(conn, name, value):
+    conn.execute(
+        "INSERT INTO scheduler_state (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+        (name, value)
+    )
+
+
+def init_db(db_name=DB_NAME):
+    # Once per process and database: later calls (Streamlit reruns, every
+    # command of a long-lived process) return without touching the file.
+    if db_name in _initialised:
+        return
+    conn = get_connection(db_name)
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
+    _initialised.add(db_name)
+
 
-def get_connection():
-    return sqlite3.connect(DB_NAME)
+def merge_legacy_database(path, db_name=DB_NAME):
+    # Copies every row of an older store into the unified database. Each
+    # file is merged once; merged_sources remembers which ones are done.
+    source = os.path.abspath(path)
+    conn = get_connection(db_name)
+    try:
+        migrate(conn)
+        if conn.execute("SELECT 1 FROM merged_sources WHERE path = ?", (source,)).fetchone():
+            return None
+        conn.execute("ATTACH DATABASE ? AS legacy", (source,))
+        try:
+            found = conn.execute(
+                "SELECT 1 FROM legacy.sqlite_master WHERE type = 'table' AND name = 'medicines'"
+            ).fetchone()
+            copied, rejected = _copy_legacy_rows(conn, "legacy.medicines") if found else (0, 0)
+            conn.execute(
+                "INSERT INTO merged_sources (path, merged_at, copied, rejected) VALUES (?, ?, ?, ?)",
+                (source, datetime.now().isoformat(timespec="seconds"), copied, rejected)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("DETACH DATABASE legacy")
+    finally:
+        conn.close()
+    return copied, rejected
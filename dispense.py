@@ -0,0 +1,134 @@
+import argparse
+import json
+from datetime import date
+from db import DB_NAME, get_connection
+from expiry_index import track
+from metrics import timed
+
+
+@timed("dispense", rows=len)
+def dispense(name, quantity, db_name=DB_NAME, today=None):
+    # Takes `quantity` units of `name` from its lots, soonest expiry first
+    # (FEFO). Expired lots and lots set aside for donation are skipped.
+    # All or nothing in one write transaction: returns [(lot id, units
+    # taken, expiry_date)] or raises ValueError when stock is short. Lots
+    # that run out are deleted.
+    if quantity <= 0:
+        raise ValueError("Quantity to dispense must be positive")
+    today = (today or date.today()).isoformat()
+
+    conn = get_connection(db_name)
+    try:
+        # Take the write lock before reading so two counters cannot both
+        # plan against the same units.
+        conn.execute("BEGIN IMMEDIATE")
+        # Walks the (name, expiry_date) index and stops as soon as the
+        # order is covered.
+        cursor = conn.execute("""
+            SELECT id, quantity, expiry_date FROM medicines
+            WHERE name = ? AND expiry_date >= ? AND donatable = 0 AND quantity > 0
+            ORDER BY expiry_date, id
+        """, (name, today))
+        picks, remaining = [], quantity
+        for lot_id, available, expiry_date in cursor:
+            take = min(available, remaining)
+            picks.append((lot_id, take, expiry_date, available - take))
+            remaining -= take
+            if not remaining:
+                break
+        cursor.close()
+        if remaining:
+            raise ValueError(f"Only {quantity - remaining} unit(s) of {name} in stock, {quantity} requested")
+
+        emptied = [pick for pick in picks if not pick[3]]
+        partial = [pick for pick in picks if pick[3]]
+        if emptied:
+            conn.execute(
+                "DELETE FROM medicines WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps([pick[0] for pick in emptied]),)
+            )
+        for lot_id, _, _, left in partial:
+            conn.execute("UPDATE medicines SET quantity = ? WHERE id = ?", (left, lot_id))
+        track(
+            conn, db_name,
+            deleted=[(lot_id, name, 0, expiry_date) for lot_id, _, expiry_date, _ in emptied],
+            changed=[(lot_id, name, left, expiry_date, 0) for lot_id, _, expiry_date, left in partial]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return [(lot_id, take, expiry_date) for lot_id, take, expiry_date, _ in picks]
+
+
+def donate_from_lot(lot_id, quantity, db_name=DB_NAME):
+    # Sets `quantity` units of a lot aside for donation. Donating the whole
+    # lot just marks it; otherwise the lot is split and the donated part
+    # becomes a new donatable lot with the same expiry. Returns the donated
+    # lot as (id, name, quantity, expiry_date, category).
+    conn = get_connection(db_name)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        lot = conn.execute(
+            "SELECT name, quantity, expiry_date, donatable, category, description FROM medicines WHERE id = ?",
+            (lot_id,)
+        ).fetchone()
+        if lot is None:
+            raise ValueError(f"No medicine with id {lot_id}")
+        name, available, expiry_date, donatable, category, description = lot
+        if donatable:
+            raise ValueError(f"Lot {lot_id} is already donatable")
+        if not 0 < quantity <= available:
+            raise ValueError(f"Lot {lot_id} has {available} unit(s); cannot donate {quantity}")
+
+        if quantity == available:
+            conn.execute("UPDATE medicines SET donatable = 1 WHERE id = ?", (lot_id,))
+            donated_id = lot_id
+            track(conn, db_name, marked=[(lot_id, name, quantity, expiry_date)])
+        else:
+            conn.execute("UPDATE medicines SET quantity = quantity - ? WHERE id = ?", (quantity, lot_id))
+            donated_id = conn.execute("""
+                INSERT INTO medicines (name, quantity, expiry_date, donatable, category, description)
+                VALUES (?, ?, ?, 1, ?, ?) RETURNING id
+            """, (name, quantity, expiry_date, category, description)).fetchone()[0]
+            track(
+                conn, db_name,
+                changed=[(lot_id, name, available - quantity, expiry_date, 0)],
+                added=[(donated_id, name, quantity, expiry_date, 1)]
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return donated_id, name, quantity, expiry_date, category
+
+
+def print_dispensed(name, picks):
+    print(f"✅ Dispensed {sum(take for _, take, _ in picks)} unit(s) of {name}:")
+    for lot_id, take, expiry_date in picks:
+        print(f"   - {take} from lot {lot_id} (expires {expiry_date})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dispense stock first-expiry-first-out, or donate part of a lot")
+    parser.add_argument("name", nargs="?", help="medicine name to dispense")
+    parser.add_argument("quantity", type=int, nargs="?")
+    parser.add_argument("--donate-lot", type=int, nargs=2, metavar=("ID", "QUANTITY"),
+                        help="set QUANTITY units of lot ID aside for donation instead")
+    parser.add_argument("--db", default=DB_NAME)
+    args = parser.parse_args()
+
+    try:
+        if args.donate_lot:
+            lot = donate_from_lot(*args.donate_lot, args.db)
+            print(f"✅ {lot[2]} unit(s) of {lot[1]} set aside for donation as lot {lot[0]}")
+        elif args.name is None or args.quantity is None:
+            parser.error("give a medicine name and quantity, or --donate-lot ID QUANTITY")
+        else:
+            print_dispensed(args.name, dispense(args.name, args.quantity, args.db))
+    except ValueError as e:
+        print(f"❌ {e}")
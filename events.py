@@ -0,0 +1,222 @@
+import argparse
+import json
+from datetime import datetime, timezone
+from db import DB_NAME, EVENT_TIME, MEDICINE_FIELDS, get_connection, medicine_json
+
+# Events between the automatic snapshots taken by snapshot_if_due().
+SNAPSHOT_EVERY = 10000
+KEEP_SNAPSHOTS = 2
+FEED_LIMIT = 1000
+
+EVENT_COLUMNS = ["seq", "ts", "op", "medicine_id", "data"]
+
+
+def event_time(ts):
+    # Events are stamped in UTC as "YYYY-MM-DD HH:MM:SS.SSS"; naive
+    # datetimes are taken to be UTC already.
+    if isinstance(ts, datetime):
+        if ts.tzinfo is not None:
+            ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+        return ts.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    return str(ts)
+
+
+def latest_seq(conn):
+    # From sqlite_sequence, so it survives compaction deleting old events.
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'medicine_events'").fetchone()
+    return row[0] if row else 0
+
+
+def _snapshot(conn):
+    seq = latest_seq(conn)
+    snapshot_id = conn.execute(
+        f"INSERT INTO medicine_snapshots (seq, ts, rows) SELECT ?, {EVENT_TIME}, COUNT(*) FROM medicines RETURNING id",
+        (seq,)
+    ).fetchone()[0]
+    conn.execute(f"""
+        INSERT INTO medicine_snapshot_rows (snapshot_id, medicine_id, data)
+        SELECT ?, id, {medicine_json('medicines')} FROM medicines
+    """, (snapshot_id,))
+    return snapshot_id, seq
+
+
+def _compact(conn, keep):
+    # Keeps the newest `keep` snapshots and only the events after the
+    # oldest of them; anything earlier can no longer be replayed.
+    kept = conn.execute(
+        "SELECT id, seq FROM medicine_snapshots ORDER BY id DESC LIMIT ?", (max(1, keep),)
+    ).fetchall()
+    if not kept:
+        return 0, 0
+    oldest_id, oldest_seq = kept[-1]
+    conn.execute("DELETE FROM medicine_snapshot_rows WHERE snapshot_id < ?", (oldest_id,))
+    snapshots = conn.execute("DELETE FROM medicine_snapshots WHERE id < ?", (oldest_id,)).rowcount
+    events = conn.execute("DELETE FROM medicine_events WHERE seq <= ?", (oldest_seq,)).rowcount
+    return snapshots, events
+
+
+def take_snapshot(db_name=DB_NAME, keep=None):
+    # Copies the whole table into a new snapshot in one write transaction,
+    # optionally compacting down to `keep` snapshots. Returns
+    # (snapshot id, last event seq it includes).
+    conn = get_connection(db_name)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        snapshot = _snapshot(conn)
+        if keep is not None:
+            _compact(conn, keep)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return snapshot
+
+
+def compact(db_name=DB_NAME, keep=KEEP_SNAPSHOTS):
+    # Returns (snapshots removed, events removed).
+    conn = get_connection(db_name)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        removed = _compact(conn, keep)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return removed
+
+
+def snapshot_if_due(db_name=DB_NAME, every=SNAPSHOT_EVERY, keep=KEEP_SNAPSHOTS):
+    # For periodic callers such as the scheduler: snapshots and compacts
+    # once `every` events have piled up since the last snapshot.
+    conn = get_connection(db_name)
+    try:
+        last = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM medicine_snapshots").fetchone()[0]
+        due = latest_seq(conn) - last >= every
+    finally:
+        conn.close()
+    return take_snapshot(db_name, keep) if due else None
+
+
+def state_at(ts=None, db_name=DB_NAME):
+    # {medicine id: row dict} as of `ts` (default: now), rebuilt from the
+    # newest snapshot at or before it plus the events after that snapshot.
+    ts = event_time(ts or datetime.now(timezone.utc))
+    conn = get_connection(db_name)
+    try:
+        # One read transaction so the snapshot and the tail agree.
+        conn.execute("BEGIN")
+        snapshot = conn.execute(
+            "SELECT id, seq FROM medicine_snapshots WHERE ts <= ? ORDER BY id DESC LIMIT 1", (ts,)
+        ).fetchone()
+        if snapshot is None:
+            oldest = conn.execute("SELECT MIN(ts) FROM medicine_snapshots").fetchone()[0]
+            raise ValueError(f"No history before {oldest}; cannot rebuild the inventory at {ts}")
+        snapshot_id, seq = snapshot
+
+        state = {
+            medicine_id: json.loads(data) for medicine_id, data in conn.execute(
+                "SELECT medicine_id, data FROM medicine_snapshot_rows WHERE snapshot_id = ?", (snapshot_id,)
+            )
+        }
+        for op, medicine_id, data in conn.execute(
+            "SELECT op, medicine_id, data FROM medicine_events WHERE seq > ? AND ts <= ? ORDER BY seq", (seq, ts)
+        ):
+            if op == "delete":
+                state.pop(medicine_id, None)
+            else:
+                state[medicine_id] = json.loads(data)
+        conn.rollback()
+    finally:
+        conn.close()
+    return state
+
+
+def changes_since(seq=0, limit=FEED_LIMIT, db_name=DB_NAME):
+    # The change feed: up to `limit` events after `seq`, oldest first, as
+    # dicts. Consumers remember the last seq they saw and ask again. If
+    # compaction already dropped events they have not seen, they get a
+    # ValueError and should resync from state_at().
+    conn = get_connection(db_name)
+    try:
+        floor = conn.execute("SELECT MIN(seq) FROM medicine_snapshots").fetchone()[0] or 0
+        if seq < floor:
+            raise ValueError(f"Events up to {floor} were compacted away; resync from a snapshot")
+        rows = conn.execute(
+            f"SELECT {', '.join(EVENT_COLUMNS)} FROM medicine_events WHERE seq > ? ORDER BY seq LIMIT ?", (seq, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(zip(EVENT_COLUMNS, row[:4]), data=json.loads(row[4])) for row in rows]
+
+
+def restore(ts, db_name=DB_NAME):
+    # Puts the medicines table back the way it was at `ts`, touching only
+    # the rows that differ. The restore is itself logged as ordinary events.
+    # Returns (rows written, rows deleted).
+    target = state_at(ts, db_name)
+    columns = ("id",) + MEDICINE_FIELDS
+    conn = get_connection(db_name)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        current = {
+            medicine_id: json.loads(data) for medicine_id, data in conn.execute(
+                f"SELECT id, {medicine_json('medicines')} FROM medicines"
+            )
+        }
+        stale = [medicine_id for medicine_id in current if medicine_id not in target]
+        changed = [row for medicine_id, row in target.items() if current.get(medicine_id) != row]
+
+        if stale:
+            conn.execute("DELETE FROM medicines WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(stale),))
+        conn.executemany(f"""
+            INSERT INTO medicines ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})
+            ON CONFLICT (id) DO UPDATE SET {', '.join(f'{field} = excluded.{field}' for field in MEDICINE_FIELDS)}
+        """, [tuple(row[column] for column in columns) for row in changed])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return len(changed), len(stale)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MedShare inventory history")
+    parser.add_argument("--db", default=DB_NAME)
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot_parser = commands.add_parser("snapshot", help="snapshot the inventory now")
+    snapshot_parser.add_argument("--keep", type=int, help="then keep only this many snapshots")
+    compact_parser = commands.add_parser("compact", help="drop old snapshots and the events before them")
+    compact_parser.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS)
+    feed_parser = commands.add_parser("feed", help="print events after a sequence number")
+    feed_parser.add_argument("--since", type=int, default=0)
+    feed_parser.add_argument("--limit", type=int, default=FEED_LIMIT)
+    state_parser = commands.add_parser("state", help="print the inventory as it was at a time (UTC)")
+    state_parser.add_argument("--at", help='e.g. "2025-01-31 18:00:00"')
+    restore_parser = commands.add_parser("restore", help="roll the inventory back to a time (UTC)")
+    restore_parser.add_argument("--at", required=True)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "snapshot":
+            snapshot_id, seq = take_snapshot(args.db, args.keep)
+            print(f"✅ Snapshot {snapshot_id} taken at event {seq}")
+        elif args.command == "compact":
+            snapshots, events = compact(args.db, args.keep)
+            print(f"✅ Removed {snapshots} snapshot(s) and {events} event(s)")
+        elif args.command == "feed":
+            for event in changes_since(args.since, args.limit, args.db):
+                print(json.dumps(event))
+        elif args.command == "state":
+            for row in sorted(state_at(args.at, args.db).values(), key=lambda row: row["id"]):
+                print(json.dumps(row))
+        else:
+            written, deleted = restore(args.at, args.db)
+            print(f"✅ Restored to {args.at}: {written} row(s) written, {deleted} deleted")
+    except ValueError as e:
+        print(f"❌ {e}")
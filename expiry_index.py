@@ -0,0 +1,279 @@
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, timedelta
+from itertools import islice
+from db import DB_NAME, get_connection
+
+LOAD_CHUNK = 10000
+# Fold the delta buffer and tombstones back into the sorted arrays once they
+# grow past this share of the base (and past MIN_DELTA).
+COMPACT_RATIO = 16
+MIN_DELTA = 1024
+# julianday() of 0001-01-01 minus one, i.e. julianday - ORDINAL_OFFSET equals
+# date.toordinal().
+ORDINAL_OFFSET = 1721424.5
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class ExpiryIndex:
+    # Every lot with a known expiry, held as parallel arrays sorted by
+    # (expiry day number, id). Horizon queries are two bisections plus a
+    # slice. New lots go to a small sorted delta buffer and deleted lots are
+    # tombstoned, so writes never shift the big arrays; compact() merges both
+    # back in.
+    #
+    # The index remembers the medicines table version it reflects. Queries
+    # check it (one primary-key lookup) and reload when another connection
+    # or process changed the table behind its back.
+
+    def __init__(self, db_name=DB_NAME):
+        self.db_name = db_name
+        self.version = None
+        self._lock = threading.RLock()
+        self._iso = {}
+        self.load()
+
+    def load(self):
+        days, ids, quantities, donatable, names = array("i"), array("q"), array("q"), bytearray(), []
+        shared_names = {}
+        conn = get_connection(self.db_name)
+        try:
+            # One read transaction so the version matches the rows. SQLite
+            # turns the dates into day numbers (julianday minus the proleptic
+            # Gregorian epoch is date.toordinal()), and each chunk is
+            # transposed into the arrays without a per-row Python loop.
+            conn.execute("BEGIN")
+            version = _table_version(conn)
+            cursor = conn.execute(f"""
+                SELECT CAST(julianday(expiry_date) - {ORDINAL_OFFSET} AS INTEGER), id, quantity, donatable, name
+                FROM medicines ORDER BY expiry_date, id
+            """)
+            while True:
+                rows = cursor.fetchmany(LOAD_CHUNK)
+                if not rows:
+                    break
+                chunk_days, chunk_ids, chunk_quantities, chunk_donatable, chunk_names = zip(*rows)
+                days.extend(chunk_days)
+                ids.extend(chunk_ids)
+                quantities.extend(chunk_quantities)
+                donatable.extend(chunk_donatable)
+                names.extend([shared_names.setdefault(name, name) for name in chunk_names])
+            conn.rollback()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._days, self._ids, self._quantities, self._donatable, self._names = (
+                days, ids, quantities, donatable, names
+            )
+            self._dead = bytearray(len(days))
+            self._dead_count = 0
+            self._delta = []
+            self.version = version
+
+    def __len__(self):
+        return len(self._days) - self._dead_count + len(self._delta)
+
+    def refresh(self):
+        conn = get_connection(self.db_name)
+        try:
+            version = _table_version(conn)
+        finally:
+            conn.close()
+        if version != self.version:
+            self.load()
+
+    def expiring_within(self, days, today=None, donatable=None, check=True):
+        # Same rows as expiry_date BETWEEN today AND today + days.
+        today = today or date.today()
+        return self.expiring_between(today, today + timedelta(days=days), donatable, check)
+
+    def expiring_between(self, start, end, donatable=None, check=True):
+        # Inclusive on both ends; rows are (id, name, quantity, expiry_date,
+        # donatable) ordered by expiry.
+        if check:
+            self.refresh()
+        first, last = start.toordinal(), end.toordinal()
+        with self._lock:
+            lo = bisect_left(self._days, first)
+            hi = bisect_right(self._days, last)
+            delta_lo = bisect_left(self._delta, [first])
+            delta_hi = bisect_left(self._delta, [last + 1])
+            if delta_lo == delta_hi and self._dead.find(1, lo, hi) == -1:
+                # Common case: nothing pending in this range, so the answer is
+                # straight slices of the arrays.
+                rows = zip(self._ids[lo:hi], self._names[lo:hi], self._quantities[lo:hi],
+                           map(self._iso_date, self._days[lo:hi]), self._donatable[lo:hi])
+                if donatable is None:
+                    return list(rows)
+                return [row for row in rows if row[4] == donatable]
+            return list(self._merged(lo, hi, self._delta[delta_lo:delta_hi], donatable))
+
+    def next_to_expire(self, n=None, today=None, donatable=None, check=True):
+        # Lots that have not expired yet, soonest first. Lazily merges the
+        # base arrays and the delta buffer through a heap, so asking for the
+        # next 10 touches about 10 entries whatever the table size.
+        if check:
+            self.refresh()
+        first = (today or date.today()).toordinal()
+        with self._lock:
+            lo = bisect_left(self._days, first)
+            delta = self._delta[bisect_left(self._delta, [first]):]
+            return list(islice(self._merged(lo, len(self._days), delta, donatable), n))
+
+    def _merged(self, lo, hi, delta, donatable):
+        base = (
+            (self._days[i], self._ids[i], self._names[i], self._quantities[i], self._donatable[i])
+            for i in range(lo, hi) if not self._dead[i]
+        )
+        for day, med_id, name, quantity, flag in heapq.merge(base, (tuple(entry) for entry in delta)):
+            if donatable is None or flag == donatable:
+                yield med_id, name, quantity, self._iso_date(day), flag
+
+    def _iso_date(self, day):
+        iso = self._iso.get(day)
+        if iso is None:
+            iso = self._iso[day] = date.fromordinal(day).isoformat()
+        return iso
+
+    def _find(self, med_id, day):
+        # Position of a live lot in the base arrays, or None. Lots sharing an
+        # expiry day sit together, so only that run is scanned.
+        lo = bisect_left(self._days, day)
+        hi = bisect_right(self._days, day, lo)
+        try:
+            pos = self._ids.index(med_id, lo, hi)
+        except ValueError:
+            return None
+        return None if self._dead[pos] else pos
+
+    def _find_delta(self, med_id, day):
+        pos = bisect_left(self._delta, [day, med_id])
+        if pos < len(self._delta) and self._delta[pos][:2] == [day, med_id]:
+            return pos
+        return None
+
+    def apply(self, conn, added=(), marked=(), deleted=(), changed=()):
+        # Writers call this inside their write transaction, before commit.
+        # Each changed row bumps the table version once, so if the version
+        # moved by anything other than our own rows someone else wrote too
+        # and the index reloads on its next query instead.
+        # Rows start (id, name, quantity, expiry_date, ...); added and
+        # changed rows also carry donatable at position 4. Changed rows keep
+        # their expiry date and give the new quantity and donatable flag.
+        version = _table_version(conn)
+        with self._lock:
+            expected = len(added) + len(marked) + len(deleted) + len(changed)
+            if self.version is None or version != self.version + expected:
+                self.version = None
+                return
+            for row in added:
+                insort(self._delta, [_ordinal(row[3]), row[0], row[1], row[2], row[4]])
+            for row in changed:
+                if not self._update(row[0], _ordinal(row[3]), row[2], row[4]):
+                    self.version = None
+                    return
+            for row in marked:
+                if not self._set_donatable(row[0], _ordinal(row[3])):
+                    self.version = None
+                    return
+            for row in deleted:
+                if not self._remove(row[0], _ordinal(row[3])):
+                    self.version = None
+                    return
+            self.version = version
+            if len(self._delta) + self._dead_count > max(MIN_DELTA, len(self._days) // COMPACT_RATIO):
+                self.compact()
+
+    def _set_donatable(self, med_id, day):
+        pos = self._find(med_id, day)
+        if pos is not None:
+            self._donatable[pos] = 1
+            return True
+        pos = self._find_delta(med_id, day)
+        if pos is not None:
+            self._delta[pos][4] = 1
+            return True
+        return False
+
+    def _update(self, med_id, day, quantity, donatable):
+        pos = self._find(med_id, day)
+        if pos is not None:
+            self._quantities[pos] = quantity
+            self._donatable[pos] = donatable
+            return True
+        pos = self._find_delta(med_id, day)
+        if pos is not None:
+            self._delta[pos][3:5] = [quantity, donatable]
+            return True
+        return False
+
+    def _remove(self, med_id, day):
+        pos = self._find(med_id, day)
+        if pos is not None:
+            self._dead[pos] = 1
+            self._dead_count += 1
+            return True
+        pos = self._find_delta(med_id, day)
+        if pos is not None:
+            del self._delta[pos]
+            return True
+        return False
+
+    def compact(self):
+        with self._lock:
+            days, ids, quantities, donatable, names = array("i"), array("q"), array("q"), bytearray(), []
+            base = (
+                (self._days[i], self._ids[i], self._names[i], self._quantities[i], self._donatable[i])
+                for i in range(len(self._days)) if not self._dead[i]
+            )
+            for day, med_id, name, quantity, flag in heapq.merge(base, (tuple(entry) for entry in self._delta)):
+                days.append(day)
+                ids.append(med_id)
+                quantities.append(quantity)
+                donatable.append(flag)
+                names.append(name)
+            self._days, self._ids, self._quantities, self._donatable, self._names = (
+                days, ids, quantities, donatable, names
+            )
+            self._dead = bytearray(len(days))
+            self._dead_count = 0
+            self._delta = []
+
+
+def _ordinal(expiry_date):
+    return date.fromisoformat(expiry_date).toordinal()
+
+
+def _table_version(conn):
+    row = conn.execute("SELECT version FROM table_versions WHERE name = 'medicines'").fetchone()
+    return row[0] if row else 0
+
+
+def get_index(db_name=DB_NAME):
+    # Loaded on first use; after that writers in this process keep it up to
+    # date through track().
+    with _indexes_lock:
+        index = _indexes.get(db_name)
+        if index is None:
+            index = _indexes[db_name] = ExpiryIndex(db_name)
+        return index
+
+
+def drop_index(db_name=None):
+    with _indexes_lock:
+        if db_name is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(db_name, None)
+
+
+def track(conn, db_name=DB_NAME, added=(), marked=(), deleted=(), changed=()):
+    # No-op unless an index has been loaded for this database.
+    index = _indexes.get(db_name)
+    if index is not None:
+        index.apply(conn, added, marked, deleted, changed)
@@ -0,0 +1,259 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+from db import DB_NAME, build_filters, get_connection, init_db, table_columns
+from events import latest_seq
+
+CHUNK_SIZE = 5000
+# Where export_changes() remembers the last row version it shipped.
+CHECKPOINT_FILE = "export_checkpoint.json"
+
+# Same header as the original medicine_ops.export_to_csv, so importer.py
+# can read the files back.
+EXPORT_COLUMNS = [
+    ("id", "ID"),
+    ("name", "Name"),
+    ("quantity", "Quantity"),
+    ("expiry_date", "Expiry Date"),
+    ("donatable", "Donatable"),
+    ("category", "Category"),
+    ("description", "Description"),
+]
+
+
+def iter_export_rows(db_name=DB_NAME, chunk_size=CHUNK_SIZE, **filters):
+    # Yields the header, then lists of at most chunk_size rows. Only one chunk
+    # is held in memory at a time.
+    conn = get_connection(db_name)
+    try:
+        available = set(table_columns(conn))
+        columns = [(column, label) for column, label in EXPORT_COLUMNS if column in available]
+        donatable_at = [column for column, _ in columns].index("donatable")
+        where, params = build_filters(**filters)
+        cursor = conn.execute(
+            f"SELECT {', '.join(column for column, _ in columns)} FROM medicines{where} ORDER BY id", params
+        )
+        yield [label for _, label in columns]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for i, row in enumerate(rows):
+                row = list(row)
+                row[donatable_at] = "Yes" if row[donatable_at] else "No"
+                rows[i] = row
+            yield rows
+    finally:
+        conn.close()
+
+
+def iter_csv_chunks(db_name=DB_NAME, chunk_size=CHUNK_SIZE, compress=False, **filters):
+    # CSV as a generator of byte chunks, optionally gzip-compressed, for
+    # streaming responses and download buttons.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    rows = iter_export_rows(db_name, chunk_size, **filters)
+    writer.writerow(next(rows))
+    for chunk in rows:
+        writer.writerows(chunk)
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+
+    data = buffer.getvalue().encode("utf-8")
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def export_csv(filename, db_name=DB_NAME, chunk_size=CHUNK_SIZE, compress=None, **filters):
+    if compress is None:
+        compress = filename.endswith(".gz")
+    opener = gzip.open if compress else open
+
+    count = 0
+    with opener(filename, mode="wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        rows = iter_export_rows(db_name, chunk_size, **filters)
+        writer.writerow(next(rows))
+        for chunk in rows:
+            writer.writerows(chunk)
+            count += len(chunk)
+    return count
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint, path=CHECKPOINT_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def iter_change_rows(since, db_name=DB_NAME, chunk_size=CHUNK_SIZE):
+    # Yields the row version the changes run up to, the header (an "Op"
+    # column, then the export columns), then chunks of rows changed after
+    # version `since`, oldest change first. A row changed several times
+    # appears once, as it is now: "insert" if it was (re)inserted after
+    # `since`, "update" otherwise, or "delete" with only its ID. Rows added
+    # and removed in between are left out. since=None exports every row as
+    # an insert. All of it comes from one read transaction.
+    conn = get_connection(db_name)
+    try:
+        conn.execute("BEGIN")
+        available = set(table_columns(conn))
+        columns = [(column, label) for column, label in EXPORT_COLUMNS if column in available]
+        donatable_at = 1 + [column for column, _ in columns].index("donatable")
+        version = latest_seq(conn)
+        if since is None:
+            cursor = conn.execute(
+                f"SELECT 'insert', {', '.join(column for column, _ in columns)} FROM medicines ORDER BY id"
+            )
+        else:
+            cursor = conn.execute(f"""
+                SELECT CASE WHEN changes.deleted THEN 'delete'
+                            WHEN changes.inserted_version > ?1 THEN 'insert' ELSE 'update' END,
+                       changes.medicine_id, {', '.join(f'medicines.{column}' for column, _ in columns[1:])}
+                FROM medicine_changes AS changes LEFT JOIN medicines ON medicines.id = changes.medicine_id
+                WHERE changes.version > ?1 AND changes.version <= ?2
+                  AND NOT (changes.deleted AND changes.inserted_version > ?1)
+                ORDER BY changes.version
+            """, (since, version))
+        yield version
+        yield ["Op"] + [label for _, label in columns]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for i, row in enumerate(rows):
+                row = list(row)
+                if row[donatable_at] is not None:
+                    row[donatable_at] = "Yes" if row[donatable_at] else "No"
+                rows[i] = row
+            yield rows
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def export_changes(filename, checkpoint=CHECKPOINT_FILE, db_name=DB_NAME, chunk_size=CHUNK_SIZE,
+                   compress=None, full=False):
+    # Differential export for warehouse syncs: only the rows inserted,
+    # updated or deleted since the version in the checkpoint file, so the
+    # cost follows churn rather than table size. Without a checkpoint (or
+    # with full=True) every row is exported, and the receiver should
+    # replace its copy. The checkpoint only moves once the file is
+    # complete; a failed run ships the same changes again next time.
+    # Returns {"full", "since", "version", "insert", "update", "delete"}.
+    db_path = os.path.abspath(db_name)
+    state = None if full else load_checkpoint(checkpoint)
+    if state is not None and state.get("db") != db_path:
+        raise ValueError(f"{checkpoint} tracks {state.get('db')}, not {db_path}; export with full=True to start over")
+    since = None if state is None else state["version"]
+    if compress is None:
+        compress = filename.endswith(".gz")
+    opener = gzip.open if compress else open
+
+    counts = {"insert": 0, "update": 0, "delete": 0}
+    tmp_path = f"{filename}.tmp"
+    rows = iter_change_rows(since, db_name, chunk_size)
+    version = next(rows)
+    if since is not None and since > version:
+        # The database went back in time (restored from a backup): start over.
+        rows.close()
+        since = None
+        rows = iter_change_rows(None, db_name, chunk_size)
+        version = next(rows)
+    with opener(tmp_path, mode="wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(next(rows))
+        for chunk in rows:
+            writer.writerows(chunk)
+            for row in chunk:
+                counts[row[0]] += 1
+    os.replace(tmp_path, filename)
+    save_checkpoint({
+        "db": db_path, "version": version, "exported_at": datetime.now().isoformat(timespec="seconds"),
+        "file": os.path.abspath(filename), "full": since is None, **counts,
+    }, checkpoint)
+    return {"full": since is None, "since": since, "version": version, **counts}
+
+
+class ChunkReader(io.RawIOBase):
+    # Read-only file object over a generator of byte chunks, for APIs such as
+    # st.download_button that take a file rather than an iterator.
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._pending = b""
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # Callers commonly rewind before reading; allow that while unread.
+        if offset == 0 and whence == io.SEEK_SET and self._position == 0:
+            return 0
+        raise io.UnsupportedOperation("seek")
+
+    def readinto(self, b):
+        while not self._pending:
+            try:
+                self._pending = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        self._position += n
+        return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream medicines to a CSV file")
+    parser.add_argument("filename", nargs="?", default="medicines_backup.csv")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--gzip", action="store_true", default=None)
+    parser.add_argument("--donatable-only", action="store_true")
+    parser.add_argument("--expiring-before", help="YYYY-MM-DD")
+    parser.add_argument("--category")
+    parser.add_argument("--changes", action="store_true", help="only rows changed since the checkpoint")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--full", action="store_true", help="with --changes: ignore the checkpoint, export all")
+    args = parser.parse_args()
+
+    init_db(args.db)
+    if args.changes:
+        try:
+            result = export_changes(args.filename, args.checkpoint, args.db, compress=args.gzip, full=args.full)
+        except ValueError as e:
+            print(f"❌ {e}")
+        else:
+            kind = "Full export" if result["full"] else f"Changes since version {result['since']}"
+            print(f"✅ {kind} to {args.filename}: {result['insert']} inserted, {result['update']} updated, "
+                  f"{result['delete']} deleted (now at version {result['version']})")
+    else:
+        count = export_csv(
+            args.filename, db_name=args.db, compress=args.gzip,
+            donatable=True if args.donatable_only else None,
+            expiring_before=args.expiring_before, category=args.category
+        )
+        print(f"✅ {count} medicines exported to {args.filename}\n")
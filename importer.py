@@ -0,0 +1,131 @@
+import argparse
+import csv
+import io
+import json
+import os
+from db import DB_NAME, MEDICINE_FIELDS, clean_medicine, get_connection, migrate
+
+BATCH_SIZE = 5000
+ROWS_PER_TRANSACTION = 100000
+
+# Header spellings produced by medicine_ops.export_to_csv, main.export_to_csv
+# and hand-made distributor sheets.
+FIELD_ALIASES = {
+    "expiry date": "expiry_date",
+    "expiry": "expiry_date",
+    "qty": "quantity",
+    "medicine": "name",
+    "medicine name": "name",
+}
+
+INSERT_SQL = """
+    INSERT INTO medicines (name, quantity, expiry_date, donatable, category, description)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def _field(key):
+    key = key.strip().lower()
+    return FIELD_ALIASES.get(key, key.replace(" ", "_"))
+
+
+def read_csv_records(f):
+    reader = csv.DictReader(f)
+    reader.fieldnames = [_field(name) for name in reader.fieldnames or []]
+    for record in reader:
+        yield reader.line_num, record
+
+
+def read_jsonl_records(f):
+    for line_no, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, ValueError(f"invalid JSON ({e.msg})")
+            continue
+        if not isinstance(record, dict):
+            yield line_no, ValueError("expected a JSON object")
+            continue
+        yield line_no, {_field(key): value for key, value in record.items()}
+
+
+def parse_record(record):
+    if isinstance(record, Exception):
+        raise record
+    return clean_medicine(*(record.get(field) for field in MEDICINE_FIELDS))
+
+
+def detect_format(source):
+    name = source if isinstance(source, str) else getattr(source, "name", "")
+    return "jsonl" if str(name).lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def import_medicines(source, fmt=None, db_name=DB_NAME, batch_size=BATCH_SIZE):
+    # source is a path or an open text file; rows are streamed, validated and
+    # inserted in executemany batches. Bad rows are collected, not fatal.
+    fmt = fmt or detect_format(source)
+    f = open(source, newline="", encoding="utf-8-sig") if isinstance(source, str) else source
+    records = read_jsonl_records(f) if fmt == "jsonl" else read_csv_records(f)
+
+    inserted, pending, errors, batch = 0, 0, [], []
+    conn = get_connection(db_name)
+    try:
+        migrate(conn)
+        for line_no, record in records:
+            try:
+                batch.append(parse_record(record))
+            except ValueError as e:
+                errors.append((line_no, str(e)))
+                continue
+            if len(batch) >= batch_size:
+                conn.executemany(INSERT_SQL, batch)
+                inserted += len(batch)
+                pending += len(batch)
+                batch = []
+                if pending >= ROWS_PER_TRANSACTION:
+                    conn.commit()
+                    pending = 0
+        if batch:
+            conn.executemany(INSERT_SQL, batch)
+            inserted += len(batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+        if isinstance(source, str):
+            f.close()
+    return inserted, errors
+
+
+def import_uploaded(data, filename, db_name=DB_NAME):
+    # For Streamlit uploads, which arrive as a binary buffer.
+    text = io.TextIOWrapper(data, encoding="utf-8-sig", newline="")
+    return import_medicines(text, fmt=detect_format(filename), db_name=db_name)
+
+
+def print_import_result(inserted, errors, limit=20):
+    print(f"✅ Imported {inserted} medicines.")
+    if errors:
+        print(f"⚠️ Skipped {len(errors)} invalid rows:")
+        for line_no, message in errors[:limit]:
+            print(f"   line {line_no}: {message}")
+        if len(errors) > limit:
+            print(f"   ... and {len(errors) - limit} more")
+    print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import medicines from CSV or JSON lines")
+    parser.add_argument("source")
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} does not exist")
+    print_import_result(*import_medicines(args.source, args.format, args.db, args.batch_size))
@@ -0,0 +1,230 @@
+import argparse
+import glob
+import os
+from functools import lru_cache
+from db import DB_NAME, get_connection, init_db
+from metrics import timed
+from qr_code import (ID_CHUNK, LABEL_DIR, QR_CACHE_DIR, QR_CACHE_MAX_FILES, cache_path, donation_payload,
+                     evict_cache, fetch_label_rows, render_missing)
+
+# Donation labels laid out on A4 sheets at 300 dpi, 3 x 8 labels of
+# 70 x 37 mm (the common 24-up label stock). QR codes come from the
+# qr_cache PNGs, which the scheduler renders ahead of time for new donatable
+# lots; only cache misses are encoded here. Every page is drawn into the
+# same 1-bit image, cleared between pages, and written out as it is
+# finished, so memory stays at one page whatever the print run.
+DPI = 300
+PAGE_SIZE = (2480, 3508)
+GRID = (3, 8)
+LABEL_SIZE = (827, 438)
+PADDING = 24
+NAME_FONT_SIZE = 36
+DETAIL_FONT_SIZE = 30
+LINE_SPACING = 8
+# Cached QR PNGs are rendered at box_size=10.
+CACHE_BOX_SIZE = 10
+FORMATS = ("png", "pdf")
+LABELS_PER_PAGE = GRID[0] * GRID[1]
+
+
+@lru_cache(maxsize=None)
+def _font(size):
+    from PIL import ImageFont
+
+    return ImageFont.load_default(size=size)
+
+
+@lru_cache(maxsize=4096)
+def _text_tile(text, size):
+    # Rasterising a line costs about 1.5 ms, and names, quantities and
+    # dates repeat across a print run, so each distinct line is drawn once.
+    from PIL import Image, ImageDraw
+
+    font = _font(size)
+    left, top, right, bottom = font.getbbox(text)
+    tile = Image.new("1", (max(1, right), max(1, bottom)), 1)
+    ImageDraw.Draw(tile).text((0, 0), text, font=font, fill=0)
+    return tile
+
+
+@lru_cache(maxsize=1024)
+def _qr_tile(path, side):
+    # The cached QR scaled to a whole number of pixels per module, so every
+    # module stays square and sharp. Cache files are content-addressed, so
+    # a path always holds the same image.
+    from PIL import Image
+
+    with Image.open(path) as img:
+        modules = img.width // CACHE_BOX_SIZE
+        scale = max(1, side // modules)
+        return img.convert("1").resize((modules * scale, modules * scale), Image.NEAREST)
+
+
+@lru_cache(maxsize=4096)
+def _fit(text, size, width):
+    font = _font(size)
+    if font.getlength(text) <= width:
+        return text
+    while text and font.getlength(text + "...") > width:
+        text = text[:-1]
+    return text.rstrip() + "..."
+
+
+@lru_cache(maxsize=4096)
+def _name_lines(name, width):
+    # Up to two lines, broken between words, the second cut short if needed.
+    font = _font(NAME_FONT_SIZE)
+    words = name.split()
+    first = []
+    while words and font.getlength(" ".join(first + words[:1])) <= width:
+        first.append(words.pop(0))
+    if not first:
+        return (_fit(name, NAME_FONT_SIZE, width),)
+    if not words:
+        return (" ".join(first),)
+    return " ".join(first), _fit(" ".join(words), NAME_FONT_SIZE, width)
+
+
+def _draw_label(sheet, x, y, row, qr_path):
+    med_id, name, quantity, expiry_date = row
+    width, height = LABEL_SIZE
+    qr = _qr_tile(qr_path, height - 2 * PADDING)
+    sheet.paste(qr, (x + PADDING, y + (height - qr.height) // 2))
+
+    text_x = x + 2 * PADDING + qr.width
+    text_width = width - qr.width - 3 * PADDING
+    lines = [(line, NAME_FONT_SIZE) for line in _name_lines(name, text_width)]
+    lines += [(_fit(line, DETAIL_FONT_SIZE, text_width), DETAIL_FONT_SIZE)
+              for line in (f"Qty: {quantity}", f"Expires: {expiry_date}", f"Lot #{med_id}")]
+    text_y = y + PADDING
+    for line, size in lines:
+        tile = _text_tile(line, size)
+        sheet.paste(tile, (text_x, text_y))
+        text_y += size + LINE_SPACING
+
+
+def _cell_origin(slot):
+    column, row = slot % GRID[0], slot // GRID[0]
+    left = (PAGE_SIZE[0] - GRID[0] * LABEL_SIZE[0]) // 2
+    top = (PAGE_SIZE[1] - GRID[1] * LABEL_SIZE[1]) // 2
+    return left + column * LABEL_SIZE[0], top + row * LABEL_SIZE[1]
+
+
+def donatable_ids(db_name=DB_NAME):
+    # Default print run: every donatable lot, soonest expiry first.
+    conn = get_connection(db_name)
+    try:
+        return [med_id for (med_id,) in conn.execute(
+            "SELECT id FROM medicines WHERE donatable = 1 ORDER BY expiry_date, id"
+        )]
+    finally:
+        conn.close()
+
+
+def _labels(ids, db_name, cache_dir, max_files, workers, executor):
+    # (row, cached QR path) in the order given, a few hundred lots at a
+    # time; ids that no longer exist are skipped.
+    for start in range(0, len(ids), ID_CHUNK):
+        chunk = ids[start:start + ID_CHUNK]
+        rows = fetch_label_rows(chunk, db_name)
+        paths, missing = {}, {}
+        for med_id, name, quantity, expiry_date in rows.values():
+            payload = donation_payload(name, quantity, expiry_date)
+            path = paths[med_id] = cache_path(payload, cache_dir=cache_dir)
+            if not os.path.exists(path):
+                missing[path] = payload
+        render_missing(missing, workers, executor)
+        if missing:
+            evict_cache(cache_dir, max_files, keep=paths.values())
+        for med_id in chunk:
+            if med_id in rows:
+                yield rows[med_id], paths[med_id]
+
+
+def _save_page(sheet, fmt, path, first_page):
+    if fmt == "pdf":
+        sheet.save(path, "PDF", resolution=DPI, append=not first_page)
+    else:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        sheet.save(tmp_path, "PNG", dpi=(DPI, DPI))
+        os.replace(tmp_path, path)
+
+
+@timed("render_sheets", rows=lambda result: result[1])
+def render_sheets(ids=None, name="labels", fmt="png", db_name=DB_NAME, label_dir=LABEL_DIR,
+                  cache_dir=QR_CACHE_DIR, max_files=QR_CACHE_MAX_FILES, workers=None, executor=None):
+    # Lays the lots out LABELS_PER_PAGE to a page, in the order given
+    # (default: donatable_ids()). PNG writes label_dir/<name>_p001.png and
+    # on, replacing the pages of an earlier run of the same name; PDF
+    # writes one multi-page label_dir/<name>.pdf. Returns (files, labels).
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown label format {fmt!r}; use one of {', '.join(FORMATS)}")
+    if not name or os.path.basename(name) != name:
+        raise ValueError("The sheet name must be a plain file name")
+    ids = list(dict.fromkeys(donatable_ids(db_name) if ids is None else ids))
+    os.makedirs(label_dir, exist_ok=True)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    from PIL import Image
+
+    if fmt == "pdf":
+        target = os.path.join(label_dir, f"{name}.pdf")
+        pdf_path = f"{target}.{os.getpid()}.tmp"
+    else:
+        for stale in glob.glob(os.path.join(glob.escape(label_dir), f"{glob.escape(name)}_p*.png")):
+            os.remove(stale)
+    sheet = Image.new("1", PAGE_SIZE, 1)
+    files, count, slot = [], 0, 0
+
+    def flush():
+        page = len(files) + 1 if fmt == "png" else None
+        path = os.path.join(label_dir, f"{name}_p{page:03}.png") if page else pdf_path
+        _save_page(sheet, fmt, path, first_page=not files)
+        files.append(path)
+        sheet.paste(1, (0, 0) + PAGE_SIZE)
+
+    try:
+        for row, qr_path in _labels(ids, db_name, cache_dir, max_files, workers, executor):
+            x, y = _cell_origin(slot)
+            _draw_label(sheet, x, y, row, qr_path)
+            count += 1
+            slot = (slot + 1) % LABELS_PER_PAGE
+            if not slot:
+                flush()
+        if slot:
+            flush()
+    except Exception:
+        if fmt == "pdf" and os.path.exists(pdf_path):
+            os.remove(pdf_path)
+        raise
+    if fmt == "pdf":
+        if not files:
+            return [], 0
+        os.replace(pdf_path, target)
+        files = [target]
+    return files, count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print donation QR labels on A4 sheets")
+    parser.add_argument("ids", type=int, nargs="*", help="lot ids (default: every donatable lot)")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--name", default="labels", help="output file name, without extension")
+    parser.add_argument("--format", choices=FORMATS, default="pdf")
+    parser.add_argument("--output-dir", default=LABEL_DIR)
+    parser.add_argument("--workers", type=int, help="processes for QR codes not yet in the cache")
+    args = parser.parse_args()
+
+    init_db(args.db)
+    try:
+        files, count = render_sheets(args.ids or None, args.name, args.format, args.db, args.output_dir,
+                                     workers=args.workers)
+    except ValueError as e:
+        print(f"❌ {e}")
+    else:
+        if not count:
+            print("ℹ️ No matching lots to label.")
+        for path in files:
+            print(f"✅ {path}")
+        if count:
+            print(f"✅ {count} label(s) on {-(-count // LABELS_PER_PAGE)} page(s)")
@@ -0,0 +1,47 @@
+from db import DB_NAME, build_filters, get_connection
+from metrics import timed
+
+PAGE_SIZE = 50
+LISTING_COLUMNS = ["id", "name", "quantity", "expiry_date", "donatable", "category", "description"]
+
+# Sort orders and the columns that make up their keyset cursor. id breaks
+# ties so every cursor points at exactly one row.
+SORT_KEYS = {
+    "id": ("id",),
+    "expiry_date": ("expiry_date", "id"),
+}
+
+
+@timed("list_medicines", rows=lambda result: len(result[0]))
+def list_medicines(after=None, limit=PAGE_SIZE, sort="id", descending=False, db_name=DB_NAME, **filters):
+    # Returns (rows, next_cursor). Pass next_cursor back as `after` for the
+    # following page; it is None on the last page. Each page is an index seek
+    # past the previous page's last key rather than an OFFSET scan.
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort column: {sort}")
+    keys = SORT_KEYS[sort]
+    where, params = build_filters(**filters)
+
+    if after is not None:
+        comparison = f"({', '.join(keys)}) {'<' if descending else '>'} ({', '.join('?' * len(keys))})"
+        where = f"{where} AND {comparison}" if where else f" WHERE {comparison}"
+        params += list(after)
+
+    direction = "DESC" if descending else "ASC"
+    order = ", ".join(f"{key} {direction}" for key in keys)
+
+    conn = get_connection(db_name)
+    try:
+        rows = conn.execute(
+            f"SELECT {', '.join(LISTING_COLUMNS)} FROM medicines{where} ORDER BY {order} LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+    finally:
+        conn.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = tuple(last[LISTING_COLUMNS.index(key)] for key in keys)
+    return rows, next_cursor
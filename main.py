@@ -1,104 +1,99 @@
-import sqlite3
 from datetime import datetime, timedelta
-import qrcode
-import pandas as pd
-
-
-def init_db():
-    conn = sqlite3.connect("medicine_tracker.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS medicines (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            quantity INTEGER NOT NULL,
-            expiry_date TEXT NOT NULL,
-            donatable INTEGER DEFAULT 0
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-init_db()
-
+from bulk_ops import mark_donatable_many, parse_ids
+from db import get_connection, init_db, to_iso
+from dispense import dispense, print_dispensed
+from expiry_index import get_index, track
+from exporter import export_csv
+from listing import LISTING_COLUMNS, list_medicines
+from metrics import timed
+from qr_code import generate_donatable_qr
+from search import SEARCH_COLUMNS, search_medicines
 
 
 def add_medicine(name, quantity, expiry_date):
-    conn = sqlite3.connect("medicine_tracker.db")
+    conn = get_connection()
     cursor = conn.cursor()
+    expiry_date = to_iso(expiry_date)
     cursor.execute("""
         INSERT INTO medicines (name, quantity, expiry_date)
         VALUES (?, ?, ?)
     """, (name, quantity, expiry_date))
+    track(conn, added=[(cursor.lastrowid, name, quantity, expiry_date, 0)])
     conn.commit()
     conn.close()
     print(f"✅ {name} added successfully!")
 
 
+# pandas is imported where a DataFrame is built: it is most of this
+# module's import time and the add/mark/dispense paths never need it.
+def fetch_medicine_page(after=None, limit=20, **filters):
+    import pandas as pd
+    rows, next_cursor = list_medicines(after, limit, **filters)
+    return pd.DataFrame(rows, columns=LISTING_COLUMNS), next_cursor
+
+
 def fetch_all_medicines():
-    conn = sqlite3.connect("medicine_tracker.db")
+    import pandas as pd
+    conn = get_connection()
     df = pd.read_sql_query("SELECT * FROM medicines", conn)
     conn.close()
     return df
 
 
 
-def check_near_expiry(days=30):
-    conn = sqlite3.connect("medicine_tracker.db")
+@timed("check_near_expiry", rows=len)
+def check_near_expiry(days=30, use_index=False):
+    # use_index answers from the in-memory expiry index instead of SQLite;
+    # worth it for callers that ask over and over (kiosk, alerts).
+    if use_index:
+        return get_index().expiring_within(days)
+
+    conn = get_connection()
     cursor = conn.cursor()
     today = datetime.now().date()
     limit = today + timedelta(days=days)
 
-    cursor.execute("SELECT * FROM medicines")
-    medicines = cursor.fetchall()
+    cursor.execute("""
+        SELECT id, name, quantity, expiry_date, donatable FROM medicines
+        WHERE expiry_date BETWEEN ? AND ?
+        ORDER BY expiry_date
+    """, (today.isoformat(), limit.isoformat()))
+    near_expiry = cursor.fetchall()
     conn.close()
 
-    near_expiry = []
-    for med in medicines:
-        med_id, name, qty, expiry, donatable = med
-        expiry_date = datetime.strptime(expiry, "%Y-%m-%d").date()
-        if today <= expiry_date <= limit:
-            near_expiry.append(med)
-
     return near_expiry
 
 
 
-def mark_as_donatable(medicine_id):
-    conn = sqlite3.connect("medicine_tracker.db")
-    cursor = conn.cursor()
-    cursor.execute("UPDATE medicines SET donatable = 1 WHERE id = ?", (medicine_id,))
-    conn.commit()
-
-    cursor.execute("SELECT * FROM medicines WHERE id = ?", (medicine_id,))
-    med = cursor.fetchone()
-    conn.close()
+def mark_as_donatable(medicine_ids):
+    if isinstance(medicine_ids, int):
+        medicine_ids = [medicine_ids]
+    meds = mark_donatable_many(medicine_ids)
 
-    if med:
-        qr_data = f"Medicine: {med[1]}\nQuantity: {med[2]}\nExpiry: {med[3]}"
-        qr_img = qrcode.make(qr_data)
-        qr_filename = f"QR_{med[1]}_{med[0]}.png"
-        qr_img.save(qr_filename)
-        print(f"✅ QR code saved as {qr_filename}")
+    if not meds:
+        print("ℹ️ Nothing to mark: medicines not found or already donatable.")
+    for med in meds:
+        generate_donatable_qr(med[0], med[1], med[2], med[3])
 
 
 
 def fetch_donatable_medicines():
-    conn = sqlite3.connect("medicine_tracker.db")
+    import pandas as pd
+    conn = get_connection()
     df = pd.read_sql_query("SELECT * FROM medicines WHERE donatable = 1", conn)
     conn.close()
     return df
 
 
 
-def export_to_csv():
-    df = fetch_all_medicines()
-    df.to_csv("medicines_export.csv", index=False)
-    print("📦 Data exported to medicines_export.csv successfully!")
+def export_to_csv(filename="medicines_export.csv", **filters):
+    export_csv(filename, **filters)
+    print(f"📦 Data exported to {filename} successfully!")
 
 
 
 if __name__ == "__main__":
+    init_db()
     while True:
         print("\n====== Medicine Expiry & Donation Tracker ======")
         print("1. Add new medicine")
@@ -107,7 +102,9 @@ if __name__ == "__main__":
         print("4. Mark medicine as donatable (and generate QR)")
         print("5. View donatable medicines")
         print("6. Export to CSV")
-        print("7. Exit")
+        print("7. Search medicine")
+        print("8. Dispense medicine")
+        print("9. Exit")
 
         choice = input("Enter your choice: ")
 
@@ -118,7 +115,13 @@ if __name__ == "__main__":
             add_medicine(name, quantity, expiry_date)
 
         elif choice == "2":
-            print(fetch_all_medicines())
+            page, next_cursor = fetch_medicine_page()
+            print(page if not page.empty else "No medicines found.")
+            while next_cursor is not None:
+                if input("Press Enter for the next page, or q to stop: ").strip().lower() == "q":
+                    break
+                page, next_cursor = fetch_medicine_page(next_cursor)
+                print(page)
 
         elif choice == "3":
             meds = check_near_expiry()
@@ -130,8 +133,12 @@ if __name__ == "__main__":
                 print("No near-expiry medicines found.")
 
         elif choice == "4":
-            med_id = int(input("Enter medicine ID to mark as donatable: "))
-            mark_as_donatable(med_id)
+            try:
+                med_ids = parse_ids(input("Enter medicine ID(s) to mark as donatable (e.g. 3, 7, 12-15): "))
+            except ValueError as e:
+                print(f"❌ {e}")
+            else:
+                mark_as_donatable(med_ids)
 
         elif choice == "5":
             print(fetch_donatable_medicines())
@@ -140,6 +147,24 @@ if __name__ == "__main__":
             export_to_csv()
 
         elif choice == "7":
+            query = input("Enter medicine name to search: ")
+            rows, fuzzy = search_medicines(query)
+            if rows:
+                print("\nDid you mean:" if fuzzy else "\nSearch results:")
+                import pandas as pd
+                print(pd.DataFrame(rows, columns=SEARCH_COLUMNS))
+            else:
+                print("No medicines found matching that name.")
+
+        elif choice == "8":
+            name = input("Enter medicine name: ")
+            quantity = int(input("Enter quantity to dispense: "))
+            try:
+                print_dispensed(name, dispense(name, quantity))
+            except ValueError as e:
+                print(f"❌ {e}")
+
+        elif choice == "9":
             print("Goodbye 👋")
             break
 
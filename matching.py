@@ -0,0 +1,268 @@
+import argparse
+import json
+from collections import deque
+from datetime import date
+from db import DB_NAME, get_connection, get_watermark, init_db, set_watermark, to_iso
+from events import latest_seq
+
+# scheduler_state entries: the last event and the last request a matching
+# run has seen.
+EVENTS_WATERMARK = "matching_events"
+REQUESTS_WATERMARK = "matching_requests"
+REQUEST_COLUMNS = ["id", "recipient", "medicine", "quantity", "allocated", "deadline", "status"]
+
+
+def add_request(recipient, medicine, quantity, deadline, db_name=DB_NAME):
+    # A recipient's need: `quantity` units of the medicine named exactly as
+    # the lots are, by `deadline`. Returns the request id.
+    recipient, medicine = str(recipient or "").strip(), str(medicine or "").strip()
+    if not recipient or not medicine:
+        raise ValueError("Recipient and medicine are required")
+    quantity = int(quantity)
+    if quantity <= 0:
+        raise ValueError("Requested quantity must be positive")
+    deadline = to_iso(str(deadline))
+
+    conn = get_connection(db_name)
+    try:
+        request_id = conn.execute(
+            "INSERT INTO recipient_requests (recipient, medicine, quantity, deadline) VALUES (?, ?, ?, ?)",
+            (recipient, medicine, quantity, deadline)
+        ).lastrowid
+        conn.commit()
+    finally:
+        conn.close()
+    return request_id
+
+
+def _match_name(conn, name, today):
+    # Open requests most urgent deadline first; each takes the soonest
+    # expiring lots that are still in date on its deadline. Deadlines only
+    # grow along the loop, so a lot that expires too early for one request
+    # is too early for the rest and is dropped for good: one pass over each
+    # list, both read in order straight from their indexes.
+    requests = conn.execute("""
+        SELECT id, quantity - allocated, deadline FROM recipient_requests
+        WHERE status = 'open' AND medicine = ? AND deadline >= ?
+        ORDER BY deadline, id
+    """, (name, today)).fetchall()
+    if not requests:
+        return []
+    lots = deque(
+        [lot_id, expiry_date, available] for lot_id, expiry_date, available in conn.execute("""
+            SELECT id, expiry_date,
+                   quantity - COALESCE((SELECT SUM(quantity) FROM allocations WHERE medicine_id = medicines.id), 0)
+            FROM medicines
+            WHERE name = ? AND donatable = 1 AND expiry_date >= ?
+            ORDER BY expiry_date, id
+        """, (name, max(today, requests[0][2])))
+        if available > 0
+    )
+
+    allocations = []
+    for request_id, needed, deadline in requests:
+        while lots and lots[0][1] < deadline:
+            lots.popleft()
+        while needed and lots:
+            lot = lots[0]
+            take = min(needed, lot[2])
+            allocations.append((request_id, lot[0], take))
+            needed -= take
+            lot[2] -= take
+            if not lot[2]:
+                lots.popleft()
+        if not lots:
+            break
+    return allocations
+
+
+def _expire(conn, today):
+    # Open requests whose deadline has passed can no longer be served.
+    return conn.execute(
+        "UPDATE recipient_requests SET status = 'expired' WHERE status = 'open' AND deadline < ?", (today,)
+    ).rowcount
+
+
+def _allocate(conn, names, today):
+    allocations = []
+    for name in names:
+        allocations.extend(_match_name(conn, name, today))
+    conn.executemany(
+        "INSERT INTO allocations (request_id, medicine_id, quantity) VALUES (?, ?, ?)", allocations
+    )
+    granted = {}
+    for request_id, _, take in allocations:
+        granted[request_id] = granted.get(request_id, 0) + take
+    conn.executemany("""
+        UPDATE recipient_requests
+        SET allocated = allocated + ?1, status = CASE WHEN allocated + ?1 >= quantity THEN 'filled' ELSE status END
+        WHERE id = ?2
+    """, list((units, request_id) for request_id, units in granted.items()))
+    return allocations
+
+
+def allocate(names=None, today=None, db_name=DB_NAME):
+    # One matching pass for the given medicine names (default: every name
+    # with an open request) in a single write transaction. Existing
+    # allocations stand; only what is still open and still unpromised is
+    # matched. Returns the new allocations as (request id, lot id, units).
+    today = (today or date.today()).isoformat()
+    conn = get_connection(db_name)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if names is None:
+            names = [name for (name,) in conn.execute(
+                "SELECT DISTINCT medicine FROM recipient_requests WHERE status = 'open'"
+            )]
+        allocations = _allocate(conn, names, today)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return allocations
+
+
+def _changed_names(conn):
+    # Names worth re-matching since the last run: lots that are donatable
+    # after an insert or update in the event log, plus new requests. None
+    # before the first run, or when the events in between were compacted
+    # away.
+    since = get_watermark(conn, EVENTS_WATERMARK)
+    floor = conn.execute("SELECT MIN(seq) FROM medicine_snapshots").fetchone()[0] or 0
+    if not since or since < floor:
+        return None
+    names = {name for (name,) in conn.execute("""
+        SELECT DISTINCT json_extract(data, '$.name') FROM medicine_events
+        WHERE seq > ? AND op != 'delete' AND json_extract(data, '$.donatable') = 1
+    """, (since,))}
+    names.update(name for (name,) in conn.execute(
+        "SELECT DISTINCT medicine FROM recipient_requests WHERE id > ? AND status = 'open'",
+        (get_watermark(conn, REQUESTS_WATERMARK),)
+    ))
+    return names
+
+
+def run_matching(full=False, today=None, db_name=DB_NAME):
+    # Incremental by default: only medicines with newly donatable stock or
+    # new requests are re-matched, which gives the same result as a full
+    # pass because different medicines never compete for the same lots.
+    # Open requests past their deadline are marked expired first; they keep
+    # what was allocated to them. Returns (names matched, new allocations).
+    today = (today or date.today()).isoformat()
+    conn = get_connection(db_name)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        seq = latest_seq(conn)
+        last_request = conn.execute("SELECT COALESCE(MAX(id), 0) FROM recipient_requests").fetchone()[0]
+        _expire(conn, today)
+        names = None if full else _changed_names(conn)
+        if names is None:
+            names = [name for (name,) in conn.execute(
+                "SELECT DISTINCT medicine FROM recipient_requests WHERE status = 'open'"
+            )]
+        allocations = _allocate(conn, sorted(names), today)
+        set_watermark(conn, EVENTS_WATERMARK, seq)
+        set_watermark(conn, REQUESTS_WATERMARK, last_request)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return len(names), allocations
+
+
+def cancel_request(request_id, db_name=DB_NAME):
+    # Releases the request's lots and offers them to the other open
+    # requests for the same medicine. Returns the units released.
+    conn = get_connection(db_name)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT medicine, allocated, status FROM recipient_requests WHERE id = ?", (request_id,)
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"No request with id {request_id}")
+        medicine, allocated, status = row
+        if status == "cancelled":
+            raise ValueError(f"Request {request_id} is already cancelled")
+        conn.execute("DELETE FROM allocations WHERE request_id = ?", (request_id,))
+        conn.execute(
+            "UPDATE recipient_requests SET status = 'cancelled', allocated = 0 WHERE id = ?", (request_id,)
+        )
+        _allocate(conn, [medicine], date.today().isoformat())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return allocated
+
+
+def list_requests(status="open", db_name=DB_NAME):
+    conn = get_connection(db_name)
+    try:
+        sql = f"SELECT {', '.join(REQUEST_COLUMNS)} FROM recipient_requests"
+        if status:
+            return conn.execute(f"{sql} WHERE status = ? ORDER BY deadline, id", (status,)).fetchall()
+        return conn.execute(f"{sql} ORDER BY deadline, id").fetchall()
+    finally:
+        conn.close()
+
+
+def request_allocations(request_id, db_name=DB_NAME):
+    # (lot id, name, units, expiry_date) for one request; the lot columns
+    # are None when the lot has since been deleted.
+    conn = get_connection(db_name)
+    try:
+        return conn.execute("""
+            SELECT allocations.medicine_id, medicines.name, allocations.quantity, medicines.expiry_date
+            FROM allocations LEFT JOIN medicines ON medicines.id = allocations.medicine_id
+            WHERE allocations.request_id = ? ORDER BY allocations.id
+        """, (request_id,)).fetchall()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match donatable stock to recipient requests")
+    parser.add_argument("--db", default=DB_NAME)
+    commands = parser.add_subparsers(dest="command", required=True)
+    request_parser = commands.add_parser("request", help="register a recipient's need")
+    request_parser.add_argument("recipient")
+    request_parser.add_argument("medicine")
+    request_parser.add_argument("quantity", type=int)
+    request_parser.add_argument("deadline", help="YYYY-MM-DD")
+    cancel_parser = commands.add_parser("cancel", help="cancel a request and release its lots")
+    cancel_parser.add_argument("request_id", type=int)
+    list_parser = commands.add_parser("list", help="list requests")
+    list_parser.add_argument("--status", choices=["open", "filled", "cancelled", "expired", "all"], default="open")
+    run_parser = commands.add_parser("run", help="allocate donatable lots to open requests")
+    run_parser.add_argument("--full", action="store_true", help="re-match every medicine, not just changed ones")
+    show_parser = commands.add_parser("show", help="lots allocated to a request")
+    show_parser.add_argument("request_id", type=int)
+    args = parser.parse_args()
+
+    init_db(args.db)
+    try:
+        if args.command == "request":
+            request_id = add_request(args.recipient, args.medicine, args.quantity, args.deadline, args.db)
+            print(f"✅ Request {request_id} registered for {args.recipient}")
+        elif args.command == "cancel":
+            released = cancel_request(args.request_id, args.db)
+            print(f"✅ Request {args.request_id} cancelled, {released} unit(s) released")
+        elif args.command == "list":
+            for row in list_requests(None if args.status == "all" else args.status, args.db):
+                print(json.dumps(dict(zip(REQUEST_COLUMNS, row))))
+        elif args.command == "run":
+            names, allocations = run_matching(args.full, db_name=args.db)
+            units = sum(take for _, _, take in allocations)
+            print(f"✅ {len(allocations)} allocation(s), {units} unit(s) across {names} medicine(s)")
+        else:
+            for lot_id, name, units, expiry_date in request_allocations(args.request_id, args.db):
+                print(f"- {units} x {name or '(lot removed)'} from lot {lot_id} (expires {expiry_date})")
+    except ValueError as e:
+        print(f"❌ {e}")
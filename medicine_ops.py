@@ -1,17 +1,14 @@
-import csv
-from datetime import datetime
-from db import get_connection
-import qrcode
-
-
-def generate_donatable_qr(name, quantity, expiry_date):
-
-    data = f"Medicine Name: {name}\nQuantity: {quantity}\nExpiry Date: {expiry_date}\nDonatable: Yes"
-
-    img = qrcode.make(data)
-    filename = f"{name}_donatable_qr.png"
-    img.save(filename)
-    print(f"✅ QR code generated: {filename}\n")
+from datetime import date, timedelta
+from bulk_ops import mark_donatable_many, parse_ids
+from db import DB_NAME, get_connection, to_iso
+from expiry_index import track
+from exporter import export_csv
+from importer import import_medicines, print_import_result
+from metrics import timed
+from listing import list_medicines
+from report import DEFAULT_HORIZONS, inventory_report, print_report
+from qr_code import generate_donatable_qr
+from search import search_medicines
 
 
 def add_medicine():
@@ -20,176 +17,132 @@ def add_medicine():
 
     name = input("Enter medicine name: ")
     quantity = int(input("Enter quantity: "))
-    expiry_date = input("Enter expiry date (YYYY-MM-DD): ")
+    expiry_date = to_iso(input("Enter expiry date (YYYY-MM-DD): "))
 
     cursor.execute(
         "INSERT INTO medicines (name, quantity, expiry_date) VALUES (?, ?, ?)",
         (name, quantity, expiry_date)
     )
+    track(conn, added=[(cursor.lastrowid, name, quantity, expiry_date, 0)])
 
     conn.commit()
     conn.close()
     print("✅ Medicine added successfully!\n")
 
 
-def view_all_medicines():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT id, name, quantity, expiry_date, donatable FROM medicines")
-    rows = cursor.fetchall()
+def view_all_medicines(page_size=20, **filters):
+    rows, next_cursor = list_medicines(limit=page_size, **filters)
 
     if not rows:
         print("No medicines found.\n")
-    else:
-        print("\nAll Medicines:")
+        return
+
+    print("\nAll Medicines:")
+    while True:
         for row in rows:
             donatable = "Yes" if row[4] else "No"
             print(f"{row[0]}. {row[1]} - Qty: {row[2]} - Expiry: {row[3]} - Donatable: {donatable}")
+        if next_cursor is None:
+            break
+        if input("Press Enter for the next page, or q to stop: ").strip().lower() == "q":
+            break
+        rows, next_cursor = list_medicines(next_cursor, page_size, **filters)
     print()
 
-    conn.close()
 
+@timed("near_expiry_medicines", rows=len)
+def near_expiry_medicines(days=30, db_name=DB_NAME):
+    conn = get_connection(db_name)
+    try:
+        today = date.today()
+        return conn.execute(
+            "SELECT id, name, quantity, expiry_date, donatable FROM medicines "
+            "WHERE expiry_date BETWEEN ? AND ? ORDER BY expiry_date",
+            (today.isoformat(), (today + timedelta(days=days)).isoformat())
+        ).fetchall()
+    finally:
+        conn.close()
 
-def check_near_expiry():
-    conn = get_connection()
-    cursor = conn.cursor()
 
-    today = datetime.today().date()
-    cursor.execute("SELECT name, expiry_date FROM medicines")
-    rows = cursor.fetchall()
-
-    print("\nMedicines expiring soon (within 30 days):")
-    found = False
-    for name, expiry_date in rows:
-        exp_date = datetime.strptime(expiry_date, "%Y-%m-%d").date()
-        if 0 <= (exp_date - today).days <= 30:
-            print(f"⚠️ {name} expires on {expiry_date}")
-            found = True
-    if not found:
+def check_near_expiry(days=30):
+    rows = near_expiry_medicines(days)
+
+    print(f"\nMedicines expiring soon (within {days} days):")
+    for med_id, name, quantity, expiry_date, donatable in rows:
+        print(f"⚠️ {name} expires on {expiry_date}")
+    if not rows:
         print("No medicines are near expiry.\n")
     print()
 
-    conn.close()
-
 
 def mark_donatable():
     view_all_medicines()
-    medicine_id = int(input("Enter the medicine ID to mark as donatable: "))
-
-    conn = get_connection()
-    cursor = conn.cursor()
-
-
-    cursor.execute("UPDATE medicines SET donatable=1 WHERE id=?", (medicine_id,))
-
+    try:
+        medicine_ids = parse_ids(input("Enter the medicine ID(s) to mark as donatable (e.g. 3, 7, 12-15): "))
+    except ValueError as e:
+        print(f"❌ {e}\n")
+        return
 
-    cursor.execute("SELECT name, quantity, expiry_date FROM medicines WHERE id=?", (medicine_id,))
-    med = cursor.fetchone()
+    meds = mark_donatable_many(medicine_ids)
 
-    conn.commit()
-    conn.close()
+    if not meds:
+        print("ℹ️ No matching medicines that were not already donatable.\n")
+        return
+    print(f"✅ {len(meds)} medicine(s) marked as donatable.\n")
 
-    print("✅ Medicine marked as donatable.\n")
+    for med_id, name, quantity, expiry_date, category in meds:
+        generate_donatable_qr(med_id, name, quantity, expiry_date)
 
 
-    if med:
-        name, quantity, expiry_date = med
-        generate_donatable_qr(name, quantity, expiry_date)
+@timed("donatable_medicines", rows=len)
+def donatable_medicines(db_name=DB_NAME):
+    conn = get_connection(db_name)
+    try:
+        return conn.execute(
+            "SELECT id, name, quantity, expiry_date, category FROM medicines WHERE donatable = 1 ORDER BY expiry_date"
+        ).fetchall()
+    finally:
+        conn.close()
 
 
 def view_donatable_medicines():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT name, quantity, expiry_date FROM medicines WHERE donatable=1")
-    rows = cursor.fetchall()
+    rows = donatable_medicines()
 
     print("\nDonatable Medicines:")
     if not rows:
         print("No donatable medicines found.\n")
     else:
         for row in rows:
-            print(f"- {row[0]} (Qty: {row[1]}) - Expiry: {row[2]}")
+            print(f"- {row[1]} (Qty: {row[2]}) - Expiry: {row[3]}")
     print()
 
-    conn.close()
-
 
 def search_medicine():
     query = input("Enter medicine name to search (partial names allowed): ").strip()
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, quantity, expiry_date, donatable FROM medicines WHERE name LIKE ?", (f"%{query}%",))
-    rows = cursor.fetchall()
+    rows, fuzzy = search_medicines(query)
     if not rows:
         print("\nNo medicines found matching that name.\n")
     else:
-        print("\nSearch Results:")
+        print("\nDid you mean:" if fuzzy else "\nSearch Results:")
         for r in rows:
             donatable = "Yes" if r[4] else "No"
             print(f"{r[0]}. {r[1]} - Qty: {r[2]} - Expiry: {r[3]} - Donatable: {donatable}")
         print()
-    conn.close()
-
-
-def generate_report():
-
-    conn = get_connection()
-    cursor = conn.cursor()
 
 
-    cursor.execute("SELECT COUNT(*) FROM medicines")
-    total = cursor.fetchone()[0]
-
-
-    cursor.execute("SELECT COUNT(*) FROM medicines WHERE donatable=1")
-    donatable = cursor.fetchone()[0]
-
-    today = datetime.today().date()
-    cursor.execute("SELECT expiry_date FROM medicines")
-    rows = cursor.fetchall()
-    expired = 0
-    near_expiry = 0
-    for (expiry_date,) in rows:
-        try:
-            exp_date = datetime.strptime(expiry_date, "%Y-%m-%d").date()
-            days_left = (exp_date - today).days
-            if days_left < 0:
-                expired += 1
-            elif days_left <= 30:
-                near_expiry += 1
-        except Exception:
-            pass
-
-    print("\n========= Inventory Report =========")
-    print(f"Total medicines      : {total}")
-    print(f"Donatable medicines  : {donatable}")
-    print(f"Expired medicines    : {expired}")
-    print(f"Near-expiry (<=30d)  : {near_expiry}")
-    print("====================================\n")
+def generate_report(horizons=DEFAULT_HORIZONS, by_category=False):
+    print_report(inventory_report(horizons, by_category))
 
-    conn.close()
-
-
-
-def export_to_csv(filename="medicines_backup.csv"):
 
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, quantity, expiry_date, donatable FROM medicines")
-    rows = cursor.fetchall()
-    conn.close()
 
-    if not rows:
+def export_to_csv(filename="medicines_backup.csv", **filters):
+    count = export_csv(filename, **filters)
+    if not count:
         print("No data to export.\n")
         return
 
-    with open(filename, mode="w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["ID", "Name", "Quantity", "Expiry Date", "Donatable"])
-        for r in rows:
-            donatable = "Yes" if r[4] else "No"
-            writer.writerow([r[0], r[1], r[2], r[3], donatable])
-
     print(f"✅ Data exported to {filename}\n")
+
+
+def import_from_csv(filename="medicines_backup.csv"):
+    print_import_result(*import_medicines(filename))
@@ -0,0 +1,320 @@
+import argparse
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+import db
+
+# In-process metrics in the Prometheus text exposition format. Timers and
+# counters are always on and cost about a microsecond per call; the
+# per-query profiler is opt-in because it times every statement.
+#
+# Long-running processes serve render() (api.py GET /metrics); short ones
+# write it to METRICS_FILE for node_exporter's textfile collector.
+METRICS_FILE = os.environ.get("MEDSHARE_METRICS_FILE")
+# Seconds; the last bucket is +Inf.
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+SLOW_QUERY_LOG = 100
+# The profiler's progress handler fires every this many SQLite VM steps.
+VM_STEP_GRANULARITY = 1000
+
+HELP = {
+    "medshare_call_seconds": "Wall time of instrumented functions",
+    "medshare_rows_returned_total": "Rows returned by instrumented functions",
+    "medshare_errors_total": "Instrumented calls that raised",
+    "medshare_db_connections_opened_total": "SQLite connections opened by the pool",
+    "medshare_db_connections_idle": "Pooled SQLite connections waiting to be reused",
+    "medshare_http_request_seconds": "HTTP API request latency",
+    "medshare_query_seconds": "Profiled SQL statement time, execute to last row",
+    "medshare_query_rows_total": "Rows fetched by profiled SQL statements",
+    "medshare_query_vm_steps_total": "SQLite VM steps of profiled statements, a proxy for rows scanned",
+    "medshare_slow_queries_total": "Profiled statements over the slow-query threshold",
+    "medshare_full_scans_total": "Slow statements whose plan scans a whole table",
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG)
+_slow_seconds = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        histogram[0][bisect_left(BUCKETS, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+
+def timed(name, rows=None):
+    # Decorator: call time (and errors) under medshare_call_seconds with
+    # function=name; rows(result) gives the number of rows returned.
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                inc("medshare_errors_total", function=name)
+                raise
+            finally:
+                observe("medshare_call_seconds", time.perf_counter() - start, function=name)
+            if rows is not None:
+                inc("medshare_rows_returned_total", rows(result), function=name)
+            return result
+        return wrapper
+    return decorate
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _slow_queries.clear()
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _pool_samples():
+    for db_name, opened, idle in db.pool_stats():
+        yield "medshare_db_connections_opened_total", (("db", db_name),), opened
+        yield "medshare_db_connections_idle", (("db", db_name),), idle
+
+
+def render():
+    # The whole registry as Prometheus text (version 0.0.4).
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, (list(buckets), total, count)) for key, (buckets, total, count) in _histograms.items())
+    samples = {}
+    for (name, labels), value in counters:
+        samples.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+    for name, labels, value in _pool_samples():
+        samples.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), (buckets, total, count) in histograms:
+        lines = samples.setdefault(name, [])
+        cumulative = 0
+        for bound, observed in zip(BUCKETS + ("+Inf",), buckets):
+            cumulative += observed
+            lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+
+    out = []
+    for name in sorted(samples):
+        kind = "histogram" if any(key[0] == name for key, _ in histograms) else (
+            "counter" if name.endswith("_total") else "gauge")
+        out.append(f"# HELP {name} {HELP.get(name, name)}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(samples[name])
+    return "\n".join(out) + "\n"
+
+
+def write_textfile(path=None):
+    # Atomic, so a scraper never reads half a file. No-op without a path.
+    path = path or METRICS_FILE
+    if not path:
+        return None
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp_path, path)
+    return path
+
+
+# -------------------------------
+# Opt-in query profiler
+# -------------------------------
+def _statement_kind(sql):
+    match = re.match(r"\s*(\w+)", sql)
+    return match.group(1).lower() if match else "other"
+
+
+def _count_steps(conn):
+    conn.vm_steps += VM_STEP_GRANULARITY
+    return 0
+
+
+def _full_scans(conn, sql, parameters):
+    # Tables a statement reads end to end, from EXPLAIN QUERY PLAN. Index
+    # scans still visit every row, so they count too; table-valued
+    # functions and constant rows do not.
+    try:
+        # Straight on the connection, so the plan is not profiled itself.
+        plan = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except sqlite3.Error:
+        return [], []
+    details = [row[-1] for row in plan]
+    scans = [detail.split()[1] for detail in details
+             if detail.startswith("SCAN ") and "VIRTUAL TABLE" not in detail and "CONSTANT ROW" not in detail]
+    return details, scans
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    # Times a statement from execute() until its rows run out, the cursor
+    # is closed, or fetchone()/fetchall() returns. Installed on pooled
+    # connections by enable_profiler().
+
+    def execute(self, sql, parameters=()):
+        conn = self.connection
+        if getattr(conn, "vm_steps", None) is None:
+            conn.vm_steps = 0
+            conn.set_progress_handler(lambda: _count_steps(conn), VM_STEP_GRANULARITY)
+        self._statement = (sql, parameters, conn.vm_steps)
+        self._rows = 0
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._elapsed = time.perf_counter() - start
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._statement = None
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            observe("medshare_query_seconds", time.perf_counter() - start, statement=_statement_kind(sql))
+
+    def _timed(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        self._rows += row is not None
+        self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, size or self.arraysize)
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _finish(self):
+        statement = getattr(self, "_statement", None)
+        if statement is None:
+            return
+        self._statement = None
+        sql, parameters, steps_before = statement
+        kind = _statement_kind(sql)
+        conn = self.connection
+        steps = conn.vm_steps - steps_before
+        observe("medshare_query_seconds", self._elapsed, statement=kind)
+        inc("medshare_query_rows_total", self._rows, statement=kind)
+        inc("medshare_query_vm_steps_total", steps, statement=kind)
+        if _slow_seconds is None or self._elapsed < _slow_seconds or kind in ("pragma", "begin", "commit"):
+            return
+        inc("medshare_slow_queries_total", statement=kind)
+        plan, scans = _full_scans(conn, sql, parameters)
+        for table in scans:
+            inc("medshare_full_scans_total", table=table)
+        with _lock:
+            _slow_queries.append({
+                "sql": " ".join(sql.split()), "ms": round(self._elapsed * 1000, 3), "rows": self._rows,
+                "vm_steps": steps, "plan": plan, "full_scans": scans,
+            })
+
+
+def enable_profiler(slow_ms=100):
+    # Profiles every statement on pooled connections from now on and keeps
+    # the plan of each one slower than slow_ms (0 keeps them all).
+    global _slow_seconds
+    _slow_seconds = slow_ms / 1000
+    db.set_cursor_factory(ProfiledCursor)
+
+
+def disable_profiler():
+    global _slow_seconds
+    _slow_seconds = None
+    db.set_cursor_factory(None)
+
+
+def slow_queries():
+    # Newest last: dicts with sql, ms, rows, vm_steps, plan and full_scans.
+    with _lock:
+        return list(_slow_queries)
+
+
+if os.environ.get("MEDSHARE_SLOW_QUERY_MS"):
+    enable_profiler(float(os.environ["MEDSHARE_SLOW_QUERY_MS"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile MedShare's hot read paths against a database")
+    parser.add_argument("--db", default=db.DB_NAME)
+    parser.add_argument("--slow-ms", type=float, default=10)
+    parser.add_argument("--output", help="also write the metrics here")
+    args = parser.parse_args()
+
+    # The imported modules record into `metrics`, not this __main__ copy.
+    import metrics
+    from medicine_ops import donatable_medicines, near_expiry_medicines
+    from report import inventory_report
+    from search import search_medicines
+
+    db.init_db(args.db)
+    metrics.enable_profiler(args.slow_ms)
+    near_expiry_medicines(30, args.db)
+    donatable_medicines(args.db)
+    inventory_report(by_category=True, db_name=args.db)
+    search_medicines("para", db_name=args.db)
+    print(metrics.render())
+    for query in metrics.slow_queries():
+        flag = f"❌ full scan of {', '.join(query['full_scans'])}" if query["full_scans"] else "✅ indexed"
+        print(f"{query['ms']:>9.1f} ms {query['rows']:>7} rows  {flag}\n    {query['sql'][:160]}")
+        for detail in query["plan"]:
+            print(f"      {detail}")
+    if args.output:
+        print(f"✅ Metrics written to {metrics.write_textfile(args.output)}")
@@ -1,19 +1,157 @@
-import qrcode
+import argparse
+import hashlib
+import os
+import shutil
+from db import DB_NAME, get_connection
+from metrics import timed
 
+QR_CACHE_DIR = "qr_cache"
+QR_CACHE_MAX_FILES = 5000
+# Printable output: per-lot QR copies and label sheets.
+LABEL_DIR = "labels"
 
-def generate_donatable_qr(name, quantity, expiry_date):
+# SQLite limits the number of bound parameters per statement.
+ID_CHUNK = 500
 
-    data = f"Name: {name}\nQuantity: {quantity}\nExpiry: {expiry_date}\nDonatable: Yes"
+
+def donation_payload(name, quantity, expiry_date):
+    return f"Name: {name}\nQuantity: {quantity}\nExpiry: {expiry_date}\nDonatable: Yes"
+
+
+def cache_path(payload, box_size=10, border=4, cache_dir=QR_CACHE_DIR):
+    # Content-addressed: identical payloads and settings share one image.
+    key = hashlib.sha256(f"{box_size}:{border}:{payload}".encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{key}.png")
+
+
+def render_qr(payload, path, box_size=10, border=4):
+    # qrcode pulls in PIL; importing it here keeps it off the startup path
+    # of commands that never draw a label.
+    import qrcode
 
     qr = qrcode.QRCode(
         version=1,
-        box_size=10,
-        border=4
+        box_size=box_size,
+        border=border
     )
-    qr.add_data(data)
+    qr.add_data(payload)
     qr.make(fit=True)
 
-    img = qr.make_image(fill='black', back_color='white')
-    filename = f"{name}_donatable_qr.png"
-    img.save(filename)
+    img = qr.make_image(fill_color="black", back_color="white")
+    # Write then rename so concurrent readers never see a half-written file.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    img.save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+    return path
+
+
+def evict_cache(cache_dir=QR_CACHE_DIR, max_files=QR_CACHE_MAX_FILES, keep=()):
+    # Least recently used first; cache hits refresh a file's mtime.
+    entries = [entry for entry in os.scandir(cache_dir) if entry.name.endswith(".png")]
+    excess = len(entries) - max_files
+    if excess <= 0:
+        return 0
+    keep = set(keep)
+    removed = 0
+    for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+        if removed >= excess:
+            break
+        if entry.path in keep:
+            continue
+        try:
+            os.remove(entry.path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+@timed("cached_qr")
+def cached_qr(payload, box_size=10, border=4, cache_dir=QR_CACHE_DIR, max_files=QR_CACHE_MAX_FILES):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(payload, box_size, border, cache_dir)
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        render_qr(payload, path, box_size, border)
+        evict_cache(cache_dir, max_files, keep=[path])
+    return path
+
+
+def fetch_label_rows(ids, db_name=DB_NAME):
+    # {medicine_id: (id, name, quantity, expiry_date)} for the given ids.
+    conn = get_connection(db_name)
+    try:
+        rows = {}
+        for start in range(0, len(ids), ID_CHUNK):
+            chunk = ids[start:start + ID_CHUNK]
+            rows.update((row[0], row) for row in conn.execute(
+                f"SELECT id, name, quantity, expiry_date FROM medicines WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ))
+        return rows
+    finally:
+        conn.close()
+
+
+def render_missing(missing, workers=None, executor=None):
+    # Renders {path: payload} into the cache, spread over a process pool
+    # (a long-lived one can be passed in as executor).
+    chunksize = max(1, len(missing) // ((workers or os.cpu_count() or 1) * 4))
+    if executor is not None and missing:
+        list(executor.map(render_qr, missing.values(), missing.keys(), chunksize=chunksize))
+    elif len(missing) == 1 or workers == 1:
+        for path, payload in missing.items():
+            render_qr(payload, path)
+    elif missing:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render_qr, missing.values(), missing.keys(), chunksize=chunksize))
+
+
+# Rendering itself may run in worker processes, whose timings would be
+# lost, so the batch is timed here in the caller.
+@timed("generate_qr_codes", rows=len)
+def generate_qr_codes(ids, db_name=DB_NAME, cache_dir=QR_CACHE_DIR, max_files=QR_CACHE_MAX_FILES, workers=None,
+                      executor=None):
+    # Returns {medicine_id: png path}. Only payloads missing from the cache are
+    # rendered.
+    ids = list(dict.fromkeys(ids))
+    os.makedirs(cache_dir, exist_ok=True)
+
+    paths, missing = {}, {}
+    for med_id, name, quantity, expiry_date in fetch_label_rows(ids, db_name).values():
+        payload = donation_payload(name, quantity, expiry_date)
+        path = cache_path(payload, cache_dir=cache_dir)
+        paths[med_id] = path
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            missing[path] = payload
+
+    render_missing(missing, workers, executor)
+    if missing:
+        evict_cache(cache_dir, max_files, keep=paths.values())
+    return paths
+
+
+def generate_donatable_qr(med_id, name, quantity, expiry_date, label_dir=LABEL_DIR):
+    # One copy per lot, keyed by id, so lots of the same medicine no longer
+    # overwrite each other's file.
+    path = cached_qr(donation_payload(name, quantity, expiry_date))
+    os.makedirs(label_dir, exist_ok=True)
+    filename = os.path.join(label_dir, f"qr_{med_id}.png")
+    shutil.copyfile(path, filename)
     print(f"✅ QR code generated: {filename}\n")
+    return filename
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render donation QR codes for many medicines")
+    parser.add_argument("ids", type=int, nargs="+")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    for med_id, path in generate_qr_codes(args.ids, args.db, workers=args.workers).items():
+        print(f"✅ {med_id}: {path}")
@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict
+from db import DB_NAME, get_connection
+from metrics import timed
+
+MAX_ENTRIES = 64
+
+# (db_name, sql, params) -> (tables, versions, DataFrame). Results are shared
+# between callers, so treat returned frames as read-only.
+_entries = OrderedDict()
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0}
+
+
+def table_versions(conn, tables):
+    versions = []
+    for table in tables:
+        row = conn.execute("SELECT version FROM table_versions WHERE name = ?", (table,)).fetchone()
+        versions.append(row[0] if row else 0)
+    return tuple(versions)
+
+
+@timed("cached_query", rows=len)
+def cached_query(sql, params=(), tables=("medicines",), db_name=DB_NAME):
+    # One primary-key lookup per table decides whether the cached frame is
+    # still current; only a miss runs the query and builds a DataFrame.
+    key = (db_name, sql, tuple(params))
+    conn = get_connection(db_name)
+    try:
+        versions = table_versions(conn, tables)
+        with _lock:
+            entry = _entries.get(key)
+            if entry is not None and entry[1] == versions:
+                _entries.move_to_end(key)
+                stats["hits"] += 1
+                return entry[2]
+        import pandas as pd
+        df = pd.read_sql_query(sql, conn, params=tuple(params))
+    finally:
+        conn.close()
+
+    with _lock:
+        stats["misses"] += 1
+        _entries[key] = (tuple(tables), versions, df)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+    return df
+
+
+def invalidate(table=None):
+    # Writes bump table_versions through triggers, which is enough for
+    # correctness; this just frees memory held by entries for the table.
+    with _lock:
+        for key in [key for key, entry in _entries.items() if table is None or table in entry[0]]:
+            del _entries[key]
@@ -0,0 +1,174 @@
+import argparse
+from datetime import date, timedelta
+from db import DB_NAME, get_connection
+from metrics import timed
+
+DEFAULT_HORIZONS = (7, 30, 90)
+
+# Lot counts per (category, expiry_date, donatable), kept current by triggers
+# on medicines. Its size depends on the number of distinct expiry dates, not
+# on the number of lots, so dashboards can read it on every refresh.
+SUMMARY_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS inventory_summary (
+        category TEXT NOT NULL,
+        expiry_date TEXT NOT NULL,
+        donatable INTEGER NOT NULL,
+        lots INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (category, expiry_date, donatable)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_summary_insert AFTER INSERT ON medicines
+    BEGIN
+        INSERT INTO inventory_summary (category, expiry_date, donatable, lots)
+        VALUES (COALESCE(NEW.category, ''), NEW.expiry_date, COALESCE(NEW.donatable, 0), 1)
+        ON CONFLICT (category, expiry_date, donatable) DO UPDATE SET lots = lots + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_summary_delete AFTER DELETE ON medicines
+    BEGIN
+        UPDATE inventory_summary SET lots = lots - 1
+        WHERE category = COALESCE(OLD.category, '') AND expiry_date = OLD.expiry_date
+          AND donatable = COALESCE(OLD.donatable, 0);
+        DELETE FROM inventory_summary
+        WHERE category = COALESCE(OLD.category, '') AND expiry_date = OLD.expiry_date
+          AND donatable = COALESCE(OLD.donatable, 0) AND lots <= 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS inventory_summary_update
+    AFTER UPDATE OF category, expiry_date, donatable ON medicines
+    BEGIN
+        UPDATE inventory_summary SET lots = lots - 1
+        WHERE category = COALESCE(OLD.category, '') AND expiry_date = OLD.expiry_date
+          AND donatable = COALESCE(OLD.donatable, 0);
+        DELETE FROM inventory_summary
+        WHERE category = COALESCE(OLD.category, '') AND expiry_date = OLD.expiry_date
+          AND donatable = COALESCE(OLD.donatable, 0) AND lots <= 0;
+        INSERT INTO inventory_summary (category, expiry_date, donatable, lots)
+        VALUES (COALESCE(NEW.category, ''), NEW.expiry_date, COALESCE(NEW.donatable, 0), 1)
+        ON CONFLICT (category, expiry_date, donatable) DO UPDATE SET lots = lots + 1;
+    END
+    """,
+]
+
+SUMMARY_TRIGGERS = ("inventory_summary_insert", "inventory_summary_delete", "inventory_summary_update")
+
+
+def _report_query(source, weight, horizons, by_category):
+    # One pass over the source table with a CASE bucket per count.
+    columns = [
+        f"SUM({weight})",
+        f"SUM(CASE WHEN donatable = 1 THEN {weight} ELSE 0 END)",
+        f"SUM(CASE WHEN expiry_date < :today THEN {weight} ELSE 0 END)",
+    ]
+    for days in horizons:
+        columns.append(f"SUM(CASE WHEN expiry_date BETWEEN :today AND :h{days} THEN {weight} ELSE 0 END)")
+
+    sql = f"SELECT {', '.join(columns)} FROM {source}"
+    if by_category:
+        sql = (f"SELECT NULLIF(COALESCE(category, ''), '') AS grp, {', '.join(columns)} "
+               f"FROM {source} GROUP BY grp ORDER BY grp")
+    return sql
+
+
+def summary_enabled(conn):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'inventory_summary'"
+    ).fetchone()
+    return row is not None
+
+
+def enable_summary(db_name=DB_NAME):
+    conn = get_connection(db_name)
+    try:
+        for statement in SUMMARY_DDL:
+            conn.execute(statement)
+        conn.execute("DELETE FROM inventory_summary")
+        conn.execute("""
+            INSERT INTO inventory_summary (category, expiry_date, donatable, lots)
+            SELECT COALESCE(category, ''), expiry_date, COALESCE(donatable, 0), COUNT(*)
+            FROM medicines GROUP BY 1, 2, 3
+        """)
+        conn.commit()
+    finally:
+        conn.close()
+    print("✅ Inventory summary table enabled.")
+
+
+def disable_summary(db_name=DB_NAME):
+    conn = get_connection(db_name)
+    try:
+        for trigger in SUMMARY_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        conn.execute("DROP TABLE IF EXISTS inventory_summary")
+        conn.commit()
+    finally:
+        conn.close()
+    print("✅ Inventory summary table removed.")
+
+
+@timed("inventory_report")
+def inventory_report(horizons=DEFAULT_HORIZONS, by_category=False, use_summary=None, db_name=DB_NAME):
+    horizons = sorted(set(horizons))
+    today = date.today()
+    params = {"today": today.isoformat()}
+    for days in horizons:
+        params[f"h{days}"] = (today + timedelta(days=days)).isoformat()
+
+    conn = get_connection(db_name)
+    if use_summary is None:
+        use_summary = summary_enabled(conn)
+    if use_summary:
+        sql = _report_query("inventory_summary", "lots", horizons, by_category)
+    else:
+        sql = _report_query("medicines", "1", horizons, by_category)
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+
+    report = []
+    for row in rows:
+        if by_category:
+            category, counts = row[0], row[1:]
+        else:
+            category, counts = None, row
+        counts = [value or 0 for value in counts]
+        report.append({
+            "category": category,
+            "total": counts[0],
+            "donatable": counts[1],
+            "expired": counts[2],
+            "near_expiry": dict(zip(horizons, counts[3:])),
+        })
+    return report
+
+
+def print_report(report):
+    print("\n========= Inventory Report =========")
+    for entry in report:
+        if len(report) > 1 or entry["category"] is not None:
+            print(f"--- {entry['category'] or 'Uncategorised'} ---")
+        print(f"Total medicines      : {entry['total']}")
+        print(f"Donatable medicines  : {entry['donatable']}")
+        print(f"Expired medicines    : {entry['expired']}")
+        for days, count in entry["near_expiry"].items():
+            print(f"{f'Near-expiry (<={days}d)':<21}: {count}")
+    print("====================================\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MedShare inventory report")
+    parser.add_argument("--horizons", type=int, nargs="+", default=list(DEFAULT_HORIZONS))
+    parser.add_argument("--by-category", action="store_true")
+    parser.add_argument("--enable-summary", action="store_true")
+    parser.add_argument("--disable-summary", action="store_true")
+    parser.add_argument("--db", default=DB_NAME)
+    args = parser.parse_args()
+
+    if args.enable_summary:
+        enable_summary(args.db)
+    if args.disable_summary:
+        disable_summary(args.db)
+    print_report(inventory_report(args.horizons, args.by_category, db_name=args.db))
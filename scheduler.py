@@ -0,0 +1,89 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from db import DB_NAME, get_connection, get_watermark, init_db, set_watermark
+from events import snapshot_if_due
+from matching import run_matching
+from metrics import write_textfile
+from qr_code import generate_qr_codes
+
+DONATION_WINDOW_DAYS = 30
+TICK_SECONDS = 3600
+QUEUE_BATCH = 1000
+WATERMARK = "donation_queue"
+
+
+def flag_near_expiry(conn, window_days=DONATION_WINDOW_DAYS, today=None):
+    # One set-based UPDATE over the (donatable, expiry_date) index. Triggers
+    # put every newly flagged lot on donation_queue.
+    today = today or date.today()
+    cursor = conn.execute(
+        "UPDATE medicines SET donatable = 1 WHERE donatable = 0 AND expiry_date BETWEEN ? AND ?",
+        (today.isoformat(), (today + timedelta(days=window_days)).isoformat())
+    )
+    return cursor.rowcount
+
+
+def tick(window_days=DONATION_WINDOW_DAYS, db_name=DB_NAME, executor=None, batch=QUEUE_BATCH):
+    # Flags lots entering the donation window, then renders QR codes for
+    # everything queued since the last tick (including lots marked by hand)
+    # and moves the watermark past them. Returns (flagged, processed).
+    conn = get_connection(db_name)
+    try:
+        flagged = flag_near_expiry(conn, window_days)
+        conn.commit()
+
+        processed = 0
+        while True:
+            watermark = get_watermark(conn, WATERMARK)
+            rows = conn.execute(
+                "SELECT id, medicine_id FROM donation_queue WHERE id > ? ORDER BY id LIMIT ?", (watermark, batch)
+            ).fetchall()
+            if not rows:
+                break
+            generate_qr_codes([medicine_id for _, medicine_id in rows], db_name, executor=executor)
+            set_watermark(conn, WATERMARK, rows[-1][0])
+            conn.execute("DELETE FROM donation_queue WHERE id <= ?", (rows[-1][0],))
+            conn.commit()
+            processed += len(rows)
+    finally:
+        conn.close()
+    return flagged, processed
+
+
+def run(window_days=DONATION_WINDOW_DAYS, interval=TICK_SECONDS, db_name=DB_NAME, workers=None, once=False,
+        metrics_file=None):
+    init_db(db_name)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            flagged, processed = tick(window_days, db_name, executor)
+            stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[{stamp}] ✅ {flagged} lots flagged as donatable, {processed} QR labels prepared.")
+            # Newly flagged lots go to waiting recipients straight away.
+            names, allocations = run_matching(db_name=db_name)
+            if allocations:
+                print(f"[{stamp}] ✅ {len(allocations)} allocation(s) made for {names} medicine(s).")
+            snapshot = snapshot_if_due(db_name)
+            if snapshot:
+                print(f"[{stamp}] ✅ Inventory snapshot {snapshot[0]} taken at event {snapshot[1]}.")
+            write_textfile(metrics_file)
+            if once:
+                break
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flag near-expiry stock as donatable on a schedule")
+    parser.add_argument("--window", type=int, default=DONATION_WINDOW_DAYS, help="days before expiry to flag")
+    parser.add_argument("--interval", type=int, default=TICK_SECONDS, help="seconds between runs")
+    parser.add_argument("--workers", type=int, help="QR rendering processes")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--once", action="store_true", help="run a single tick and exit")
+    parser.add_argument("--metrics-file", help="write Prometheus metrics here after each tick")
+    args = parser.parse_args()
+
+    try:
+        run(args.window, args.interval, args.db, args.workers, args.once, args.metrics_file)
+    except KeyboardInterrupt:
+        print("Scheduler stopped 👋")
@@ -0,0 +1,107 @@
+from db import DB_NAME, get_connection
+from metrics import timed
+
+SEARCH_LIMIT = 50
+NAME_LIMIT = 20
+FUZZY_CANDIDATES = 200
+SEARCH_COLUMNS = ["id", "name", "quantity", "expiry_date", "donatable"]
+
+
+def _phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _like_prefix(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def edit_distance(a, b, limit=None):
+    # Levenshtein distance, two rows at a time. With a limit, gives up and
+    # returns limit + 1 as soon as the distance is certain to exceed it.
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def match_names(conn, query, limit=NAME_LIMIT):
+    # Distinct names containing the query, prefix matches first, then by
+    # FTS5 rank. The trigram tokenizer needs three characters, so shorter
+    # queries fall back to a prefix scan of the (small) name vocabulary.
+    if len(query) < 3:
+        rows = conn.execute(
+            "SELECT name FROM medicine_names WHERE name LIKE ? ESCAPE '\\' ORDER BY lots DESC LIMIT ?",
+            (_like_prefix(query), limit)
+        ).fetchall()
+    else:
+        rows = conn.execute("""
+            SELECT name FROM medicine_names_fts
+            WHERE medicine_names_fts MATCH ?
+            ORDER BY name LIKE ? ESCAPE '\\' DESC, rank
+            LIMIT ?
+        """, (_phrase(query), _like_prefix(query), limit)).fetchall()
+    return [name for (name,) in rows]
+
+
+def fuzzy_names(conn, query, limit=NAME_LIMIT, max_distance=None):
+    # Candidates share at least one trigram with the query; the best-ranked
+    # ones are then filtered by edit distance to the name or one of its words.
+    query = query.lower()
+    if len(query) < 3:
+        return []
+    if max_distance is None:
+        max_distance = max(1, len(query) // 4)
+    trigrams = {query[i:i + 3] for i in range(len(query) - 2)}
+    rows = conn.execute(
+        "SELECT name FROM medicine_names_fts WHERE medicine_names_fts MATCH ? ORDER BY rank LIMIT ?",
+        (" OR ".join(_phrase(gram) for gram in trigrams), FUZZY_CANDIDATES)
+    ).fetchall()
+
+    scored = []
+    for (name,) in rows:
+        lowered = name.lower()
+        distance = min(edit_distance(query, part, max_distance) for part in [lowered] + lowered.split())
+        if distance <= max_distance:
+            scored.append((distance, name))
+    scored.sort()
+    return [name for _, name in scored[:limit]]
+
+
+@timed("search_medicines", rows=lambda result: len(result[0]))
+def search_medicines(query, limit=SEARCH_LIMIT, fuzzy=True, db_name=DB_NAME):
+    # Returns (rows, matched_fuzzily). Rows are grouped by matched name in
+    # rank order, soonest expiry first within a name.
+    query = query.strip()
+    if not query:
+        return [], False
+
+    conn = get_connection(db_name)
+    try:
+        names = match_names(conn, query)
+        fuzzy_match = False
+        if not names and fuzzy:
+            names = fuzzy_names(conn, query)
+            fuzzy_match = bool(names)
+        if not names:
+            return [], False
+
+        placeholders = ", ".join("?" * len(names))
+        rank = " ".join(f"WHEN ? THEN {i}" for i in range(len(names)))
+        rows = conn.execute(f"""
+            SELECT {', '.join(SEARCH_COLUMNS)} FROM medicines
+            WHERE name IN ({placeholders})
+            ORDER BY CASE name {rank} END, expiry_date
+            LIMIT ?
+        """, names + names + [limit]).fetchall()
+    finally:
+        conn.close()
+    return rows, fuzzy_match
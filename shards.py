@@ -0,0 +1,252 @@
+import argparse
+import heapq
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from db import build_filters, get_connection, get_pool, init_db
+from report import DEFAULT_HORIZONS, inventory_report, print_report
+from search import SEARCH_LIMIT, search_medicines
+
+# Head-office view over one MedShare database per branch. The registry maps
+# branch names to database files; queries run on every branch in parallel
+# and only the merged top rows or summed counts come back.
+SHARDS_FILE = "shards.json"
+TOP_K = 50
+WORKERS = 8
+LOT_COLUMNS = ["branch", "id", "name", "quantity", "expiry_date", "donatable", "category"]
+
+
+def _open_shard_limit():
+    # Branches whose idle connections stay open between queries. Reopening
+    # costs about a millisecond per branch, so keep as many as the file
+    # descriptor limit allows (a WAL database holds three, plus headroom).
+    try:
+        import resource
+    except ImportError:
+        return 256
+    soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    if soft == resource.RLIM_INFINITY:
+        return 4096
+    return max(16, soft // 4)
+
+
+MAX_OPEN_SHARDS = _open_shard_limit()
+
+
+def load_registry(path=SHARDS_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_registry(shards, path=SHARDS_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(shards, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def register(branch, db_path, registry=SHARDS_FILE):
+    # Brings the branch file up to the current schema (older MedShare
+    # stores are migrated like any other start-up) and records it.
+    if not os.path.isfile(db_path):
+        raise ValueError(f"No database file at {db_path}")
+    db_path = os.path.abspath(db_path)
+    init_db(db_path)
+    shards = load_registry(registry)
+    shards[branch] = db_path
+    save_registry(shards, registry)
+    return db_path
+
+
+def unregister(branch, registry=SHARDS_FILE):
+    shards = load_registry(registry)
+    if shards.pop(branch, None) is None:
+        raise ValueError(f"No branch named {branch}")
+    save_registry(shards, registry)
+
+
+class ShardSet:
+    # SQLite releases the GIL while a statement runs, so a thread pool
+    # overlaps the per-branch queries. A branch whose file is missing or
+    # broken does not fail the whole query: it is left out and reported in
+    # `failed` (branch -> error) for the most recent call.
+
+    def __init__(self, shards, workers=WORKERS):
+        self.shards = dict(shards)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="medshare-shard")
+        self.failed = {}
+        self._open = OrderedDict()
+        self._open_lock = threading.Lock()
+
+    @classmethod
+    def from_registry(cls, path=SHARDS_FILE, workers=WORKERS):
+        return cls(load_registry(path), workers)
+
+    def close(self):
+        self.executor.shutdown()
+        with self._open_lock:
+            for db_path in self._open:
+                get_pool(db_path).close_all()
+            self._open.clear()
+
+    def _call(self, db_path, fn):
+        # Never let sqlite3 create an empty file for a branch that vanished.
+        if not os.path.isfile(db_path):
+            raise OSError(f"{db_path} not found")
+        try:
+            return fn(db_path)
+        finally:
+            with self._open_lock:
+                self._open[db_path] = True
+                self._open.move_to_end(db_path)
+                while len(self._open) > MAX_OPEN_SHARDS:
+                    get_pool(self._open.popitem(last=False)[0]).close_all()
+
+    def fan_out(self, fn):
+        # Runs fn(db_path) on every branch; returns {branch: result}.
+        futures = {branch: self.executor.submit(self._call, db_path, fn) for branch, db_path in self.shards.items()}
+        results, failed = {}, {}
+        for branch, future in futures.items():
+            try:
+                results[branch] = future.result()
+            except (sqlite3.Error, OSError, ValueError) as e:
+                failed[branch] = str(e)
+        self.failed = failed
+        return results
+
+    def lots(self, limit=TOP_K, **filters):
+        # The `limit` soonest-expiring lots across all branches matching the
+        # listing filters, as LOT_COLUMNS rows. Each branch returns at most
+        # `limit` rows already in expiry order, and heapq.merge streams
+        # through them, so the work is branches x limit, not the inventory.
+        where, params = build_filters(**filters)
+
+        def top(db_path):
+            conn = get_connection(db_path)
+            try:
+                return conn.execute(
+                    f"SELECT id, name, quantity, expiry_date, donatable, category FROM medicines{where} "
+                    "ORDER BY expiry_date, id LIMIT ?", params + [limit]
+                ).fetchall()
+            finally:
+                conn.close()
+
+        results = self.fan_out(top)
+        streams = [[(branch,) + row for row in rows] for branch, rows in results.items()]
+        merged = heapq.merge(*streams, key=lambda row: (row[4], row[0], row[1]))
+        return [row for _, row in zip(range(limit), merged)]
+
+    def near_expiry(self, days=30, limit=TOP_K, **filters):
+        today = date.today()
+        return self.lots(limit, expiring_after=today.isoformat(),
+                         expiring_before=(today + timedelta(days=days + 1)).isoformat(), **filters)
+
+    def donatable(self, limit=TOP_K, **filters):
+        return self.lots(limit, donatable=True, **filters)
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        # Returns (rows, matched_fuzzily) like search.search_medicines. Typo
+        # matches are dropped as soon as any branch matched exactly. Ranks
+        # are only comparable within a branch, so rows are ordered by name,
+        # then soonest expiry.
+        results = self.fan_out(lambda db_path: search_medicines(query, limit, db_name=db_path))
+        exact = any(rows and not fuzzy for rows, fuzzy in results.values())
+        candidates = (
+            (branch,) + tuple(row)
+            for branch, (rows, fuzzy) in results.items() if not (exact and fuzzy)
+            for row in rows
+        )
+        rows = heapq.nsmallest(limit, candidates, key=lambda row: (row[2].lower(), row[4], row[0]))
+        return rows, bool(rows) and not exact
+
+    def report(self, horizons=DEFAULT_HORIZONS, by_category=False):
+        # inventory_report() summed over all branches, same shape.
+        horizons = sorted(set(horizons))
+        results = self.fan_out(lambda db_path: inventory_report(horizons, by_category, db_name=db_path))
+        totals = {}
+        for report in results.values():
+            for entry in report:
+                total = totals.setdefault(entry["category"], {
+                    "category": entry["category"], "total": 0, "donatable": 0, "expired": 0,
+                    "near_expiry": dict.fromkeys(horizons, 0),
+                })
+                for key in ("total", "donatable", "expired"):
+                    total[key] += entry[key]
+                for days, count in entry["near_expiry"].items():
+                    total["near_expiry"][days] += count
+        return sorted(totals.values(), key=lambda entry: (entry["category"] is not None, entry["category"] or ""))
+
+
+def print_lots(rows, as_json):
+    for row in rows:
+        if as_json:
+            print(json.dumps(dict(zip(LOT_COLUMNS, row))))
+        else:
+            branch, med_id, name, quantity, expiry_date = row[:5]
+            print(f"[{branch}] {med_id}. {name} - Qty: {quantity} - Expiry: {expiry_date}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query every branch database at once")
+    parser.add_argument("--registry", default=SHARDS_FILE)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    commands = parser.add_subparsers(dest="command", required=True)
+    register_parser = commands.add_parser("register", help="add or move a branch")
+    register_parser.add_argument("branch")
+    register_parser.add_argument("db_path")
+    unregister_parser = commands.add_parser("unregister", help="forget a branch")
+    unregister_parser.add_argument("branch")
+    commands.add_parser("branches", help="list registered branches")
+    near_parser = commands.add_parser("near-expiry", help="soonest-expiring lots across branches")
+    near_parser.add_argument("--days", type=int, default=30)
+    donatable_parser = commands.add_parser("donatable", help="donatable lots across branches")
+    donatable_parser.add_argument("--expiring-before", help="YYYY-MM-DD")
+    for lot_parser in (near_parser, donatable_parser):
+        lot_parser.add_argument("--name")
+        lot_parser.add_argument("--category")
+        lot_parser.add_argument("--limit", type=int, default=TOP_K)
+        lot_parser.add_argument("--json", action="store_true")
+    search_parser = commands.add_parser("search", help="search medicine names in every branch")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=SEARCH_LIMIT)
+    report_parser = commands.add_parser("report", help="inventory report summed over branches")
+    report_parser.add_argument("--horizons", type=int, nargs="+", default=list(DEFAULT_HORIZONS))
+    report_parser.add_argument("--by-category", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "register":
+            print(f"✅ {args.branch} -> {register(args.branch, args.db_path, args.registry)}")
+        elif args.command == "unregister":
+            unregister(args.branch, args.registry)
+            print(f"✅ {args.branch} removed")
+        elif args.command == "branches":
+            for branch, db_path in sorted(load_registry(args.registry).items()):
+                print(f"{branch}: {db_path}")
+        else:
+            shards = ShardSet.from_registry(args.registry, args.workers)
+            try:
+                if args.command == "near-expiry":
+                    print_lots(shards.near_expiry(args.days, args.limit, name=args.name, category=args.category),
+                               args.json)
+                elif args.command == "donatable":
+                    print_lots(shards.donatable(args.limit, name=args.name, category=args.category,
+                                                expiring_before=args.expiring_before), args.json)
+                elif args.command == "search":
+                    rows, fuzzy = shards.search(args.query, args.limit)
+                    print("Did you mean:" if fuzzy else "Search results:")
+                    print_lots(rows, False)
+                else:
+                    print_report(shards.report(args.horizons, args.by_category))
+                for branch, error in sorted(shards.failed.items()):
+                    print(f"❌ {branch} skipped: {error}")
+            finally:
+                shards.close()
+    except ValueError as e:
+        print(f"❌ {e}")
@@ -1,20 +1,26 @@
-import sqlite3
+import os
+from db import DB_NAME, LEGACY_DATABASES, SCHEMA_VERSION, get_connection, merge_legacy_database, migrate, schema_version
 
-conn = sqlite3.connect("medicine_data.db")
-cursor = conn.cursor()
-
-# Add new columns if they don’t exist
-try:
-    cursor.execute("ALTER TABLE medicines ADD COLUMN category TEXT;")
-    print("✅ 'category' column added successfully!")
-except:
-    print("ℹ️ 'category' column already exists.")
+# Brings the MedShare database up to the current schema version and merges
+# the stores written by older versions of the app into it.
+conn = get_connection()
+before = schema_version(conn)
+migrate(conn)
+conn.close()
 
-try:
-    cursor.execute("ALTER TABLE medicines ADD COLUMN description TEXT;")
-    print("✅ 'description' column added successfully!")
-except:
-    print("ℹ️ 'description' column already exists.")
+if before < SCHEMA_VERSION:
+    print(f"✅ {DB_NAME} migrated from schema version {before} to {SCHEMA_VERSION}.")
+else:
+    print(f"ℹ️ {DB_NAME} is already at schema version {SCHEMA_VERSION}.")
 
-conn.commit()
-conn.close()
+for path in LEGACY_DATABASES:
+    if not os.path.exists(path) or os.path.abspath(path) == os.path.abspath(DB_NAME):
+        continue
+    result = merge_legacy_database(path)
+    if result is None:
+        print(f"ℹ️ {path} was already merged.")
+        continue
+    copied, rejected = result
+    print(f"✅ {path}: {copied} medicines merged into {DB_NAME}.")
+    if rejected:
+        print(f"⚠️ {path}: {rejected} rows could not be converted; see the medicines_rejected table.")
@@ -1,19 +1,21 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
+from datetime import date, timedelta
+from db import DB_NAME, init_db
+from exporter import ChunkReader, iter_csv_chunks
+from listing import LISTING_COLUMNS, list_medicines
+from query_cache import cached_query
 
 st.set_page_config(page_title="Medicine Database Viewer", layout="wide")
 
 
-DB_PATH = "medicines.db"
+DB_PATH = DB_NAME
+init_db()
 
-def fetch_data(query):
+def fetch_data(query, params=()):
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        return df
+        return cached_query(query, params, db_name=DB_PATH)
     except Exception as e:
         st.error(f"Error loading data: {e}")
         return pd.DataFrame()
@@ -23,15 +25,43 @@ st.title("💊 Medicine Database Dashboard")
 st.write("View all medicine records stored in your database")
 
 st.subheader("📦 All Medicines")
-all_data = fetch_data("SELECT * FROM medicines")
+col1, col2, col3 = st.columns(3)
+sort = col1.selectbox("Sort by", ["id", "expiry_date"])
+descending = col2.checkbox("Descending")
+page_size = col3.selectbox("Rows per page", [25, 50, 100, 250], index=1)
 
-if not all_data.empty:
-    st.dataframe(all_data, use_container_width=True)
+# Keyset cursors of the pages visited so far; reset when the query changes.
+query_key = (sort, descending, page_size)
+if st.session_state.get("all_medicines_query") != query_key:
+    st.session_state.all_medicines_query = query_key
+    st.session_state.all_medicines_cursors = [None]
+cursors = st.session_state.all_medicines_cursors
+
+try:
+    rows, next_cursor = list_medicines(cursors[-1], page_size, sort, descending, db_name=DB_PATH)
+except Exception as e:
+    st.error(f"Error loading data: {e}")
+    rows, next_cursor = [], None
+
+if rows:
+    st.dataframe(pd.DataFrame(rows, columns=LISTING_COLUMNS), use_container_width=True)
+    st.caption(f"Page {len(cursors)}")
 else:
     st.info("No medicines found in the database.")
 
+prev_col, next_col = st.columns(2)
+if prev_col.button("⬅️ Previous page", disabled=len(cursors) == 1):
+    cursors.pop()
+    st.rerun()
+if next_col.button("Next page ➡️", disabled=next_cursor is None):
+    cursors.append(next_cursor)
+    st.rerun()
+
 st.subheader("⏳ Medicines Near Expiry")
-near_expiry = fetch_data("SELECT * FROM medicines WHERE julianday(expiry_date) - julianday('now') <= 30")
+# The cut-off is a parameter so the cached result is keyed by day.
+near_expiry = fetch_data(
+    "SELECT * FROM medicines WHERE expiry_date <= ?", ((date.today() + timedelta(days=30)).isoformat(),)
+)
 
 if not near_expiry.empty:
     st.dataframe(near_expiry, use_container_width=True)
@@ -39,7 +69,7 @@ else:
     st.info("No medicines expiring within 30 days.")
 
 st.subheader("🤝 Donatable Medicines")
-donatable = fetch_data("SELECT * FROM medicines WHERE donatable = 'Yes'")
+donatable = fetch_data("SELECT * FROM medicines WHERE donatable = 1")
 
 if not donatable.empty:
     st.dataframe(donatable, use_container_width=True)
@@ -48,11 +78,11 @@ else:
 
 
 st.subheader("📥 Download Data")
-if not all_data.empty:
-    csv = all_data.to_csv(index=False).encode('utf-8')
+has_rows = fetch_data("SELECT EXISTS (SELECT 1 FROM medicines) AS has_rows")
+if not has_rows.empty and has_rows["has_rows"].iloc[0]:
     st.download_button(
         label="Download All Medicines as CSV",
-        data=csv,
+        data=ChunkReader(iter_csv_chunks(DB_PATH)),
         file_name="all_medicines.csv",
         mime="text/csv"
     )